@@ -114,3 +114,30 @@ class AABB:
         glCallList(G_OBJ_CUBE)
         glPopMatrix()
         glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+
+
+def ray_hits(origins, directions, matrices, low, high):
+    """``AABB.ray_hit`` for R rays against N boxes at once.
+
+    ``origins`` and ``directions`` are (R, 3) arrays, ``matrices`` the (N, 4, 4)
+    matrices from ray space to box space and ``low``, ``high`` the (N, 3)
+    corners of the boxes. Returns the (R, N) hits and the distances along the
+    rays to them, which are those of ``ray_hit`` ray by ray and box by box.
+    """
+    count = len(matrices)
+    axes = matrices[:, :3, :3].reshape(3 * count, 3)
+    # e and f of ray_hit for every ray, box and axis
+    positions = numpy.einsum("nij,nj->ni", matrices[:, :3, :3], matrices[:, :3, 3])
+    e = positions - numpy.dot(origins, axes.T).reshape(-1, count, 3)
+    f = numpy.dot(directions, axes.T).reshape(-1, count, 3)
+    parallel = numpy.abs(f) <= EPSILON
+    # a ray parallel to a pair of planes has to start between them
+    hit = ~numpy.any(parallel & ((low - e > EPSILON) | (high - e < -EPSILON)), axis=2)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        t1 = (e + low) / f
+        t2 = (e + high) / f
+    tmin = numpy.where(parallel, 0.0, numpy.minimum(t1, t2)).max(axis=2)
+    tmax = numpy.where(parallel, 100000.0, numpy.maximum(t1, t2)).min(axis=2)
+    tmin = numpy.maximum(tmin, 0.0)
+    hit &= tmin <= tmax
+    return hit, tmin
@@ -0,0 +1,1426 @@
+"""Micro benchmarks for the modeller.
+
+Usage: python benchmark.py <name> [args...]
+Run without arguments to list the available benchmarks.
+
+Some benchmarks have a check next to them that compares the fast path with
+a simple one on a small input, so a regression fails instead of only
+changing a number. ``python benchmark.py check [name ...]`` runs them.
+
+Benchmarks that render open a hidden GLUT window. To measure them headless
+under Mesa llvmpipe run e.g.
+
+    LIBGL_ALWAYS_SOFTWARE=1 xvfb-run -a python benchmark.py compile
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Return the best wall time of ``repeat`` calls and the last result."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def gl_context(width=640, height=480):
+    """Create a hidden GLUT window with a perspective camera looking down -z."""
+    from OpenGL.GL import GL_DEPTH_TEST, GL_MODELVIEW, GL_PROJECTION, glEnable
+    from OpenGL.GL import glLoadIdentity, glMatrixMode, glViewport
+    from OpenGL.GLU import gluPerspective
+    from OpenGL.GLUT import GLUT_DEPTH, GLUT_DOUBLE, GLUT_RGBA, glutCreateWindow
+    from OpenGL.GLUT import glutHideWindow, glutInit, glutInitDisplayMode
+    from OpenGL.GLUT import glutInitWindowSize
+
+    glutInit()
+    glutInitDisplayMode(GLUT_RGBA | GLUT_DOUBLE | GLUT_DEPTH)
+    glutInitWindowSize(width, height)
+    glutCreateWindow("benchmark")
+    glutHideWindow()
+    glViewport(0, 0, width, height)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(70, width / height, 0.1, 1000.0)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glEnable(GL_DEPTH_TEST)
+
+
+def frame_time(render, frames=50):
+    """Average seconds per frame of ``render``, waiting for the GPU each frame."""
+    from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, glClear, glFinish
+
+    render()
+    glFinish()
+    start = time.perf_counter()
+    for _ in range(frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        render()
+        glFinish()
+    return (time.perf_counter() - start) / frames
+
+
+def write_grid_obj(filename, n):
+    """Write an n by n quad grid with normals and texture coordinates."""
+    with open(filename, "w") as f:
+        f.write("# %d x %d grid\n" % (n, n))
+        for j in range(n + 1):
+            for i in range(n + 1):
+                f.write("v %f %f %f\n" % (i / n, 0.0, j / n))
+                f.write("vt %f %f\n" % (i / n, j / n))
+        f.write("vn 0 1 0\n")
+        for j in range(n):
+            for i in range(n):
+                a = j * (n + 1) + i + 1
+                b, c, d = a + 1, a + n + 2, a + n + 1
+                f.write(
+                    "f %d/%d/1 %d/%d/1 %d/%d/1 %d/%d/1\n" % (a, a, b, b, c, c, d, d)
+                )
+
+
+def sample_obj(args):
+    """Return an OBJ path from the arguments, generating a grid if none given."""
+    if args and os.path.exists(args[0]):
+        return args[0]
+    n = int(args[0]) if args else 500
+    filename = os.path.join(tempfile.gettempdir(), "modeller_grid_%d.obj" % n)
+    if not os.path.exists(filename):
+        write_grid_obj(filename, n)
+    return filename
+
+
+def bench_objload(args):
+    """objload [file.obj | grid size]: OBJ parsing time across worker counts."""
+    from objloader import WavefrontObj
+
+    filename = sample_obj(args)
+    size_mb = os.path.getsize(filename) / 1e6
+    print("%s: %.1f MB" % (filename, size_mb))
+
+    serial, model = timed(WavefrontObj, filename)
+    print("serial     %8.3f s  %6.1f MB/s" % (serial, size_mb / serial))
+
+    workers = 2
+    while workers <= (os.cpu_count() or 1) * 2:
+        elapsed, parallel = timed(WavefrontObj, filename, workers=workers)
+        assert parallel.faces == model.faces
+        print(
+            "workers=%-3d %7.3f s  %6.1f MB/s  speedup %.2fx"
+            % (workers, elapsed, size_mb / elapsed, serial / elapsed)
+        )
+        workers *= 2
+
+
+def write_mixed_obj(filename, records=3000, seed=0):
+    """Write an OBJ file of randomly interleaved records: faces of three to
+    five corners with absolute and relative indices, missing texcoords and
+    normals, material switches and comments."""
+    import random
+
+    rng = random.Random(seed)
+    counts = {"v": 0, "vt": 0, "vn": 0}
+
+    def index(kind):
+        k = rng.randint(1, counts[kind])
+        return k if rng.random() < 0.5 else k - counts[kind] - 1
+
+    with open(filename, "w") as f:
+        for _ in range(records):
+            r = rng.random()
+            if r < 0.3 or counts["v"] < 3:
+                f.write("v %f %f %f\n" % (rng.random(), rng.random(), rng.random()))
+                counts["v"] += 1
+            elif r < 0.4:
+                f.write("vt %f %f\n" % (rng.random(), rng.random()))
+                counts["vt"] += 1
+            elif r < 0.5:
+                f.write("vn 0 0 1\n")
+                counts["vn"] += 1
+            elif r < 0.53:
+                f.write("usemtl m%d\n" % rng.randint(0, 4))
+            elif r < 0.55:
+                f.write("# comment\n")
+            else:
+                corners = []
+                for _ in range(rng.randint(3, 5)):
+                    corner = str(index("v"))
+                    if counts["vt"] and rng.random() < 0.7:
+                        corner += "/%d" % index("vt")
+                    elif counts["vn"]:
+                        corner += "/"
+                    if counts["vn"] and rng.random() < 0.7:
+                        corner += "/%d" % index("vn")
+                    corners.append(corner)
+                f.write("f %s\n" % " ".join(corners))
+
+
+def check_objload(args):
+    """objload: chunked and parallel parsing give the model a serial parse does."""
+    from objloader import WavefrontObj, iter_chunks, parse_parallel
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "mixed.obj")
+        write_mixed_obj(filename)
+        serial = WavefrontObj(filename)
+        expected = (serial.vertices, serial.texcoords, serial.normals, serial.faces)
+        # the relative indices are resolved
+        assert all(min(face[0]) >= 1 for face in serial.faces)
+        assert len({face[3] for face in serial.faces}) > 2
+
+        def merged(chunks):
+            model = WavefrontObj()
+            material = None
+            for chunk in chunks:
+                material = model.merge_chunk(chunk, material)
+            model.group_by_material()
+            return (model.vertices, model.texcoords, model.normals, model.faces)
+
+        for workers, chunks_per_worker in [(1, 1), (2, 3), (3, 7)]:
+            chunks = parse_parallel(filename, False, workers, chunks_per_worker)
+            assert merged(chunks) == expected
+        for lines_per_chunk in (1, 37, 1000):
+            chunks = iter_chunks(filename, lines_per_chunk=lines_per_chunk)
+            assert merged(chunks) == expected
+
+
+def bench_compile(args):
+    """compile [file.obj | grid size]: display list vs buffer compile and frame time."""
+    from OpenGL.GL import glTranslatef
+
+    from objloader import WavefrontObj
+
+    filename = sample_obj(args)
+    gl_context()
+    glTranslatef(-0.5, -0.5, -1.5)
+    for use_buffers in (False, True):
+        model = WavefrontObj(filename)
+        compile_time, _ = timed(model.compile, use_buffers=use_buffers)
+        name = "buffers" if model.vbo is not None else "display list"
+        print(
+            "%-12s compile %8.3f s  frame %8.2f ms"
+            % (name, compile_time, frame_time(model.render) * 1000)
+        )
+        model.free()
+
+
+def bench_lod(args):
+    """lod [file.obj | grid size]: LOD triangle counts and frame time by distance."""
+    import numpy
+    from OpenGL.GL import glLoadMatrixf
+
+    from camera import Camera, column_major
+    from objloader import WavefrontObj
+    from transformation import translation
+
+    filename = sample_obj(args or ["200"])
+    gl_context()
+    model = WavefrontObj(filename)
+    elapsed, _ = timed(model.generate_lods)
+    print("levels %s built in %.2f s" % ([len(i) // 3 for i, _ in model.lods], elapsed))
+    model.compile()
+
+    low, high = model.box()
+    center = [(low[i] + high[i]) / 2 for i in range(3)]
+    radius = sum((high[i] - low[i]) ** 2 for i in range(3)) ** 0.5 / 2
+    # the camera of gl_context, which has no distance in its projection
+    camera = Camera(distance=0.0)
+    for distance in (1, 2, 5, 10, 20, 50, 100):
+        matrix = translation([-center[0], -center[1], -center[2] - distance * radius])
+        glLoadMatrixf(column_major(matrix))
+        pixels = camera.projected_sizes(
+            numpy.array([[0.0, 0.0, -distance * radius]]), numpy.array([radius])
+        )[0]
+        lod = model.projected_lod(camera, matrix)
+        full = frame_time(model.render) * 1000
+        reduced = frame_time(lambda: model.render(lod)) * 1000
+        print(
+            "distance %5.0f r  %7.1f px  lod %d  %8d tris  %7.2f ms (full %7.2f ms)"
+            % (distance, pixels, lod, len(model.lods[lod][0]) // 3, reduced, full)
+        )
+    model.free()
+
+
+def grid_triangles(n):
+    """The (2 n^2, 3) triangles of an n by n quad grid."""
+    import numpy
+
+    j, i = numpy.mgrid[0:n, 0:n]
+    a = (j * (n + 1) + i).reshape(-1)
+    return numpy.concatenate(
+        [
+            numpy.stack([a, a + 1, a + n + 2], axis=1),
+            numpy.stack([a, a + n + 2, a + n + 1], axis=1),
+        ]
+    )
+
+
+def bench_halfedge(args):
+    """halfedge [millions of triangles]: half-edge construction time."""
+    from halfedge import HalfEdgeMesh
+
+    n = int((float(args[0]) if args else 5.0) * 1e6 / 2) ** 0.5
+    triangles = grid_triangles(int(n))
+    elapsed, mesh = timed(HalfEdgeMesh, triangles)
+    print(
+        "%d triangles: %.2f s, %d edges, %d boundary vertices"
+        % (len(triangles), elapsed, len(mesh.edges()), mesh.boundary_vertices().sum())
+    )
+
+
+def bench_normals(args):
+    """normals [millions of triangles]: vertex normal throughput in triangles/s."""
+    import numpy
+
+    from normals import vertex_normals
+
+    n = int(((float(args[0]) if args else 1.0) * 1e6 / 2) ** 0.5)
+    triangles = grid_triangles(n)
+    x, z = numpy.meshgrid(numpy.linspace(0, 1, n + 1), numpy.linspace(0, 1, n + 1))
+    positions = numpy.stack(
+        [x.reshape(-1), 0.1 * numpy.sin(20 * x * z).reshape(-1), z.reshape(-1)], 1
+    )
+    for weighting in ("area", "angle"):
+        for crease_angle in (None, 30):
+            elapsed, (normals, _) = timed(
+                vertex_normals, positions, triangles, weighting, crease_angle
+            )
+            print(
+                "%-5s crease %-4s %8.2f M triangles/s  %d normals"
+                % (
+                    weighting,
+                    crease_angle,
+                    len(triangles) / elapsed / 1e6,
+                    len(normals),
+                )
+            )
+
+
+def board_context():
+    """A GL context set up like the viewer for rendering boards."""
+    from OpenGL.GL import GL_LIGHT0, GL_LIGHTING, glEnable, glRotatef, glTranslatef
+
+    from primitive import compile_primitives
+
+    gl_context()
+    compile_primitives()
+    glEnable(GL_LIGHTING)
+    glEnable(GL_LIGHT0)
+    glTranslatef(0, 0, -15)
+    glRotatef(35, 1, 0, 0)
+
+
+def board_scene(width, height):
+    """A GL context set up like the viewer, and a width by height board."""
+    from node import Board
+
+    board_context()
+    return Board((width, height))
+
+
+def bench_board(args):
+    """board [size ...]: board frame time, static and with a moving center."""
+    import numpy
+
+    for size in [int(arg) for arg in args] or [50, 1000]:
+        elapsed, board = timed(board_scene, size, size)
+        static = frame_time(board.render) * 1000
+        step = numpy.array([0.0, 0.0, 0.05])
+        moving = frame_time(
+            lambda: (board.translate_and_adjust_center(step), board.render())
+        )
+        print(
+            "%5d x %-5d built %6.2f s  static %7.2f ms  moving %7.2f ms"
+            % (size, size, elapsed, static, moving * 1000)
+        )
+
+
+def bench_chunked(args):
+    """chunked [size] [chunk_size]: a memory-mapped size x size map moving across chunks."""
+    import numpy
+
+    from board_map import BoardMap
+    from chunked_board import ChunkedBoard
+
+    size = int(args[0]) if args else 20000
+    chunk_size = int(args[1]) if len(args) > 1 else 32
+    board_context()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "map.bin")
+        rng = numpy.random.default_rng(0)
+        with open(filename, "wb") as f:
+            for start in range(0, size, 1024):
+                rows = rng.random((min(1024, size - start), size)) < 0.1
+                f.write(numpy.packbits(rows, axis=1).tobytes())
+        elapsed, board = timed(
+            ChunkedBoard, BoardMap.from_raw(filename, size, size), chunk_size=chunk_size
+        )
+        print("%d x %d map, opened in %.3f ms" % (size, size, elapsed * 1000))
+        static = frame_time(board.render) * 1000
+
+        for prefetch in (False, True):
+            board.chunks.clear()
+            step = numpy.array([0.0, 0.0, -0.2])
+            worst = 0.0
+
+            def frame():
+                nonlocal worst
+                start = time.perf_counter()
+                if prefetch:
+                    board.translate_and_adjust_center(step)
+                else:
+                    board.translate(*step)
+                    board.center -= step
+                board.render()
+                worst = max(worst, time.perf_counter() - start)
+
+            moving = frame_time(frame, frames=500)
+            print(
+                "prefetch %-5s static %6.2f ms  moving %6.2f ms  worst %6.2f ms  "
+                "%d chunks cached"
+                % (prefetch, static, moving * 1000, worst * 1000, len(board.chunks))
+            )
+
+
+def grid_walk(steps, seed=0):
+    """Unit steps along the x and z axes, so a center starting on a cell
+    corner passes over the spheres on the corners."""
+    import numpy
+
+    axes = numpy.array([[1.0, 0, 0], [-1.0, 0, 0], [0, 0, 1.0], [0, 0, -1.0]])
+    return axes[numpy.random.default_rng(seed).integers(0, 4, steps)]
+
+
+def check_chunked(args):
+    """chunked: a ChunkedBoard marks the same spheres as a Board."""
+    import numpy
+
+    from board_map import BoardMap
+    from board_state import MARKED
+    from chunked_board import ChunkedBoard
+    from node import Board
+
+    # an odd size puts the origin, and so the cell corners, on whole numbers
+    size = 59
+    rows = numpy.random.default_rng(0).random((size, size)) < 0.3
+    board = Board((size + 1, size + 1), map=rows)
+    chunked = ChunkedBoard(BoardMap.from_array(rows), chunk_size=8, max_chunks=4)
+    assert len(chunked.state) == len(board.state)
+    for step in grid_walk(400):
+        board.translate_and_adjust_center(step)
+        chunked.translate_and_adjust_center(step)
+        assert chunked.state.marked_count == board.state.marked_count
+    assert board.state.marked_count > 0
+
+    def marked(state):
+        return sorted(map(tuple, state.cells[state.states == MARKED].tolist()))
+
+    chunk_marked = sum((marked(state) for state in chunked.state.chunks.values()), [])
+    assert sorted(chunk_marked) == marked(board.state)
+    assert len(chunked.chunks) + len(chunked.pending) <= chunked.max_chunks
+
+
+def parse_map_string(text):
+    """The sphere mask of a string map, as Board.from_map used to make it."""
+    import numpy
+
+    map = [[int(c) for c in line] for line in text.split("\n")]
+    width, height = len(map[0]), len(map)
+    for line in map:
+        assert len(line) == width
+    spheres = numpy.zeros((width + 1, height + 1), bool)
+    for i in range(2, width + 1):
+        for j in range(2, height + 1):
+            spheres[i, j] = map[j - 1][i - 1] != 0
+    return spheres
+
+
+def bench_mapload(args):
+    """mapload [size ...]: sphere mask from a string map and from a binary map file."""
+    import numpy
+
+    from board_map import BoardMap, sphere_mask
+
+    for size in [int(arg) for arg in args] or [1001, 4001]:
+        rows = numpy.random.default_rng(0).random((size, size)) < 0.1
+        text = "\n".join("".join(row) for row in numpy.where(rows, "1", "0"))
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "map.bmap")
+            BoardMap.from_array(rows).save(filename)
+            string, expected = timed(parse_map_string, text)
+            vectorized, mask = timed(
+                lambda: sphere_mask(BoardMap.from_text(text).unpack()), repeat=3
+            )
+            assert numpy.array_equal(mask, expected)
+            binary, mask = timed(
+                lambda: sphere_mask(BoardMap.load(filename).unpack()), repeat=3
+            )
+            assert numpy.array_equal(mask, expected)
+            print(
+                "%5d x %-5d string %8.1f ms  from_text %7.1f ms  binary %7.1f ms  "
+                "(%.1f MB text, %.1f MB binary)"
+                % (
+                    size,
+                    size,
+                    string * 1000,
+                    vectorized * 1000,
+                    binary * 1000,
+                    len(text) / 1e6,
+                    os.path.getsize(filename) / 1e6,
+                )
+            )
+
+
+def check_mapload(args):
+    """mapload: BoardMap reads back what it stores, by text, file, count and region."""
+    import numpy
+
+    from board_map import BoardMap, sphere_mask
+
+    # widths that fill the last byte of a packed row and ones that do not
+    for height, width in [(23, 37), (9, 8), (1, 13)]:
+        rows = numpy.random.default_rng(width).random((height, width)) < 0.4
+        text = "\n".join("".join(row) for row in numpy.where(rows, "1", "0"))
+        board_map = BoardMap.from_text(text)
+        assert numpy.array_equal(board_map.unpack(), rows)
+        assert numpy.array_equal(
+            sphere_mask(board_map.unpack()), parse_map_string(text)
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "map.bmap")
+            board_map.save(filename)
+            loaded = BoardMap.load(filename)
+            assert (loaded.width, loaded.height) == (width, height)
+            assert numpy.array_equal(loaded.unpack(), rows)
+        for x0, y0 in [(0, 0), (1, 1), (3, 2), (width - 1, height - 1)]:
+            assert board_map.count(x0, y0) == rows[y0:, x0:].sum()
+        # windows reaching past every side of the map read as empty there
+        padded = numpy.zeros((height + 10, width + 10), bool)
+        padded[5:-5, 5:-5] = rows
+        for x0, x1, y0, y1 in [(-5, 6, -5, 4), (3, width + 5, 1, height), (2, 2, 0, 3)]:
+            assert numpy.array_equal(
+                board_map.region(x0, x1, y0, y1),
+                padded[y0 + 5 : y1 + 5, x0 + 5 : x1 + 5],
+            )
+
+
+def allocated_per_frame(render, frames=50):
+    """The most memory allocated during a frame of ``render``, measured with
+    tracemalloc as the peak above what was allocated before the frame."""
+    import tracemalloc
+
+    render()
+    tracemalloc.start()
+    worst = 0
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        render()
+        worst = max(worst, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return worst
+
+
+def bench_markers(args):
+    """markers [size]: marker drawing, a Sphere node per marker against MarkerRenderer."""
+    import numpy
+
+    import color
+    from node import Board, Sphere
+
+    size = int(args[0]) if args else 61
+    board_context()
+    rows = numpy.random.default_rng(0).random((size, size)) < 0.5
+    board = Board((size + 1, size + 1), map=rows)
+    board.render()
+    cells = board.mesh.visible_cells[
+        board.mesh.sphere_index[board.mesh.visible_cells] >= 0
+    ]
+    corners = board.mesh.vertices[4 * cells + 3]
+
+    def nodes():
+        # what Board.render_sphere used to do for every marker every frame
+        for corner in corners:
+            sphere = Sphere(custom_scale=0.5)
+            sphere.color_index = color.MIN_COLOR
+            sphere_pos = numpy.array(corner, numpy.float64)
+            sphere_pos[1] += 0.15
+            sphere.translate(*sphere_pos)
+            sphere.render()
+
+    def renderer():
+        board.markers.render()
+
+    def moving():
+        board.markers.dirty = True
+        board.markers.render()
+
+    print("%d markers" % len(cells))
+    for name, render in [
+        ("Sphere nodes", nodes),
+        ("MarkerRenderer", renderer),
+        ("MarkerRenderer, changed", moving),
+    ]:
+        print(
+            "%-24s %7.3f ms  %8d bytes allocated per frame"
+            % (name, frame_time(render) * 1000, allocated_per_frame(render))
+        )
+
+
+def bench_boardstate(args):
+    """boardstate [size ...]: cost of finding the spheres reached by the center per move."""
+    import numpy
+
+    from board_map import sphere_mask
+    from board_state import BoardState
+
+    for size in [int(arg) for arg in args] or [101, 1001, 4001]:
+        spheres = sphere_mask(numpy.random.default_rng(0).random((size, size)) < 0.3)
+        origin = (-(size + 1) / 2, -(size + 1) / 2)
+        elapsed, state = timed(BoardState, numpy.argwhere(spheres), origin, 1.0)
+        centers = numpy.zeros((1000, 3))
+        centers[:, 2] = numpy.linspace(0, size / 4, 1000)
+
+        def scan():
+            # the distance to every sphere, as a linear scan would do
+            for center in centers[:20]:
+                offsets = state.positions - (center[0], center[2])
+                numpy.flatnonzero(numpy.einsum("ij,ij->i", offsets, offsets) <= 0.01)
+
+        def moves():
+            for center in centers:
+                state.move(center)
+
+        print(
+            "%5d x %-5d %8d spheres  built %6.3f s  per move: scan %8.3f ms, "
+            "index %6.3f ms  "
+            "%d marked"
+            % (
+                size,
+                size,
+                len(state),
+                elapsed,
+                timed(scan)[0] / 20 * 1000,
+                timed(moves)[0] / len(centers) * 1000,
+                state.marked_count,
+            )
+        )
+
+
+def check_boardstate(args):
+    """boardstate: BoardState marks what a linear scan of the spheres finds."""
+    import numpy
+
+    from board_map import sphere_mask
+    from board_state import MARKED, BoardState
+
+    size = 41
+    spheres = sphere_mask(numpy.random.default_rng(0).random((size, size)) < 0.3)
+    cells = numpy.argwhere(spheres)
+    origin = (-(size + 1) / 2, -(size + 1) / 2)
+    rng = numpy.random.default_rng(1)
+    for bucket_size in (1, 4, 7):
+        state = BoardState(cells, origin, 1.0, bucket_size)
+        marked = numpy.zeros(len(state), bool)
+        reported = []
+        state.register_callback(
+            "marked", lambda state, reached: reported.append(reached)
+        )
+        # corners, points just within and just beyond reach of them, and off the board
+        centers = numpy.zeros((600, 3))
+        centers[:, [0, 2]] = rng.integers(-size // 2 - 3, size // 2 + 3, (600, 2))
+        centers[:, [0, 2]] += rng.choice([0.0, 0.07, -0.09, 0.11, 0.5], (600, 2))
+        for center in centers:
+            offsets = state.positions - (center[0], center[2])
+            within = numpy.einsum("ij,ij->i", offsets, offsets) <= state.REACH**2
+            expected = numpy.flatnonzero(within & ~marked)
+            assert sorted(state.move(center).tolist()) == expected.tolist()
+            marked[expected] = True
+        assert numpy.array_equal(state.states == MARKED, marked)
+        assert state.marked_count == marked.sum() == sum(map(len, reported))
+        assert marked.any() and not marked.all()
+
+        for x, z, radius in rng.uniform(-size / 2, size / 2, (50, 3)) * [1, 1, 0.3]:
+            offsets = numpy.abs(state.positions - (x, z))
+            within = numpy.flatnonzero(numpy.all(offsets <= radius, axis=1))
+            assert set(within.tolist()) <= set(state.near(x, z, radius).tolist())
+
+        first, shape = (5, 3), (11, 17)
+        index = state.cell_index(first, shape)
+        for k, (i, j) in enumerate(state.cells.tolist()):
+            if 0 <= i - first[0] < shape[0] and 0 <= j - first[1] < shape[1]:
+                assert index[(i - first[0]) * shape[1] + j - first[1]] == k
+        assert (index >= 0).sum() == sum(
+            0 <= i - first[0] < shape[0] and 0 <= j - first[1] < shape[1]
+            for i, j in state.cells.tolist()
+        )
+
+
+def scene_nodes(count, spread=None, seed=0):
+    """A Scene with ``count`` spheres, cubes and snow figures scattered around
+    the origin, and a pick ray from a camera 15 units away."""
+    import random
+
+    import numpy
+
+    from node import Cube, Sphere, SnowFigure
+    from scene import Scene
+    from transformation import translation
+
+    random.seed(seed)
+    rng = numpy.random.default_rng(seed)
+    spread = spread if spread is not None else max(6.0, count ** (1 / 3))
+    scene = Scene()
+    for k in range(count):
+        node = (Sphere, Cube, SnowFigure)[k % 3]()
+        node.translate(*rng.uniform(-spread, spread, 3))
+        node.rotate_y(rng.uniform(0, 2 * numpy.pi))
+        scene.add_node(node)
+    start = numpy.array([0.0, 0.0, 15.0])
+    direction = numpy.array([0.01, 0.02, -1.0])
+    direction /= numpy.linalg.norm(direction)
+    inverse_view = numpy.linalg.inv(translation([0.0, 0.0, -15.0]))
+    return scene, start, direction, inverse_view
+
+
+def bench_scene(args):
+    """scene [count ...]: render and pick times of a static scene of nodes."""
+    board_context()
+    for count in [int(arg) for arg in args] or [100, 1000]:
+        scene, start, direction, inverse_view = scene_nodes(count)
+        render = frame_time(scene.render, frames=10)
+        pick, _ = timed(scene.pick, start, direction, inverse_view, repeat=5)
+        print(
+            "%6d nodes  render %8.2f ms  pick %8.2f ms"
+            % (count, render * 1000, pick * 1000)
+        )
+
+
+def check_scene(args):
+    """scene: cached node matrices match ones computed afresh as nodes move."""
+    import itertools
+
+    import numpy
+
+    from node import Node
+    from transformation import translation
+
+    scene, start, direction, inverse_view = scene_nodes(60)
+    box_corners = numpy.array(list(itertools.product((-1.0, 1.0), repeat=3)))
+
+    def descendants(node_list):
+        for node in node_list:
+            yield node
+            yield from descendants(getattr(node, "child_nodes", []))
+
+    def check(node, parent_matrix):
+        local = numpy.dot(node.translation_matrix, node.scaling_matrix)
+        world = numpy.dot(parent_matrix, local)
+        assert numpy.allclose(node.world_matrix, world)
+        assert numpy.allclose(numpy.dot(node.world_inverse, world), numpy.identity(4))
+        assert numpy.allclose(node.gl_world_matrix, world.T, atol=1e-5)
+        corners = box_corners * node.aabb.size + node.aabb.center
+        points = numpy.dot(corners, world[:3, :3].T) + world[:3, 3]
+        low, high = Node.world_bounds.fget(node)
+        assert numpy.allclose(low, points.min(axis=0))
+        assert numpy.allclose(high, points.max(axis=0))
+        for child in getattr(node, "child_nodes", []):
+            check(child, world)
+
+    every = list(descendants(scene.node_list))
+    rng = numpy.random.default_rng(0)
+    views = [inverse_view, numpy.linalg.inv(translation([0.0, 0.5, -14.0]))]
+    for _ in range(10):
+        for k in rng.integers(0, len(every), 20):
+            change = rng.integers(0, 3)
+            if change == 0:
+                every[k].translate(*rng.normal(0.0, 1.0, 3))
+            elif change == 1:
+                every[k].rotate_y(rng.uniform(0.0, 2 * numpy.pi))
+            else:
+                every[k].scale(bool(rng.integers(0, 2)))
+        for node in scene.node_list:
+            check(node, numpy.identity(4))
+        # picking reuses the view product only while the view is the same
+        for view in views:
+            for node in scene.node_list:
+                pick_matrix = numpy.dot(
+                    node.translation_matrix, numpy.linalg.inv(node.scaling_matrix)
+                )
+                assert node.pick(start, direction, view) == node.aabb.ray_hit(
+                    start, direction, numpy.dot(view, pick_matrix)
+                )
+
+
+def bench_camera(args):
+    """camera: per-frame view matrix and pick ray, read back from GL against Camera."""
+    import numpy
+    from OpenGL.GL import GL_MODELVIEW, GL_MODELVIEW_MATRIX, GL_PROJECTION
+    from OpenGL.GL import glGetFloatv, glLoadIdentity, glMatrixMode, glTranslated
+    from OpenGL.GL import glMultMatrixf
+    from OpenGL.GLU import gluPerspective, gluUnProject
+
+    import trackball
+    from camera import Camera
+
+    gl_context()
+    ball = trackball.Trackball(theta=-25, distance=15)
+    location = [0.0, 0.0, 0.0, 0.0]
+    camera = Camera()
+
+    def gl_frame():
+        # what Viewer.render and Viewer.get_ray used to do
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluPerspective(70, 640 / 480, 0.1, 1000.0)
+        glTranslated(0, 0, -15)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        glTranslated(*location[:3])
+        glMultMatrixf(ball.matrix)
+        view = numpy.transpose(numpy.array(glGetFloatv(GL_MODELVIEW_MATRIX)))
+        numpy.linalg.inv(view)
+        glLoadIdentity()
+        start = numpy.array(gluUnProject(320, 240, 0.001))
+        end = numpy.array(gluUnProject(320, 240, 0.999))
+        direction = end - start
+        return start, direction / numpy.linalg.norm(direction)
+
+    def camera_frame():
+        camera.look(location, ball.matrix)
+        return camera.ray(320, 240)
+
+    for name, frame in [("GL readback", gl_frame), ("Camera", camera_frame)]:
+        elapsed, _ = timed(lambda: [frame() for _ in range(1000)], repeat=3)
+        print("%-12s %8.1f us per frame" % (name, elapsed * 1000))
+
+
+def check_camera(args):
+    """camera: Camera rays land on their pixels and its matrices invert."""
+    import numpy
+
+    import trackball
+    from camera import Camera
+
+    camera = Camera()
+    rng = numpy.random.default_rng(0)
+    for width, height in [(640, 480), (300, 700)]:
+        camera.resize(width, height)
+        assert numpy.allclose(
+            numpy.dot(camera.projection, camera.projection_inverse), numpy.identity(4)
+        )
+        for x, y in rng.uniform(0, 1, (20, 2)) * (width, height):
+            start, direction = camera.ray(x, y)
+            assert numpy.isclose(numpy.linalg.norm(direction), 1.0)
+            # every point of the ray in front of the camera projects to x, y
+            for t in (0.0, 1.0, 50.0):
+                point = numpy.dot(
+                    camera.projection, numpy.append(start + t * direction, 1)
+                )
+                ndc = point[:3] / point[3]
+                window = (ndc[:2] + 1) / 2 * (width, height)
+                assert numpy.allclose(window, (x, y))
+                assert -1 <= ndc[2] <= 1
+
+        # a sphere on the view axis covers its diameter in pixels
+        for depth in (1.0, 10.0, 100.0):
+            camera.look((0.0, 0.0, 0.0), numpy.identity(4))
+            center = numpy.array([0.0, 0.0, camera.distance - depth])
+            top = numpy.dot(camera.projection, numpy.append(center + [0, 0.5, 0], 1))
+            pixels = top[1] / top[3] * height
+            size = camera.projected_sizes(center[None], numpy.array([0.5]))[0]
+            assert numpy.isclose(size, pixels)
+
+    ball = trackball.Trackball(theta=-25, distance=15)
+    camera.look([1.0, 2.0, 3.0, 0.0], ball.matrix)
+    view = camera.view
+    assert numpy.allclose(numpy.dot(camera.view_inverse, view), numpy.identity(4))
+    assert numpy.allclose(camera.gl_view, view.T)
+    # the view is only recomputed when the translation or rotation changes
+    camera.look([1.0, 2.0, 3.0, 0.0], ball.matrix)
+    assert camera.view is view
+    camera.look([1.0, 2.0, 4.0, 0.0], ball.matrix)
+    assert numpy.allclose(camera.view[:3, 3] - view[:3, 3], [0.0, 0.0, 1.0])
+
+
+def bench_cull(args):
+    """cull [count] [spread]: frame time of scattered nodes with and without frustum culling."""
+    import numpy
+    from OpenGL.GL import GL_MODELVIEW, GL_PROJECTION, glLoadMatrixf, glMatrixMode
+
+    from camera import Camera
+
+    count = int(args[0]) if args else 100000
+    spread = float(args[1]) if len(args) > 1 else 200.0
+    board_context()
+    elapsed, (scene, _, _, _) = timed(scene_nodes, count, spread)
+    camera = Camera()
+    camera.look((0.0, 0.0, 0.0), numpy.identity(4))
+    glMatrixMode(GL_PROJECTION)
+    glLoadMatrixf(camera.gl_projection)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadMatrixf(camera.gl_view)
+    print("%d nodes in a %g cube, built in %.1f s" % (count, 2 * spread, elapsed))
+
+    everything = frame_time(scene.render, frames=2)
+    print("no culling  %9.1f ms" % (everything * 1000))
+    frustum = camera.frustum()
+    culled = frame_time(lambda: scene.render(camera.frustum()), frames=10)
+    scene.render(frustum)
+    print(
+        "culling     %9.1f ms  %d drawn, %d culled"
+        % (culled * 1000, frustum.drawn, frustum.culled)
+    )
+    test, _ = timed(
+        frustum.intersects, scene.bounds_low[:count], scene.bounds_high[:count]
+    )
+    print("of which the test of the top level nodes takes %.1f ms" % (test * 1000))
+
+
+def check_cull(args):
+    """cull: the scene culls exactly the nodes whose boxes are outside a frustum plane."""
+    import itertools
+
+    import numpy
+
+    import trackball
+    from camera import Camera
+
+    scene, _, _, _ = scene_nodes(300, spread=30.0)
+    camera = Camera(far=60.0)
+    box_corners = numpy.array(list(itertools.product((0, 1), repeat=3)))
+    rng = numpy.random.default_rng(0)
+    for theta in (0, 40, 170):
+        camera.look((0.0, 0.0, 0.0), trackball.Trackball(theta=theta).matrix)
+        matrix = numpy.dot(camera.projection, camera.view)
+        for node in scene.node_list[::7]:
+            node.translate(*rng.normal(0.0, 5.0, 3))
+
+        expected = []
+        for i, node in enumerate(scene.node_list):
+            low, high = node.world_bounds
+            corners = numpy.where(box_corners, high, low)
+            clip = numpy.dot(numpy.c_[corners, numpy.ones(8)], matrix.T)
+            w = clip[:, 3:]
+            # outside when every corner is beyond the same clip plane
+            outside = numpy.all(clip[:, :3] < -w, axis=0) | numpy.all(
+                clip[:, :3] > w, axis=0
+            )
+            if not outside.any():
+                expected.append(i)
+
+        frustum = camera.frustum()
+        drawn = scene.visible_indices(frustum)
+        assert drawn.tolist() == expected
+        assert 0 < frustum.drawn < len(scene.node_list)
+        assert frustum.drawn + frustum.culled == len(scene.node_list)
+
+
+def bench_pick(args):
+    """pick [count ...]: pick latency through the BVH against a linear scan of every node."""
+    for count in [int(arg) for arg in args] or [1000, 10000, 50000]:
+        scene, start, direction, inverse_view = scene_nodes(count)
+        build, _ = timed(scene.update_pick_tree)
+        scan, (closest, _) = timed(
+            linear_pick, scene, start, direction, inverse_view, repeat=3
+        )
+        tree, _ = timed(scene.pick, start, direction, inverse_view, repeat=20)
+        assert scene.selected_node is closest
+        node = scene.node_list[count // 2]
+        refit, _ = timed(
+            lambda: (node.translate(0.1, 0.0, 0.0), scene.update_pick_tree()),
+            repeat=20,
+        )
+        print(
+            "%6d nodes  linear %9.2f ms  bvh %7.3f ms  build %8.1f ms  refit %6.3f ms"
+            % (count, scan * 1000, tree * 1000, build * 1000, refit * 1000)
+        )
+
+
+def linear_pick(scene, start, direction, mat):
+    """The closest node hit by a ray and the distance to it, testing every
+    node as Scene.pick did before it had a pick tree."""
+    mindist, closest = sys.maxsize, None
+    for node in scene.node_list:
+        hit, distance = node.pick(start, direction, mat)
+        if hit and distance < mindist:
+            mindist, closest = distance, node
+    return closest, mindist
+
+
+def check_pick(args):
+    """pick: picking through the BVH finds the node a linear scan finds."""
+    import numpy
+
+    from node import Cube, Sphere
+    from transformation import rotation_y
+
+    # sparse enough that rays aimed at a node mostly hit that node
+    scene, start, direction, inverse_view = scene_nodes(200, spread=20.0)
+    scene.update_pick_tree()
+    turned = numpy.dot(inverse_view, rotation_y(0.7))
+    rng = numpy.random.default_rng(0)
+    hits = 0
+    for _ in range(3):
+        # moved nodes refit the tree and added ones are inserted into it
+        moved = [scene.node_list[i] for i in rng.choice(len(scene.node_list), 15)]
+        for node in moved:
+            node.translate(*rng.normal(0.0, 5.0, 3))
+        for k in range(20):
+            node = (Sphere, Cube)[k % 2]()
+            node.translate(*rng.uniform(-20.0, 20.0, 3))
+            scene.add_node(node)
+            moved.append(node)
+        for mat in (inverse_view, turned):
+            # rays around the view axis, and rays at the moved nodes
+            targets = [numpy.dot(mat, node.world_matrix[:, 3])[:3] for node in moved]
+            rays = list(direction + rng.normal(0.0, 0.3, (10, 3)))
+            rays += [target - start for target in targets]
+            for ray in rays:
+                ray /= numpy.linalg.norm(ray)
+                closest, mindist = linear_pick(scene, start, ray, mat)
+                scene.pick(start, ray, mat)
+                assert scene.selected_node is closest
+                if closest is not None:
+                    assert numpy.isclose(closest.depth, mindist)
+                    hits += 1
+    assert hits > 0
+
+
+def bench_raycast(args):
+    """raycast [rays] [count ...]: batched raycast against a Node.pick loop per ray."""
+    import numpy
+
+    rays = int(args[0]) if args else 1000
+    rng = numpy.random.default_rng(0)
+    for count in [int(arg) for arg in args[1:]] or [100, 1000]:
+        scene, start, direction, inverse_view = scene_nodes(count)
+        directions = direction + rng.normal(0.0, 0.2, (rays, 3))
+        directions /= numpy.linalg.norm(directions, axis=1)[:, None]
+        starts = numpy.broadcast_to(start, directions.shape)
+
+        def loop(limit):
+            for k in range(limit):
+                for node in scene.node_list:
+                    node.pick(starts[k], directions[k], inverse_view)
+
+        # the loop is timed over a few rays and scaled up
+        sample = max(min(rays, 20000 // count), 1)
+        scan, _ = timed(loop, sample)
+        scan *= rays / sample
+        batch, (nodes, _) = timed(
+            scene.raycast, starts, directions, inverse_view, repeat=3
+        )
+        print(
+            "%6d rays %6d nodes  loop %9.1f ms  raycast %7.1f ms  %d hits"
+            % (rays, count, scan * 1000, batch * 1000, len(nodes) - nodes.count(None))
+        )
+
+
+def check_raycast(args):
+    """raycast: every ray of a batch hits what picking along it alone hits."""
+    import numpy
+
+    scene, start, direction, inverse_view = scene_nodes(150)
+    rng = numpy.random.default_rng(0)
+    directions = direction + rng.normal(0.0, 0.2, (100, 3))
+    directions /= numpy.linalg.norm(directions, axis=1)[:, None]
+    starts = numpy.broadcast_to(start, directions.shape)
+    for chunk_size in (None, 7):
+        for node in rng.choice(len(scene.node_list), 20):
+            scene.node_list[node].translate(*rng.normal(0.0, 1.0, 3))
+        nodes, distances = scene.raycast(starts, directions, inverse_view, chunk_size)
+        for k in range(len(directions)):
+            closest, mindist = linear_pick(scene, start, directions[k], inverse_view)
+            assert nodes[k] is closest
+            assert numpy.isclose(distances[k], mindist if closest else numpy.inf)
+        assert 0 < nodes.count(None) < len(nodes)
+
+
+def bench_colorpick(args):
+    """colorpick [count ...]: color-ID picking against ray picking at the center of the window."""
+    from OpenGL.GL import glFinish
+
+    from camera import Camera
+    from picking import ColorPicker
+
+    board_context()
+    camera = Camera()
+    camera.resize(640, 480)
+    picker = ColorPicker()
+    for count in [int(arg) for arg in args] or [100, 1000, 10000]:
+        scene, _, _, _ = scene_nodes(count)
+        start, direction = camera.ray(320, 240)
+        scene.update_pick_tree()
+        ray, _ = timed(scene.pick, start, direction, camera.view, repeat=5)
+        picker.pick(scene, camera, 320, 240)
+        color, (node, _, _) = timed(
+            lambda: (picker.pick(scene, camera, 320, 240), glFinish())[0], repeat=5
+        )
+        print(
+            "%6d nodes  ray %7.2f ms  color %7.2f ms  ray picked %s, color picked %s"
+            % (
+                count,
+                ray * 1000,
+                color * 1000,
+                type(scene.selected_node).__name__,
+                type(node).__name__,
+            )
+        )
+
+
+def bench_collide(args):
+    """collide [count ...]: time of dragging a node around a scene with collisions."""
+    import numpy
+
+    rng = numpy.random.default_rng(0)
+    for count in [int(arg) for arg in args] or [1000, 10000, 100000]:
+        scene, start, _, inverse_view = scene_nodes(count)
+        build, _ = timed(scene.update_collision_hash)
+        node = scene.node_list[count // 2]
+        location = numpy.linalg.inv(inverse_view).dot(node.translation_matrix[:, 3])
+        scene.selected_node = node
+        node.depth = numpy.linalg.norm(location[:3] - start)
+        node.selected_loc = location[:3]
+        targets = node.selected_loc + rng.normal(0.0, 0.5, (200, 3)).cumsum(axis=0)
+        directions = targets - start
+        directions /= numpy.linalg.norm(directions, axis=1)[:, None]
+        moved, _ = timed(
+            lambda: [scene.move_selected(start, d, inverse_view) for d in directions]
+        )
+        print(
+            "%6d nodes  build %8.1f ms  move %6.2f ms"
+            % (count, build * 1000, moved / len(directions) * 1000)
+        )
+
+
+def check_collide(args):
+    """collide: the spatial hash and box tests agree with brute force, and
+    dragging never pushes a node into another."""
+    import itertools
+
+    import numpy
+
+    from collision import SpatialHash, obb_overlaps
+    from transformation import rotation_y
+
+    rng = numpy.random.default_rng(0)
+
+    # the hash finds every box overlapping a query box, after moves and removals
+    spatial_hash = SpatialHash(2.0)
+    low = rng.uniform(-20.0, 20.0, (300, 3))
+    high = low + rng.exponential(1.5, (300, 3))
+    spatial_hash.insert_many(numpy.arange(300), low, high)
+    for item in rng.choice(300, 100):
+        low[item] += rng.normal(0.0, 3.0, 3)
+        high[item] = low[item] + rng.exponential(1.5, 3)
+        spatial_hash.update(int(item), low[item], high[item])
+    removed = set(rng.choice(300, 30).tolist())
+    for item in removed:
+        spatial_hash.remove(item)
+    for query_low in rng.uniform(-20.0, 20.0, (100, 3)):
+        query_high = query_low + rng.exponential(2.0, 3)
+        found = spatial_hash.query(query_low, query_high)
+        overlapping = numpy.all((low <= query_high) & (high >= query_low), axis=1)
+        assert set(numpy.flatnonzero(overlapping).tolist()) - removed <= found
+        assert not found & removed
+
+    # turned boxes overlap when they share a point and never when their
+    # bounding boxes are apart; boxes without a turn are their bounding boxes
+    grid = numpy.array(list(itertools.product(numpy.linspace(-1, 1, 7), repeat=3)))
+    for turned in (True, False):
+        angles = rng.uniform(0, 2 * numpy.pi, 200) if turned else numpy.zeros(200)
+        axes = numpy.array([rotation_y(angle)[:3, :3].T for angle in angles])
+        centers = rng.uniform(-3.0, 3.0, (200, 3))
+        halves = rng.uniform(0.2, 1.5, (200, 3))
+        hit = obb_overlaps(centers[0], axes[0], halves[0], centers, axes, halves)
+        points = numpy.dot(grid * halves[0], axes[0]) + centers[0]
+        extents = numpy.einsum("kij,ki->kj", numpy.abs(axes), halves)
+        for k in range(1, 200):
+            inside = numpy.all(
+                numpy.abs(numpy.dot(points - centers[k], axes[k].T)) < halves[k],
+                axis=1,
+            )
+            apart = numpy.any(
+                numpy.abs(centers[k] - centers[0]) >= extents[k] + extents[0]
+            )
+            assert not inside.any() or hit[k]
+            assert not apart or not hit[k]
+            if not turned:
+                assert hit[k] == (not apart)
+
+    # Scene.overlapping matches testing every node, as dragged nodes stop
+    # short of the nodes they did not overlap before
+    scene, start, _, inverse_view = scene_nodes(150)
+    view = numpy.linalg.inv(inverse_view)
+
+    def brute_overlapping(node):
+        others = [other for other in scene.node_list if other is not node]
+        boxes = [other.world_box for other in others]
+        hit = obb_overlaps(
+            *node.world_box,
+            numpy.array([box[0] for box in boxes]),
+            numpy.array([box[1] for box in boxes]),
+            numpy.array([box[2] for box in boxes])
+        )
+        return {other for other, h in zip(others, hit) if h}
+
+    for node in [scene.node_list[i] for i in rng.choice(150, 10)]:
+        location = view.dot(node.translation_matrix[:, 3])[:3]
+        scene.selected_node = node
+        node.depth = numpy.linalg.norm(location - start)
+        node.selected_loc = location
+        overlapped = brute_overlapping(node)
+        targets = location + rng.normal(0.0, 0.7, (15, 3)).cumsum(axis=0)
+        for target in targets:
+            direction = (target - start) / numpy.linalg.norm(target - start)
+            scene.move_selected(start, direction, inverse_view)
+            now = brute_overlapping(node)
+            assert scene.overlapping(node) == now
+            assert now <= overlapped
+            overlapped = now
+
+
+def bench_instanced(args):
+    """instanced [count]: frame time of spheres drawn one by one and instanced."""
+    import numpy
+
+    from instancing import InstancedRenderer
+    from node import Sphere
+    from scene import Scene
+
+    board_context()
+    count = int(args[0]) if args else 100000
+    rng = numpy.random.default_rng(0)
+    spread = count ** (1 / 3)
+    scenes = []
+    for instanced in (False, True):
+        scene = Scene()
+        for position in rng.uniform(-spread, spread, (count, 3)):
+            node = Sphere(0.2)
+            node.translate(*position)
+            scene.add_node(node)
+        if instanced:
+            scene.instancer = InstancedRenderer()
+        scenes.append(scene)
+    separate = frame_time(scenes[0].render, frames=3)
+    first, _ = timed(scenes[1].render)
+    instanced = frame_time(scenes[1].render, frames=5)
+    moved = scenes[1].node_list[count // 2]
+    changed = frame_time(
+        lambda: (moved.translate(0.01, 0.0, 0.0), scenes[1].render()), frames=5
+    )
+    print("%d spheres" % count)
+    print("one by one  %9.1f ms" % (separate * 1000))
+    print("instanced   %9.1f ms" % (instanced * 1000))
+    print("instanced   %9.1f ms  with a node moving" % (changed * 1000))
+    print("first instanced frame, packing every node: %.1f ms" % (first * 1000))
+
+
+def bench_queue(args):
+    """queue [count]: state changes and frame time of nodes drawn sorted by state."""
+    import random
+
+    import numpy
+
+    from node import Board, Cube, SnowFigure, Sphere
+    from render_queue import RenderQueue
+    from scene import Scene
+
+    board_context()
+    count = int(args[0]) if args else 30000
+    random.seed(0)
+    rng = numpy.random.default_rng(0)
+    spread = count ** (1 / 3)
+    scene = Scene()
+    scene.add_node(Board.from_map())
+    for k, position in enumerate(rng.uniform(-spread, spread, (count, 3))):
+        node = (Sphere, Cube, SnowFigure)[k % 3]()
+        node.translate(*position)
+        node.selected = k % 10 == 0
+        scene.add_node(node)
+    in_order = frame_time(scene.render, frames=3)
+    rows = []
+    for sort in (False, True):
+        scene.render_queue = RenderQueue(sort)
+        rows.append(
+            (frame_time(scene.render, frames=3), dict(scene.render_queue.changes))
+        )
+    print("%d nodes, %d draw items" % (count, len(scene.render_queue)))
+    print("node by node    %9.1f ms" % (in_order * 1000))
+    for name, (seconds, changes) in zip(("queue in order", "queue sorted"), rows):
+        print("%-15s %9.1f ms  state changes %s" % (name, seconds * 1000, changes))
+
+
+def bench_bake(args):
+    """bake [count]: frame time of snow figures drawn node by node and baked."""
+    import numpy
+
+    from node import SnowFigure
+    from scene import Scene
+
+    board_context()
+    count = int(args[0]) if args else 5000
+    rng = numpy.random.default_rng(0)
+    spread = count ** (1 / 3)
+    scenes = []
+    for bake in (False, True):
+        scene = Scene()
+        for position in rng.uniform(-spread, spread, (count, 3)):
+            node = SnowFigure()
+            if not bake:
+                node.static = False
+                node.BAKE_FRAMES = float("inf")
+            node.translate(*position)
+            scene.add_node(node)
+        scenes.append(scene)
+    unbaked = frame_time(scenes[0].render, frames=3)
+    first, _ = timed(scenes[1].render)
+    baked = frame_time(scenes[1].render, frames=3)
+    print("%d snow figures" % count)
+    print("node by node %9.1f ms" % (unbaked * 1000))
+    print(
+        "baked        %9.1f ms  (first frame, baking: %.1f ms)"
+        % (baked * 1000, first * 1000)
+    )
+
+
+def bench_detail(args):
+    """detail [count] [board size]: triangles and frame time of spheres by screen size."""
+    import numpy
+    from OpenGL.GL import GL_MODELVIEW, GL_PROJECTION, glLoadMatrixf, glMatrixMode
+
+    from camera import Camera
+    from lod import LevelOfDetail
+    from node import Board, HierarchicalNode
+    from primitive import DETAIL_LISTS, G_OBJ_SPHERE, detail_list, triangle_count
+
+    count = int(args[0]) if args else 3000
+    size = int(args[1]) if len(args) > 1 else 61
+    board_context()
+    scene = scene_nodes(count, spread=40.0)[0]
+    rows = numpy.random.default_rng(0).random((size, size)) < 0.5
+    board = Board((size + 1, size + 1), map=rows)
+    scene.add_node(board)
+    camera = Camera()
+    angle = numpy.radians(35.0)
+    tilt = numpy.identity(4)
+    tilt[1:3, 1:3] = [
+        [numpy.cos(angle), -numpy.sin(angle)],
+        [numpy.sin(angle), numpy.cos(angle)],
+    ]
+    camera.look((0.0, 0.0, 0.0), tilt)
+    glMatrixMode(GL_PROJECTION)
+    glLoadMatrixf(camera.gl_projection)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadMatrixf(camera.gl_view)
+
+    def triangles(node):
+        if isinstance(node, Board):
+            spheres = DETAIL_LISTS[G_OBJ_SPHERE]
+            details = node.markers.details[: node.markers.count]
+            return sum(triangle_count(spheres[detail]) for detail in details)
+        if isinstance(node, HierarchicalNode):
+            return sum(triangles(child) for child in node.child_nodes)
+        return triangle_count(detail_list(node.call_list, node.detail))
+
+    def render():
+        scene.render(camera.frustum())
+
+    print("%d nodes and a %d by %d board" % (count, size, size))
+    for lod in (None, LevelOfDetail(camera)):
+        scene.lod = lod
+        seconds = frame_time(render, frames=5)
+        drawn = scene.visible_nodes(camera.frustum())
+        print(
+            "%-17s %8.1f ms  %8d triangles, %d of them in markers"
+            % (
+                "levels of detail" if lod else "full detail",
+                seconds * 1000,
+                sum(triangles(node) for node in drawn),
+                triangles(board),
+            )
+        )
+
+    # moving the camera back and forth by a little switches only the nodes
+    # right at a threshold, and with hysteresis none after the first move
+    for hysteresis in (0.0, 0.15):
+        scene.lod = LevelOfDetail(camera, hysteresis=hysteresis)
+        render()
+        switches = 0
+        for step in range(20):
+            camera.look((0.0, 0.0, 0.2 * (step % 2)), tilt)
+            before = scene.details.copy()
+            render()
+            switches += (scene.details != before).sum()
+        print(
+            "hysteresis %.2f: %.1f level switches per frame"
+            % (hysteresis, switches / 20)
+        )
+
+
+BENCHMARKS = {
+    "objload": bench_objload,
+    "compile": bench_compile,
+    "lod": bench_lod,
+    "halfedge": bench_halfedge,
+    "normals": bench_normals,
+    "board": bench_board,
+    "chunked": bench_chunked,
+    "mapload": bench_mapload,
+    "markers": bench_markers,
+    "boardstate": bench_boardstate,
+    "scene": bench_scene,
+    "camera": bench_camera,
+    "cull": bench_cull,
+    "pick": bench_pick,
+    "raycast": bench_raycast,
+    "colorpick": bench_colorpick,
+    "collide": bench_collide,
+    "instanced": bench_instanced,
+    "queue": bench_queue,
+    "bake": bench_bake,
+    "detail": bench_detail,
+}
+
+CHECKS = {
+    "objload": check_objload,
+    "chunked": check_chunked,
+    "mapload": check_mapload,
+    "boardstate": check_boardstate,
+    "scene": check_scene,
+    "camera": check_camera,
+    "cull": check_cull,
+    "pick": check_pick,
+    "raycast": check_raycast,
+    "collide": check_collide,
+}
+
+
+def run_checks(names):
+    """Run the named checks, or all of them, stopping at the first failure."""
+    for name in names or CHECKS:
+        start = time.perf_counter()
+        CHECKS[name]([])
+        print("%-12s ok  %6.2f s" % (name, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "check":
+        run_checks(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        for func in BENCHMARKS.values():
+            print("  " + func.__doc__)
+        print("Checks:")
+        for func in CHECKS.values():
+            print("  " + func.__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,59 @@
+import math
+
+import numpy
+
+
+class GridIndex:
+    """Uniform grid index over the cells of a board, in board coordinates.
+
+    Cell (i, j) covers x in [x0 + i * size, x0 + (i + 1) * size) and likewise
+    for z, and is numbered ``i * height + j``. A radius query only looks at
+    the window of cells around the query point, so its cost depends on the
+    radius and not on the size of the board. The candidate window is kept
+    between queries and rebuilt only when the point moves into another cell.
+    """
+
+    def __init__(self, origin, cell_size, shape):
+        self.x0, self.z0 = origin
+        self.cell_size = cell_size
+        self.width, self.height = shape
+        self.window = None
+        self.cells = numpy.zeros(0, numpy.int64)
+        self.centers = numpy.zeros((0, 2))
+
+    def cell_of(self, x, z):
+        return (
+            math.floor((x - self.x0) / self.cell_size),
+            math.floor((z - self.z0) / self.cell_size),
+        )
+
+    def move(self, center, radius):
+        """Update the candidate cells for a query around ``center``."""
+        i, j = self.cell_of(center[0], center[2])
+        reach = math.ceil(radius / self.cell_size)
+        window = (
+            max(i - reach, 0),
+            min(i + reach + 1, self.width),
+            max(j - reach, 0),
+            min(j + reach + 1, self.height),
+        )
+        if window == self.window:
+            return
+        self.window = window
+        i0, i1, j0, j1 = window
+        i, j = numpy.meshgrid(numpy.arange(i0, i1), numpy.arange(j0, j1), indexing="ij")
+        self.cells = (i * self.height + j).reshape(-1)
+        self.centers = numpy.stack(
+            [
+                self.x0 + (i.reshape(-1) + 0.5) * self.cell_size,
+                self.z0 + (j.reshape(-1) + 0.5) * self.cell_size,
+            ],
+            axis=1,
+        )
+
+    def query(self, center, radius):
+        """Return the cells whose centers are within ``radius`` of ``center``."""
+        self.move(center, radius)
+        offsets = self.centers - (center[0], center[2])
+        distances = numpy.einsum("ij,ij->i", offsets, offsets)
+        return self.cells[distances < radius * radius]
@@ -0,0 +1,115 @@
+import struct
+
+import numpy
+
+# magic, version, width, height
+HEADER = struct.Struct("<4sIII")
+MAGIC = b"BMAP"
+VERSION = 1
+
+# the number of bits set in every byte
+POPCOUNT = numpy.unpackbits(numpy.arange(256, dtype=numpy.uint8)[:, None], axis=1).sum(
+    1
+)
+
+
+def sphere_mask(map):
+    """Return the (width + 1, height + 1) mask of the board cells holding a
+    sphere for a (height, width) map: cell (i, j) for i, j >= 2 has one where
+    map[j - 1][i - 1] is set."""
+    map = numpy.asarray(map) != 0
+    height, width = map.shape
+    mask = numpy.zeros((width + 1, height + 1), bool)
+    mask[2:, 2:] = map[1:, 1:].T
+    return mask
+
+
+class BoardMap:
+    """A sphere map stored as bit-packed rows, one bit per map character.
+
+    ``packed`` is a (height, ceil(width / 8)) uint8 array, which may be a
+    ``numpy.memmap`` of a file so that maps larger than memory can be used.
+    ``region`` only unpacks the bytes covering the requested window.
+
+    On disk a map is a header with a magic number, format version, width and
+    height followed by the packed rows.
+    """
+
+    def __init__(self, packed, width):
+        self.packed = packed
+        self.width = width
+        self.height = len(packed)
+
+    @classmethod
+    def from_array(cls, array):
+        array = numpy.asarray(array) != 0
+        return cls(numpy.packbits(array, axis=1), array.shape[1])
+
+    @classmethod
+    def from_text(cls, text):
+        lines = text.split("\n")
+        for line in lines:
+            assert len(line) == len(lines[0])
+        array = numpy.frombuffer("".join(lines).encode(), numpy.uint8)
+        return cls.from_array((array != ord("0")).reshape(len(lines), -1))
+
+    @classmethod
+    def from_raw(cls, filename, width, height, offset=0):
+        """Memory-map rows packed by ``numpy.packbits`` from a file."""
+        packed = numpy.memmap(
+            filename, numpy.uint8, "r", offset, (height, (width + 7) // 8)
+        )
+        return cls(packed, width)
+
+    @classmethod
+    def load(cls, filename):
+        """Memory-map a map file written by ``save``."""
+        with open(filename, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("%s: not a board map" % filename)
+        magic, version, width, height = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("%s: not a board map" % filename)
+        if version != VERSION:
+            raise ValueError(
+                "%s: unsupported board map version %d" % (filename, version)
+            )
+        return cls.from_raw(filename, width, height, HEADER.size)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.width, self.height))
+            for start in range(0, self.height, 4096):
+                f.write(numpy.asarray(self.packed[start : start + 4096]).tobytes())
+
+    def count(self, x0=0, y0=0):
+        """Return the number of set entries in map[y0:, x0:]."""
+        total = 0
+        for start in range(y0, self.height, 4096):
+            rows = numpy.asarray(self.packed[start : start + 4096])
+            total += int(POPCOUNT[rows].sum())
+            if x0:
+                total -= int(
+                    numpy.unpackbits(rows[:, : (x0 + 7) // 8], axis=1)[:, :x0].sum()
+                )
+        return total
+
+    def unpack(self):
+        """Return the whole map as a (height, width) bool array."""
+        return numpy.unpackbits(self.packed, axis=1, count=self.width).view(bool)
+
+    def region(self, x0, x1, y0, y1):
+        """Return map[y0:y1, x0:x1] as a bool array, empty outside the map."""
+        result = numpy.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), bool)
+        cx0, cx1 = max(x0, 0), min(x1, self.width)
+        cy0, cy1 = max(y0, 0), min(y1, self.height)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return result
+        rows = numpy.unpackbits(
+            numpy.asarray(self.packed[cy0:cy1, cx0 // 8 : (cx1 + 7) // 8]), axis=1
+        )
+        result[cy0 - y0 : cy1 - y0, cx0 - x0 : cx1 - x0] = rows[
+            :, cx0 % 8 : cx0 % 8 + cx1 - cx0
+        ]
+        return result
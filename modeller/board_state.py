@@ -0,0 +1,102 @@
+import math
+from collections import defaultdict
+
+import numpy
+
+UNMARKED = 0
+MARKED = 1
+
+
+class BoardState:
+    """The spheres on a board and whether they have been marked.
+
+    A sphere sits on the (x_start, z_start) corner of its cell and is marked
+    once the center comes within REACH of it. The spheres are kept sorted by
+    the bucket of ``bucket_size`` by ``bucket_size`` cells they are in, so
+    the spheres near the center are found by looking up a few buckets instead
+    of scanning every sphere. Marking spheres triggers the "marked" callbacks
+    with the state and the indices of the spheres that were marked.
+    """
+
+    REACH = 0.1
+
+    def __init__(self, cells, origin, cell_size, bucket_size=4):
+        cells = numpy.asarray(cells, numpy.int64).reshape(-1, 2)
+        self.origin = origin
+        self.cell_size = cell_size
+        self.bucket_size = bucket_size
+        buckets = cells // bucket_size
+        self.rows = int(buckets[:, 1].max()) + 1 if len(cells) else 1
+        keys = buckets[:, 0] * self.rows + buckets[:, 1]
+        order = numpy.argsort(keys, kind="stable")
+        self.cells = cells[order]
+        self.keys = keys[order]
+        self.positions = numpy.stack(
+            [
+                origin[0] + self.cells[:, 0] * cell_size,
+                origin[1] + self.cells[:, 1] * cell_size,
+            ],
+            axis=1,
+        )
+        self.states = numpy.full(len(cells), UNMARKED, numpy.uint8)
+        self.marked_count = 0
+        self.callbacks = defaultdict(list)
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def unmarked_count(self):
+        return len(self) - self.marked_count
+
+    def register_callback(self, name, func):
+        """registers a callback for a certain event"""
+        self.callbacks[name].append(func)
+
+    def trigger(self, name, *args, **kwargs):
+        """calls a callback, forwards the args"""
+        for func in self.callbacks[name]:
+            func(*args, **kwargs)
+
+    def cell_index(self, first, shape):
+        """Return the index of the sphere on every cell of the block of cells
+        ``shape`` in size starting at cell ``first``, or -1 for no sphere.
+        The cells are numbered like those of a ``BoardMesh``."""
+        index = numpy.full(shape[0] * shape[1], -1, numpy.int64)
+        local = self.cells - first
+        inside = numpy.all((local >= 0) & (local < shape), axis=1)
+        local = local[inside]
+        index[local[:, 0] * shape[1] + local[:, 1]] = numpy.flatnonzero(inside)
+        return index
+
+    def near(self, x, z, radius):
+        """Return the indices of the spheres in the buckets within ``radius``
+        of (x, z)."""
+        size = self.bucket_size * self.cell_size
+        bi0 = math.floor((x - radius - self.origin[0]) / size)
+        bi1 = math.floor((x + radius - self.origin[0]) / size)
+        bj0 = max(math.floor((z - radius - self.origin[1]) / size), 0)
+        bj1 = min(math.floor((z + radius - self.origin[1]) / size), self.rows - 1)
+        columns = numpy.arange(max(bi0, 0), bi1 + 1)
+        if bj0 > bj1 or not len(columns):
+            return numpy.zeros(0, numpy.int64)
+        # the buckets of a column are next to each other in key order
+        starts = numpy.searchsorted(self.keys, columns * self.rows + bj0)
+        ends = numpy.searchsorted(self.keys, columns * self.rows + bj1, "right")
+        if len(columns) == 1:
+            return numpy.arange(starts[0], ends[0])
+        return numpy.concatenate([numpy.arange(s, e) for s, e in zip(starts, ends)])
+
+    def move(self, center):
+        """Mark the spheres within REACH of ``center``, returning their indices."""
+        near = self.near(center[0], center[2], self.REACH)
+        offsets = self.positions[near] - (center[0], center[2])
+        reached = near[
+            (numpy.einsum("ij,ij->i", offsets, offsets) <= self.REACH**2)
+            & (self.states[near] == UNMARKED)
+        ]
+        if len(reached):
+            self.states[reached] = MARKED
+            self.marked_count += len(reached)
+            self.trigger("marked", self, reached)
+        return reached
@@ -0,0 +1,165 @@
+import numpy
+
+
+def ray_boxes(origin, direction, low, high, limit=numpy.inf):
+    """Slab test of one ray against (N, 3) boxes. Returns the ray parameter
+    where the ray enters each box (clamped to 0), and inf where it misses the
+    box or enters it beyond ``limit``."""
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / direction
+        t1 = (low - origin) * inverse
+        t2 = (high - origin) * inverse
+    # a zero direction component gives nan when the origin is on a slab
+    # plane; count that as inside, like any other origin within the slab
+    near = numpy.fmax(numpy.fmin(t1, t2), -numpy.inf)
+    far = numpy.fmin(numpy.fmax(t1, t2), numpy.inf)
+    enter = numpy.maximum(near.max(axis=-1), 0.0)
+    leave = far.min(axis=-1)
+    return numpy.where((enter <= leave) & (enter <= limit), enter, numpy.inf)
+
+
+class BVH:
+    """A bounding volume hierarchy over boxes, for finding what a ray hits.
+
+    Items are numbered boxes given by their (N, 3) low and high corners. The
+    tree is built top down, splitting the items of a node at the median of
+    their centers along the axis where the centers spread the most, down to
+    leaves of at most ``leaf_size`` items. Moved items are refit in place by
+    growing or shrinking the boxes on the way to the root; new items are put
+    in the leaf whose box grows the least.
+    """
+
+    def __init__(self, low, high, leaf_size=4):
+        self.leaf_size = leaf_size
+        self.item_low = numpy.array(low, numpy.float64).reshape(-1, 3)
+        self.item_high = numpy.array(high, numpy.float64).reshape(-1, 3)
+        self.item_leaf = numpy.zeros(len(self.item_low), numpy.int64)
+        self.low, self.high, self.children, self.parent = [], [], [], []
+        self.leaf_items = {}
+        self.build()
+
+    def __len__(self):
+        return len(self.item_low)
+
+    def add_node(self, parent, items):
+        node = len(self.low)
+        self.low.append(self.item_low[items].min(axis=0))
+        self.high.append(self.item_high[items].max(axis=0))
+        self.children.append((-1, -1))
+        self.parent.append(parent)
+        return node
+
+    def build(self):
+        self.low, self.high, self.children, self.parent = [], [], [], []
+        self.leaf_items = {}
+        items = numpy.arange(len(self))
+        if not len(items):
+            return
+        centers = (self.item_low + self.item_high) / 2
+        stack = [(self.add_node(-1, items), items)]
+        while stack:
+            node, items = stack.pop()
+            if len(items) <= self.leaf_size:
+                self.leaf_items[node] = items
+                self.item_leaf[items] = node
+                continue
+            spread = centers[items]
+            axis = numpy.argmax(spread.max(axis=0) - spread.min(axis=0))
+            order = numpy.argsort(spread[:, axis], kind="stable")
+            half = len(items) // 2
+            left, right = items[order[:half]], items[order[half:]]
+            children = (self.add_node(node, left), self.add_node(node, right))
+            self.children[node] = children
+            stack.append((children[0], left))
+            stack.append((children[1], right))
+        self.low = numpy.array(self.low)
+        self.high = numpy.array(self.high)
+        self.children = numpy.array(self.children)
+        self.parent = numpy.array(self.parent)
+
+    def refit_from(self, node):
+        """Recompute the box of ``node`` and of its ancestors."""
+        while node >= 0:
+            if node in self.leaf_items:
+                items = self.leaf_items[node]
+                low = self.item_low[items].min(axis=0)
+                high = self.item_high[items].max(axis=0)
+            else:
+                children = self.children[node]
+                low = self.low[children].min(axis=0)
+                high = self.high[children].max(axis=0)
+            if numpy.array_equal(low, self.low[node]) and numpy.array_equal(
+                high, self.high[node]
+            ):
+                return
+            self.low[node], self.high[node] = low, high
+            node = self.parent[node]
+
+    def update(self, item, low, high):
+        """Move an item's box, refitting the tree."""
+        self.item_low[item], self.item_high[item] = low, high
+        self.refit_from(self.item_leaf[item])
+
+    def insert(self, low, high):
+        """Add an item, returning its number."""
+        item = len(self)
+        self.item_low = numpy.concatenate([self.item_low, [low]])
+        self.item_high = numpy.concatenate([self.item_high, [high]])
+        self.item_leaf = numpy.append(self.item_leaf, 0)
+        if not len(self.low):
+            self.build()
+            return item
+        node = 0
+        while node not in self.leaf_items:
+            # descend into the child whose box grows the least
+            children = self.children[node]
+            grown = numpy.maximum(self.high[children], high) - numpy.minimum(
+                self.low[children], low
+            )
+            size = self.high[children] - self.low[children]
+            growth = grown.prod(axis=1) - size.prod(axis=1)
+            node = children[numpy.argmin(growth)]
+        self.leaf_items[node] = numpy.append(self.leaf_items[node], item)
+        self.item_leaf[item] = node
+        self.refit_from(node)
+        return item
+
+    def intersect(self, origin, direction, hit):
+        """Find the closest item for which ``hit(item)`` returns a distance.
+
+        The boxes are visited front to back and skipped once they start
+        beyond the closest distance found so far; ``hit`` returns None for a
+        miss. Returns the item and its distance, or (None, inf).
+        """
+        best, best_item = numpy.inf, None
+        if not len(self.low):
+            return best_item, best
+        origin = numpy.asarray(origin, numpy.float64)
+        direction = numpy.asarray(direction, numpy.float64)
+        enter = ray_boxes(origin, direction, self.low[:1], self.high[:1])[0]
+        stack = [(enter, 0)] if enter < numpy.inf else []
+        while stack:
+            enter, node = stack.pop()
+            if enter > best:
+                continue
+            items = self.leaf_items.get(node)
+            if items is not None:
+                enters = ray_boxes(
+                    origin, direction, self.item_low[items], self.item_high[items], best
+                )
+                for k in numpy.argsort(enters).tolist():
+                    if enters[k] > best:
+                        break
+                    distance = hit(int(items[k]))
+                    if distance is not None and distance < best:
+                        best, best_item = distance, int(items[k])
+                continue
+            children = self.children[node]
+            enters = ray_boxes(
+                origin, direction, self.low[children], self.high[children], best
+            )
+            # push the farther child first so the nearer one is visited first
+            for k in numpy.argsort(-enters).tolist():
+                if enters[k] < numpy.inf:
+                    stack.append((enters[k], int(children[k])))
+        return best_item, best
@@ -0,0 +1,131 @@
+import numpy
+from numpy.linalg import inv
+
+from transformation import perspective, translation
+
+
+def column_major(matrix):
+    """The matrix as float32 in the order glLoadMatrixf expects"""
+    return numpy.ascontiguousarray(numpy.transpose(matrix), numpy.float32)
+
+
+class Frustum:
+    """The six planes of a view frustum, and how many nodes were drawn and
+    culled against it.
+
+    The planes are taken from the rows of the combined projection and view
+    matrix, with their normals pointing inwards, so a box is outside when it
+    is entirely behind one of them.
+    """
+
+    def __init__(self, matrix):
+        rows = numpy.asarray(matrix)
+        planes = numpy.array(
+            [rows[3] + rows[i] for i in range(3)]
+            + [rows[3] - rows[i] for i in range(3)]
+        )
+        planes /= numpy.linalg.norm(planes[:, :3], axis=1)[:, None]
+        self.normals = planes[:, :3]
+        self.offsets = planes[:, 3]
+        self.abs_normals = numpy.abs(self.normals)
+        self.drawn = 0
+        self.culled = 0
+
+    def intersects(self, low, high):
+        """Return which of the boxes between the (N, 3) corners ``low`` and
+        ``high`` are at least partly inside the frustum."""
+        center = (low + high) / 2
+        extent = (high - low) / 2
+        # the signed distance of the corner furthest along each normal
+        reach = (
+            numpy.dot(center, self.normals.T)
+            + numpy.dot(extent, self.abs_normals.T)
+            + self.offsets
+        )
+        return numpy.all(reach >= 0, axis=-1)
+
+    def visible(self, node):
+        """Whether ``node`` needs to be drawn, counting it as drawn or culled"""
+        bounds = node.world_bounds
+        if bounds is None or self.intersects(*bounds):
+            self.drawn += 1
+            return True
+        self.culled += 1
+        return False
+
+
+class Camera:
+    """The projection and view matrices of the viewer and their inverses.
+
+    They are kept on the CPU so that neither rendering nor picking has to
+    read them back from GL. The projection looks down -z from ``distance``
+    units away. The view is the trackball rotation after the interaction's
+    translation. Each is only recomputed when its inputs change.
+    """
+
+    def __init__(self, fov_y=70.0, near=0.1, far=1000.0, distance=15.0):
+        self.fov_y = fov_y
+        self.near = near
+        self.far = far
+        self.distance = distance
+        self.width = self.height = None
+        self.view_translation = None
+        self.view_rotation = None
+        self.resize(640, 480)
+        self.look((0.0, 0.0, 0.0), numpy.identity(4))
+
+    def resize(self, width, height):
+        """Update the projection for a viewport of width by height pixels."""
+        if (width, height) == (self.width, self.height):
+            return
+        self.width, self.height = width, height
+        self.projection = numpy.dot(
+            perspective(self.fov_y, width / height, self.near, self.far),
+            translation([0.0, 0.0, -self.distance]),
+        )
+        self.projection_inverse = inv(self.projection)
+        self.gl_projection = column_major(self.projection)
+
+    def look(self, view_translation, rotation):
+        """Update the view for a translation and a rotation, given as a 4x4
+        matrix or as 16 floats in column-major order like the trackball's."""
+        view_translation = tuple(view_translation[:3])
+        if view_translation == self.view_translation and rotation is self.view_rotation:
+            return
+        self.view_translation = view_translation
+        self.view_rotation = rotation
+        if not isinstance(rotation, numpy.ndarray):
+            rotation = numpy.transpose(numpy.reshape(list(rotation), (4, 4)))
+        self.view = numpy.dot(translation(view_translation), rotation)
+        self.view_inverse = inv(self.view)
+        self.gl_view = column_major(self.view)
+
+    def frustum(self):
+        """The view frustum in scene coordinates"""
+        return Frustum(numpy.dot(self.projection, self.view))
+
+    def projected_sizes(self, centers, radii):
+        """The on-screen diameters in pixels of spheres with (N, 3) scene
+        coordinate ``centers`` and ``radii``, which are infinite for spheres
+        around the eye"""
+        eye = numpy.dot(centers, self.view[:3, :3].T) + self.view[:3, 3]
+        eye[:, 2] -= self.distance
+        distances = numpy.linalg.norm(eye, axis=1)
+        half_height = numpy.tan(numpy.radians(self.fov_y) / 2) * distances
+        with numpy.errstate(divide="ignore"):
+            sizes = radii / half_height * self.height
+        return numpy.where(distances > radii, sizes, numpy.inf)
+
+    def ray(self, x, y):
+        """Return the start on the near plane and the unit direction of the
+        ray through window coordinates x, y, in view coordinates.
+
+        This is what gluUnProject of window depths 0.001 and 0.999 gives with
+        an identity modelview matrix."""
+        ndc_x = 2.0 * x / self.width - 1.0
+        ndc_y = 2.0 * y / self.height - 1.0
+        points = numpy.array([[ndc_x, ndc_y, -0.998, 1.0], [ndc_x, ndc_y, 0.998, 1.0]])
+        points = numpy.dot(points, numpy.transpose(self.projection_inverse))
+        start, end = points[:, :3] / points[:, 3:]
+        direction = end - start
+        return start, direction / numpy.linalg.norm(direction)
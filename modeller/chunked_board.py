@@ -0,0 +1,184 @@
+import math
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from board_map import BoardMap
+from board_state import BoardState
+from node import Board, BoardMesh
+
+
+class ChunkedBoardState:
+    """The sphere states of a ``ChunkedBoard``, one ``BoardState`` per chunk.
+
+    The state of a chunk is made when the chunk is first needed and kept
+    when its mesh is evicted, so only the chunks that have been visited take
+    memory. The "marked" callbacks of the chunk states are forwarded.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.chunks = {}  # (ci, cj) -> BoardState
+        self.marked_count = 0
+        self.total = None
+        self.callbacks = defaultdict(list)
+
+    def __len__(self):
+        if self.total is None:
+            # spheres are on the cells of map[1:, 1:]
+            self.total = self.board.board_map.count(1, 1)
+        return self.total
+
+    @property
+    def unmarked_count(self):
+        return len(self) - self.marked_count
+
+    def register_callback(self, name, func):
+        """registers a callback for a certain event"""
+        self.callbacks[name].append(func)
+
+    def trigger(self, name, *args, **kwargs):
+        """calls a callback, forwards the args"""
+        for func in self.callbacks[name]:
+            func(*args, **kwargs)
+
+    def chunk(self, key):
+        state = self.chunks.get(key)
+        if state is None:
+            board = self.board
+            state = BoardState(board.chunk_spheres(key), board.origin, board.cell_size)
+            state.register_callback("marked", self.chunk_marked)
+            self.chunks[key] = state
+        return state
+
+    def chunk_marked(self, state, reached):
+        self.marked_count += len(reached)
+        self.trigger("marked", state, reached)
+
+    def move(self, center):
+        for key in self.board.chunks_around(center, BoardState.REACH):
+            self.chunk(key).move(center)
+
+
+class ChunkedBoard(Board):
+    """A board over a ``BoardMap`` too large to build as a single mesh.
+
+    The board is cut into square chunks of ``chunk_size`` cells. A chunk is
+    built when it first comes within VISIBLE_RADIUS of the center and kept in
+    a least recently used cache of at most ``max_chunks`` chunks. While the
+    board moves, the chunks ahead of the center are built on a worker thread
+    before they are needed. Chunks being built count toward ``max_chunks``
+    too, and are dropped once the center has moved away from them.
+    """
+
+    def __init__(self, board_map, cell_size=1.0, chunk_size=32, max_chunks=64):
+        self.board_map = board_map
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()  # (ci, cj) -> BoardMesh, least recent first
+        self.pending = {}  # (ci, cj) -> Future of a BoardMesh
+        self.pool = None
+        # The number of cells is width + 1 by height + 1, as in Board.from_map
+        super().__init__((board_map.width + 1, board_map.height + 1), cell_size)
+
+    def init_cells(self, map):
+        # chunks are built on demand
+        self.state = ChunkedBoardState(self)
+
+    def chunks_around(self, center, radius):
+        """The keys of the chunks within ``radius`` of ``center``"""
+        size = self.chunk_size * self.cell_size
+        columns = -(-self.board_size[0] // self.chunk_size)
+        rows = -(-self.board_size[1] // self.chunk_size)
+        x, z = center[0] - self.origin[0], center[2] - self.origin[1]
+        ci0 = max(math.floor((x - radius) / size), 0)
+        ci1 = min(math.floor((x + radius) / size) + 1, columns)
+        cj0 = max(math.floor((z - radius) / size), 0)
+        cj1 = min(math.floor((z + radius) / size) + 1, rows)
+        return [(ci, cj) for ci in range(ci0, ci1) for cj in range(cj0, cj1)]
+
+    def chunk_cells(self, key):
+        """The first cell and the shape of a chunk"""
+        i0, j0 = key[0] * self.chunk_size, key[1] * self.chunk_size
+        width = min(self.chunk_size, self.board_size[0] - i0)
+        height = min(self.chunk_size, self.board_size[1] - j0)
+        return (i0, j0), (width, height)
+
+    def chunk_spheres(self, key):
+        """The (N, 2) board cells of the spheres in a chunk"""
+        (i0, j0), (width, height) = self.chunk_cells(key)
+        # a sphere is on cell (i, j) for i, j >= 2 where map[j - 1][i - 1] != 0
+        spheres = self.board_map.region(
+            i0 - 1, i0 - 1 + width, j0 - 1, j0 - 1 + height
+        ).T
+        spheres[: max(2 - i0, 0)] = False
+        spheres[:, : max(2 - j0, 0)] = False
+        return numpy.argwhere(spheres) + (i0, j0)
+
+    def build_chunk(self, key):
+        """Build the mesh of a chunk. Safe to call from worker threads."""
+        first, shape = self.chunk_cells(key)
+        return BoardMesh(self.origin, self.cell_size, first, shape)
+
+    def chunk(self, key):
+        """Return the mesh of a chunk, building it if it is not cached."""
+        mesh = self.chunks.get(key)
+        if mesh is not None:
+            self.chunks.move_to_end(key)
+            return mesh
+        future = self.pending.pop(key, None)
+        mesh = future.result() if future is not None else self.build_chunk(key)
+        mesh.set_state(self.state.chunk(key))
+        self.chunks[key] = mesh
+        self.evict()
+        return mesh
+
+    def evict(self):
+        """Drop the least recently used chunks over ``max_chunks``, counting
+        the chunks being built"""
+        while self.chunks and len(self.chunks) + len(self.pending) > self.max_chunks:
+            self.chunks.popitem(last=False)
+
+    def prefetch(self, direction):
+        """Start building the chunks a chunk ahead of the center."""
+        length = numpy.linalg.norm(direction)
+        if length == 0:
+            return
+        ahead = self.center + direction / length * self.chunk_size * self.cell_size
+        wanted = self.chunks_around(ahead, self.VISIBLE_RADIUS)
+        # the chunks no longer ahead or around the center are not needed
+        near = set(wanted).union(self.chunks_around(self.center, self.VISIBLE_RADIUS))
+        for key in [key for key in self.pending if key not in near]:
+            self.pending.pop(key).cancel()
+        for key in wanted:
+            if key in self.chunks or key in self.pending:
+                continue
+            if len(self.pending) >= self.max_chunks:
+                break
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=1)
+            self.pending[key] = self.pool.submit(self.build_chunk, key)
+        self.evict()
+
+    def visible_meshes(self):
+        return [
+            self.chunk(key)
+            for key in self.chunks_around(self.center, self.VISIBLE_RADIUS)
+        ]
+
+    def translate_and_adjust_center(self, translation_vec):
+        super().translate_and_adjust_center(translation_vec)
+        # the center moves the opposite way of the board, which during a
+        # forward move_board is away from get_forward_direction()
+        self.prefetch(-numpy.asarray(translation_vec, numpy.float64))
+
+    @classmethod
+    def from_map(cls, path=None, **kwargs):
+        if path is None:
+            from board_config import map
+
+            board_map = BoardMap.from_text(map)
+        else:
+            board_map = BoardMap.load(path)
+        return cls(board_map, **kwargs)
@@ -0,0 +1,117 @@
+import math
+from collections import defaultdict
+
+import numpy
+
+# the most cells a box is hashed into; bigger boxes are tested against all
+MAX_CELLS = 64
+
+
+def obb_overlaps(center, axes, half, centers, other_axes, halves):
+    """Separating axis test of one oriented box against K others.
+
+    A box is its center, the unit axes as the rows of a 3x3 matrix and its
+    half extents along them; the others are given as (K, 3), (K, 3, 3) and
+    (K, 3) arrays. Returns which of the others overlap the box. Boxes that
+    only touch do not overlap.
+    """
+    count = len(centers)
+    crosses = numpy.cross(axes[None, :, None, :], other_axes[:, None, :, :])
+    crosses = crosses.reshape(count, 9, 3)
+    lengths = numpy.linalg.norm(crosses, axis=2)
+    # the cross products of (nearly) parallel axes separate nothing that the
+    # face axes do not, so they are left out
+    valid = numpy.concatenate([numpy.ones((count, 6), bool), lengths > 1e-6], axis=1)
+    crosses /= numpy.maximum(lengths, 1e-6)[:, :, None]
+    tests = numpy.concatenate(
+        [numpy.broadcast_to(axes, (count, 3, 3)), other_axes, crosses], axis=1
+    )
+    distance = numpy.abs(numpy.einsum("kj,kaj->ka", centers - center, tests))
+    reach = numpy.abs(numpy.einsum("ij,kaj->kai", axes, tests)).dot(half)
+    projections = numpy.einsum("kij,kaj->kai", other_axes, tests)
+    other_reach = numpy.einsum("kai,ki->ka", numpy.abs(projections), halves)
+    separated = valid & (distance >= reach + other_reach - 1e-9)
+    return ~numpy.any(separated, axis=1)
+
+
+class SpatialHash:
+    """The boxes of numbered items, hashed by the grid cells they cover.
+
+    The items near a box are those in the cells it covers, found without
+    looking at the rest. Moving an item only rehashes it when it moved into
+    other cells. Boxes covering more than MAX_CELLS cells are kept apart and
+    returned by every query.
+    """
+
+    def __init__(self, cell_size=2.0):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)  # (i, j, k) -> items
+        self.ranges = {}  # item -> (first cell, last cell), or None if large
+        self.large = set()
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def cell_range(self, low, high):
+        first = numpy.floor(numpy.divide(low, self.cell_size)).astype(int)
+        last = numpy.floor(numpy.divide(high, self.cell_size)).astype(int)
+        return tuple(first.tolist()), tuple(last.tolist())
+
+    def keys(self, first, last):
+        return [
+            (i, j, k)
+            for i in range(first[0], last[0] + 1)
+            for j in range(first[1], last[1] + 1)
+            for k in range(first[2], last[2] + 1)
+        ]
+
+    def insert(self, item, low, high):
+        self.add(item, *self.cell_range(low, high))
+
+    def insert_many(self, items, low, high):
+        """Insert the items with the (N, 3) corners ``low`` and ``high``"""
+        first = numpy.floor(low / self.cell_size).astype(int).tolist()
+        last = numpy.floor(high / self.cell_size).astype(int).tolist()
+        for item, a, b in zip(numpy.asarray(items).tolist(), first, last):
+            self.add(item, tuple(a), tuple(b))
+
+    def add(self, item, first, last):
+        if math.prod(b - a + 1 for a, b in zip(first, last)) > MAX_CELLS:
+            self.ranges[item] = None
+            self.large.add(item)
+            return
+        self.ranges[item] = (first, last)
+        if first == last:
+            self.cells[first].add(item)
+            return
+        for key in self.keys(first, last):
+            self.cells[key].add(item)
+
+    def remove(self, item):
+        cells = self.ranges.pop(item, None)
+        if cells is None:
+            self.large.discard(item)
+            return
+        for key in self.keys(*cells):
+            self.cells[key].discard(item)
+            if not self.cells[key]:
+                del self.cells[key]
+
+    def update(self, item, low, high):
+        if self.ranges.get(item) == self.cell_range(low, high):
+            return
+        self.remove(item)
+        self.insert(item, low, high)
+
+    def query(self, low, high):
+        """The items that may overlap the box between ``low`` and ``high``"""
+        first, last = self.cell_range(low, high)
+        found = set(self.large)
+        if math.prod(b - a + 1 for a, b in zip(first, last)) > MAX_CELLS:
+            found.update(self.ranges)
+            return found
+        for key in self.keys(first, last):
+            items = self.cells.get(key)
+            if items:
+                found.update(items)
+        return found
@@ -0,0 +1,97 @@
+import numpy
+
+
+class HalfEdgeMesh:
+    """Half-edge connectivity of a triangle mesh, stored in NumPy arrays.
+
+    Half-edge ``h = 3 * f + k`` runs from corner k to corner k + 1 of triangle
+    f, so the face, next and previous half-edges follow from the index itself.
+    Twins are found by sorting the directed edge keys instead of building a
+    dictionary, which keeps the construction vectorized for large meshes.
+    A twin of -1 marks a boundary (or non-manifold) edge.
+    """
+
+    def __init__(self, triangles, vertex_count=None):
+        triangles = numpy.asarray(triangles).reshape(-1, 3)
+        if vertex_count is None:
+            vertex_count = int(triangles.max()) + 1 if len(triangles) else 0
+        count = 3 * len(triangles)
+        index = numpy.int32 if max(count, vertex_count) < 2**31 else numpy.int64
+        self.vertex_count = vertex_count
+
+        h = numpy.arange(count, dtype=index)
+        corner = h % 3
+        self.vertex = triangles.reshape(-1).astype(index)
+        self.face = h // 3
+        self.next = h - corner + (corner + 1) % 3
+        self.prev = h - corner + (corner + 2) % 3
+
+        origin = self.vertex.astype(numpy.int64)
+        dest = origin[self.next]
+        keys = origin * vertex_count + dest
+        order = numpy.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        found = numpy.searchsorted(sorted_keys, dest * vertex_count + origin)
+        found = numpy.minimum(found, max(count - 1, 0))
+        twin = numpy.where(
+            sorted_keys[found] == dest * vertex_count + origin, order[found], -1
+        ).astype(index)
+        # edges shared by more than two triangles do not pair up consistently
+        paired = twin >= 0
+        paired[paired] = twin[twin[paired]] == h[paired]
+        self.twin = numpy.where(paired, twin, -1).astype(index)
+
+        # one outgoing half-edge per vertex, a boundary one where there is one
+        # so that walking the fan from it covers the whole fan
+        self.vertex_halfedge = numpy.full(vertex_count, -1, index)
+        self.vertex_halfedge[self.vertex] = h
+        boundary = self.twin < 0
+        self.vertex_halfedge[self.vertex[boundary]] = h[boundary]
+
+    def __len__(self):
+        return len(self.vertex)
+
+    def dest(self, h):
+        return self.vertex[self.next[h]]
+
+    def is_boundary(self, h):
+        return self.twin[h] < 0
+
+    def outgoing(self, v):
+        """Iterate over the half-edges leaving vertex v."""
+        start = h = int(self.vertex_halfedge[v])
+        while h >= 0:
+            yield h
+            h = int(self.twin[self.prev[h]])
+            if h == start:
+                return
+
+    def neighbours(self, v):
+        """Iterate over the vertices sharing an edge with v."""
+        for h in self.outgoing(v):
+            yield int(self.dest(h))
+            if self.twin[self.prev[h]] < 0:
+                # the last edge of an open fan is only reachable as incoming
+                yield int(self.vertex[self.prev[h]])
+
+    def faces_around(self, v):
+        """Iterate over the faces using vertex v."""
+        for h in self.outgoing(v):
+            yield int(self.face[h])
+
+    def edges(self):
+        """Return an (E, 2) array with every undirected edge once."""
+        once = (self.twin < 0) | (numpy.arange(len(self)) < self.twin)
+        h = numpy.flatnonzero(once)
+        return numpy.stack([self.vertex[h], self.dest(h)], axis=1)
+
+    def boundary_halfedges(self):
+        return numpy.flatnonzero(self.twin < 0)
+
+    def boundary_vertices(self):
+        """Return a (vertex_count,) mask of the vertices on a boundary edge."""
+        mask = numpy.zeros(self.vertex_count, bool)
+        h = self.boundary_halfedges()
+        mask[self.vertex[h]] = True
+        mask[self.dest(h)] = True
+        return mask
@@ -0,0 +1,265 @@
+import ctypes
+
+import numpy
+from OpenGL.GL import (
+    GL_ARRAY_BUFFER,
+    GL_COMPILE_STATUS,
+    GL_DYNAMIC_DRAW,
+    GL_ELEMENT_ARRAY_BUFFER,
+    GL_FALSE,
+    GL_FLOAT,
+    GL_FRAGMENT_SHADER,
+    GL_LINK_STATUS,
+    GL_STATIC_DRAW,
+    GL_TRIANGLES,
+    GL_UNSIGNED_INT,
+    GL_VERTEX_SHADER,
+    glAttachShader,
+    glBindBuffer,
+    glBufferData,
+    glBufferSubData,
+    glCompileShader,
+    glCreateProgram,
+    glCreateShader,
+    glDeleteBuffers,
+    glDeleteProgram,
+    glDisableVertexAttribArray,
+    glDrawElementsInstanced,
+    glEnableVertexAttribArray,
+    glGenBuffers,
+    glGetProgramInfoLog,
+    glGetProgramiv,
+    glGetShaderInfoLog,
+    glGetShaderiv,
+    glLinkProgram,
+    glShaderSource,
+    glUseProgram,
+    glVertexAttribDivisor,
+    glVertexAttribPointer,
+)
+
+import color
+from primitive import G_OBJ_CUBE, G_OBJ_SPHERE, cube_mesh, sphere_mesh
+
+# Lit like the fixed pipeline draws the primitives: GL_LIGHT0 and the light
+# model ambient, the material ambient and diffuse colors following the color
+# and an emission of 0.3 for selected nodes. Normals are not renormalized,
+# as GL_NORMALIZE is off.
+VERTEX_SHADER = """
+#version 330 compatibility
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 normal;
+layout(location = 2) in mat4 model;
+layout(location = 6) in mat3 model_normal;
+layout(location = 9) in vec3 color;
+layout(location = 10) in float selected;
+out vec4 shade;
+
+void main() {
+    mat4 modelview = gl_ModelViewMatrix * model;
+    vec3 n = gl_NormalMatrix * (model_normal * normal);
+    vec3 light = normalize(gl_LightSource[0].position.xyz);
+    vec3 ambient = gl_LightModel.ambient.rgb + gl_LightSource[0].ambient.rgb;
+    vec3 diffuse = gl_LightSource[0].diffuse.rgb * max(dot(n, light), 0.0);
+    shade = vec4(vec3(0.3 * selected) + color * (ambient + diffuse), 1.0);
+    gl_Position = gl_ProjectionMatrix * modelview * vec4(position, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330 compatibility
+in vec4 shade;
+out vec4 frag_color;
+
+void main() {
+    frag_color = shade;
+}
+"""
+
+# the floats of an instance: its column-major world matrix, the matrix for
+# its normals (the inverse transpose of the world matrix's upper 3x3, also
+# column-major), its color and whether it is selected
+INSTANCE_FLOATS = 29
+
+
+def compile_program(sources):
+    program = glCreateProgram()
+    for kind, source in sources:
+        shader = glCreateShader(kind)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(glGetShaderInfoLog(shader).decode())
+        glAttachShader(program, shader)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(glGetProgramInfoLog(program).decode())
+    return program
+
+
+class InstanceBatch:
+    """The instances of one geometry, drawn with a single instanced call.
+
+    Every node has a slot in a float32 array of instance data that is copied
+    to a buffer. Only the slots of nodes that changed since the last draw are
+    copied again, in runs of neighbouring slots.
+    """
+
+    def __init__(self, vertices, normals, triangles, capacity=64):
+        self.vertices = numpy.ascontiguousarray(
+            numpy.concatenate([vertices, normals], axis=1), numpy.float32
+        )
+        self.indices = numpy.ascontiguousarray(triangles.ravel(), numpy.uint32)
+        self.count = 0
+        self.slots = {}  # node -> slot
+        self.data = numpy.zeros((capacity, INSTANCE_FLOATS), numpy.float32)
+        self.dirty = set()
+        self.mesh_buffer = None
+        self.index_buffer = None
+        self.instance_buffer = None
+        self.buffer_capacity = 0
+
+    def update(self, nodes):
+        """Set the instance data of the nodes, adding those that are new"""
+        slots = []
+        for node in nodes:
+            slot = self.slots.get(node)
+            if slot is None:
+                slot = self.slots[node] = self.count
+                self.count += 1
+            slots.append(slot)
+        if self.count > len(self.data):
+            capacity = max(self.count, 2 * len(self.data))
+            self.data = numpy.resize(self.data, (capacity, INSTANCE_FLOATS))
+        matrices = numpy.array([node.world_matrix for node in nodes])
+        rows = self.data[slots]
+        rows[:, :16] = numpy.transpose(matrices, (0, 2, 1)).reshape(-1, 16)
+        rows[:, 16:25] = numpy.linalg.inv(matrices[:, :3, :3]).reshape(-1, 9)
+        rows[:, 25:28] = [color.COLORS[node.color_index] for node in nodes]
+        rows[:, 28] = [node.selected for node in nodes]
+        self.data[slots] = rows
+        self.dirty.update(slots)
+
+    def upload(self):
+        if self.mesh_buffer is None:
+            self.mesh_buffer, self.index_buffer, self.instance_buffer = glGenBuffers(3)
+            glBindBuffer(GL_ARRAY_BUFFER, self.mesh_buffer)
+            glBufferData(GL_ARRAY_BUFFER, self.vertices, GL_STATIC_DRAW)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices, GL_STATIC_DRAW)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        if self.buffer_capacity < len(self.data):
+            self.buffer_capacity = len(self.data)
+            glBufferData(GL_ARRAY_BUFFER, self.data, GL_DYNAMIC_DRAW)
+            self.dirty.clear()
+            return
+        slots = numpy.array(sorted(self.dirty), int)
+        self.dirty.clear()
+        if not len(slots):
+            return
+        # copy runs of consecutive slots at once
+        breaks = numpy.flatnonzero(numpy.diff(slots) != 1) + 1
+        starts = slots[numpy.concatenate([[0], breaks])]
+        ends = slots[numpy.concatenate([breaks - 1, [len(slots) - 1]])] + 1
+        row = INSTANCE_FLOATS * 4
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            glBufferSubData(
+                GL_ARRAY_BUFFER, start * row, (end - start) * row, self.data[start:end]
+            )
+
+    def draw(self):
+        if not self.count:
+            return
+        self.upload()
+        glBindBuffer(GL_ARRAY_BUFFER, self.mesh_buffer)
+        for location, offset in ((0, 0), (1, 12)):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(
+                location, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(offset)
+            )
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        stride = INSTANCE_FLOATS * 4
+        # a matrix takes a location for every column
+        for location, size, offset in (
+            (2, 4, 0),
+            (3, 4, 16),
+            (4, 4, 32),
+            (5, 4, 48),
+            (6, 3, 64),
+            (7, 3, 76),
+            (8, 3, 88),
+            (9, 3, 100),
+            (10, 1, 112),
+        ):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(
+                location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset)
+            )
+            glVertexAttribDivisor(location, 1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glDrawElementsInstanced(
+            GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, None, self.count
+        )
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        for location in range(11):
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def free(self):
+        if self.mesh_buffer is not None:
+            glDeleteBuffers(
+                3, [self.mesh_buffer, self.index_buffer, self.instance_buffer]
+            )
+            self.mesh_buffer = self.index_buffer = self.instance_buffer = None
+            self.buffer_capacity = 0
+            self.dirty = set(range(self.count))
+
+
+class InstancedRenderer:
+    """Draws Sphere and Cube nodes grouped by geometry, one instanced draw
+    call for each, with a GLSL 3.30 shader that lights them like the fixed
+    pipeline. The shader reads the current modelview and projection matrices
+    and GL_LIGHT0, so it draws in the same place and light as glCallList
+    would. The instance data of nodes is set by ``update`` after they changed.
+    """
+
+    def __init__(self):
+        self.batches = {
+            G_OBJ_SPHERE: InstanceBatch(*sphere_mesh()),
+            G_OBJ_CUBE: InstanceBatch(*cube_mesh()),
+        }
+        self.program = None
+
+    def holds(self, node):
+        """Whether the node is drawn as an instance"""
+        return getattr(node, "call_list", None) in self.batches
+
+    def update(self, nodes):
+        """Set the instance data of changed nodes"""
+        groups = {}
+        for node in nodes:
+            groups.setdefault(node.call_list, []).append(node)
+        for call_list, group in groups.items():
+            self.batches[call_list].update(group)
+
+    def render(self):
+        if self.program is None:
+            self.program = compile_program(
+                [
+                    (GL_VERTEX_SHADER, VERTEX_SHADER),
+                    (GL_FRAGMENT_SHADER, FRAGMENT_SHADER),
+                ]
+            )
+        glUseProgram(self.program)
+        for batch in self.batches.values():
+            batch.draw()
+        glUseProgram(0)
+
+    def free(self):
+        for batch in self.batches.values():
+            batch.free()
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
@@ -0,0 +1,30 @@
+import numpy
+
+
+class LevelOfDetail:
+    """Picks the level of detail of spheres and cubes by their size on screen.
+
+    A sphere at least ``thresholds[0]`` pixels across is drawn at level 0,
+    the finest, one at least ``thresholds[1]`` at level 1 and so on. To keep
+    nodes near a threshold from switching back and forth as the camera
+    moves, a node only becomes coarser once it is ``hysteresis`` below the
+    threshold, and finer once it is as much above it.
+    """
+
+    def __init__(self, camera, thresholds=(80.0, 30.0, 12.0), hysteresis=0.15):
+        self.camera = camera
+        self.thresholds = numpy.asarray(thresholds)
+        self.hysteresis = hysteresis
+
+    def levels(self, sizes, threshold_scale=1.0):
+        """The levels of spheres ``sizes`` pixels across"""
+        thresholds = self.thresholds * threshold_scale
+        return (numpy.asarray(sizes)[:, None] < thresholds).sum(axis=1)
+
+    def select(self, centers, radii, levels):
+        """The new levels of the spheres with (N, 3) ``centers`` and ``radii``
+        in scene coordinates, drawn at ``levels`` so far"""
+        sizes = self.camera.projected_sizes(centers, radii)
+        finest = self.levels(sizes, 1.0 - self.hysteresis)
+        coarsest = self.levels(sizes, 1.0 + self.hysteresis)
+        return numpy.clip(levels, finest, coarsest)
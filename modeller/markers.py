@@ -0,0 +1,114 @@
+import numpy
+from OpenGL.GL import (
+    GL_COMPILE_AND_EXECUTE,
+    glCallList,
+    glColor3fv,
+    glDeleteLists,
+    glEndList,
+    glGenLists,
+    glMultMatrixf,
+    glNewList,
+    glPopMatrix,
+    glPushMatrix,
+)
+
+import color
+from primitive import DETAIL_LISTS, G_OBJ_SPHERE
+
+
+class MarkerRenderer:
+    """Draws many spheres of the same size without a node for each one.
+
+    The markers are kept in preallocated arrays that only grow: the position
+    and color of every marker, and a batch of column-major model matrices
+    ready for ``glMultMatrixf``. The markers are drawn with the shared sphere
+    display list from a display list of their own, which is only recompiled
+    after the markers changed, so drawing an unchanged batch is a single
+    ``glCallList``. Every marker has a level of detail for its sphere, 0
+    (the finest) until ``set_details`` changes it. Markers cleared and added
+    back at the same position keep their level.
+    """
+
+    def __init__(self, scale=0.5, lift=0.15, capacity=64):
+        self.scale = scale
+        self.lift = lift
+        self.count = 0
+        self.dirty = True
+        self.gl_list = None
+        self.previous = {}  # position bytes -> level of a cleared marker
+        self.palette = numpy.array(
+            [color.COLORS[i] for i in range(len(color.COLORS))], numpy.float32
+        )
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        positions = numpy.zeros((capacity, 3), numpy.float32)
+        colors = numpy.zeros((capacity, 3), numpy.float32)
+        details = numpy.zeros(capacity, numpy.int64)
+        if self.count:
+            positions[: self.count] = self.positions[: self.count]
+            colors[: self.count] = self.colors[: self.count]
+            details[: self.count] = self.details[: self.count]
+        self.positions, self.colors, self.details = positions, colors, details
+        # the transpose of translation(position) . scaling(scale)
+        self.matrices = numpy.zeros((capacity, 4, 4), numpy.float32)
+        self.matrices[:, [0, 1, 2], [0, 1, 2]] = self.scale
+        self.matrices[:, 3, 3] = 1.0
+        # views of every row, made once so that drawing makes no new arrays
+        self.matrix_rows = list(self.matrices)
+        self.color_rows = list(self.colors)
+
+    def clear(self):
+        count = self.count
+        self.previous = dict(
+            zip(map(bytes, self.positions[:count]), self.details[:count].tolist())
+        )
+        self.count = 0
+        self.dirty = True
+
+    def extend(self, positions, color_indices):
+        """Add markers standing on ``positions``."""
+        count = self.count + len(positions)
+        if count > len(self.positions):
+            self.allocate(max(count, 2 * len(self.positions)))
+        self.positions[self.count : count] = positions
+        self.colors[self.count : count] = self.palette[color_indices]
+        self.details[self.count : count] = [
+            self.previous.get(bytes(position), 0)
+            for position in self.positions[self.count : count]
+        ]
+        self.count = count
+        self.dirty = True
+
+    def set_details(self, details):
+        """Draw the markers at the levels of detail ``details``"""
+        if numpy.array_equal(self.details[: self.count], details):
+            return
+        self.details[: self.count] = details
+        self.dirty = True
+
+    def render(self):
+        if not self.dirty:
+            glCallList(self.gl_list)
+            return
+        count = self.count
+        self.matrices[:count, 3, :3] = self.positions[:count]
+        self.matrices[:count, 3, 1] += self.lift
+        if self.gl_list is None:
+            self.gl_list = glGenLists(1)
+        spheres = DETAIL_LISTS[G_OBJ_SPHERE]
+        details = self.details[:count].tolist()
+        glNewList(self.gl_list, GL_COMPILE_AND_EXECUTE)
+        for k in range(count):
+            glPushMatrix()
+            glMultMatrixf(self.matrix_rows[k])
+            glColor3fv(self.color_rows[k])
+            glCallList(spheres[details[k]])
+            glPopMatrix()
+        glEndList()
+        self.dirty = False
+
+    def free(self):
+        if self.gl_list is not None:
+            glDeleteLists(self.gl_list, 1)
+            self.gl_list = None
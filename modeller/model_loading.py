@@ -4,6 +4,10 @@
 # GL_LINES not showing up on top of cube?
 # https://stackoverflow.com/questions/56624147/gl-lines-not-showing-up-on-top-of-cube/56624975#56624975
 
+import sys
+import time
+
+import numpy
 import pygame
 from OpenGL.GL import (
     GL_COLOR_BUFFER_BIT,
@@ -11,21 +15,49 @@ from OpenGL.GL import (
     GL_FILL,
     GL_FRONT_AND_BACK,
     GL_LINE,
+    GL_LINES,
     GL_MODELVIEW,
     GL_PROJECTION,
+    glBegin,
     glClear,
+    glColor3f,
+    glEnd,
+    glLoadIdentity,
+    glLoadMatrixf,
     glMatrixMode,
+    glMultMatrixf,
     glPolygonMode,
     glPopMatrix,
     glPushMatrix,
-    glRotate,
-    glScale,
-    glTranslate,
-    glTranslatef,
+    glVertex3f,
 )
-from OpenGL.GLU import gluPerspective
 
-from objloader import WavefrontObj
+from camera import Camera, column_major
+from objloader import AsyncLoader
+from transformation import rotation_y, scaling, translation
+
+
+def render_box(box):
+    """Draw the 12 edges of an axis aligned box"""
+    low, high = box
+    corners = [
+        (x, y, z)
+        for x in (low[0], high[0])
+        for y in (low[1], high[1])
+        for z in (low[2], high[2])
+    ]
+    glColor3f(1.0, 1.0, 1.0)
+    glBegin(GL_LINES)
+    for i in range(8):
+        for bit in (1, 2, 4):
+            if not i & bit:
+                glVertex3f(*corners[i])
+                glVertex3f(*corners[i | bit])
+    glEnd()
+
+
+start_time = time.perf_counter()
+metrics = {}
 
 pygame.init()
 display = (640, 480)
@@ -33,21 +65,20 @@ display = (640, 480)
 pygame.display.set_mode(display, pygame.DOUBLEBUF | pygame.OPENGL)
 clock = pygame.time.Clock()
 
-model = WavefrontObj("models/cheburashka.obj")
-model.compile()
-box = model.box()
-center = [(box[0][i] + box[1][i]) / 2 for i in range(3)]
-size = [box[1][i] - box[0][i] for i in range(3)]
-max_size = max(size)
+filename = sys.argv[1] if len(sys.argv) > 1 else "models/cheburashka.obj"
+loader = AsyncLoader(filename, lods=True).start()
 distance = 10
-scale = distance / max_size
 angle = 0
 
+# looking down -z from distance units away, as gluPerspective followed by
+# glTranslatef(0, 0, -distance) did
+camera = Camera(fov_y=90, far=distance * 2, distance=distance)
+camera.resize(*display)
 glMatrixMode(GL_PROJECTION)
-gluPerspective(90, (display[0] / display[1]), 0.1, distance * 2)
+glLoadMatrixf(camera.gl_projection)
 
 glMatrixMode(GL_MODELVIEW)
-glTranslatef(0.0, 0, -distance)
+glLoadIdentity()
 
 run = True
 while run:
@@ -56,21 +87,45 @@ while run:
         if event.type == pygame.QUIT:
             run = False
 
+    loader.poll()
+
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-    glPushMatrix()
-    glRotate(angle, 0, 1, 0)
-    glScale(scale, scale, scale)
-    glTranslate(-center[0], -center[1], -center[2])
-    glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-    model.render()
+    if loader.bounds is not None:
+        box = loader.bounds
+        center = [(box[0][i] + box[1][i]) / 2 for i in range(3)]
+        size = [box[1][i] - box[0][i] for i in range(3)]
+        scale = distance / max(max(size), 1e-6)
 
-    glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
-    model.render()
-    glPopMatrix()
-    angle += 1
+        matrix = numpy.dot(
+            numpy.dot(rotation_y(numpy.radians(angle)), scaling([scale] * 3)),
+            translation([-c for c in center]),
+        )
+        glPushMatrix()
+        glMultMatrixf(column_major(matrix))
+        if loader.done:
+            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+            loader.render(camera, matrix)
+        else:
+            render_box(box)
+
+        glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+        loader.render(camera, matrix)
+        glPopMatrix()
+        angle += 1
 
     pygame.display.flip()
 
+    now = time.perf_counter() - start_time
+    metrics.setdefault("first frame", now)
+    if loader.bounds is not None:
+        metrics.setdefault("bounding box", now)
+    if loader.parts or loader.done:
+        metrics.setdefault("first geometry", now)
+    if loader.done and "fully loaded" not in metrics:
+        metrics["fully loaded"] = now
+        for name, seconds in metrics.items():
+            print("time to %s: %.3f s" % (name, seconds))
+
 pygame.quit()
 quit()
@@ -1,51 +1,266 @@
+import math
 import random
 from typing import Literal
 
 import numpy
 from OpenGL.GL import (
+    GL_COLOR_ARRAY,
+    GL_COMPILE_AND_EXECUTE,
     GL_EMISSION,
+    GL_FLOAT,
     GL_FRONT,
+    GL_LIGHTING,
+    GL_QUADS,
+    GL_UNSIGNED_INT,
+    GL_VERTEX_ARRAY,
     glCallList,
     glColor3f,
+    glColor3ub,
+    glColorPointer,
+    glDeleteLists,
+    glDisable,
+    glDisableClientState,
+    glDrawElements,
+    glEnable,
+    glEnableClientState,
+    glEndList,
+    glGenLists,
     glMaterialfv,
     glMultMatrixf,
+    glNewList,
     glPopMatrix,
     glPushMatrix,
+    glVertexPointer,
 )
 
 import color
-from aabb import AABB
-from primitive import G_OBJ_CUBE, G_OBJ_SPHERE, make_quad
+from aabb import AABB, EPSILON
+from board_index import GridIndex
+from board_map import BoardMap, sphere_mask
+from board_state import MARKED, BoardState
+from markers import MarkerRenderer
+from picking import id_color
+from primitive import G_OBJ_CUBE, G_OBJ_SPHERE, detail_list
 from transformation import scaling, translation, rotation_y
 
 
 class Node:
-    """Base class for scene elements"""
+    """Base class for scene elements
+
+    The local matrix (translation times scaling), the world matrix (the
+    parent's world matrix times the local one) and their inverses are cached
+    and only recomputed after ``translate``, ``rotate_y`` or ``scale`` changed
+    the node or one of its ancestors. So are the world bounds used for
+    culling, which also change with the node's descendants.
+
+    Changing the color or the selection of a node is passed up to the scene
+    as well, through ``looks_changed``.
+    """
 
     def __init__(self):
+        self.parent = None
+        # the scene to tell when the bounds or the looks of this top level
+        # node change
+        self.scene = None
         self.color_index = random.randint(color.MIN_COLOR, color.MAX_COLOR)
+        # the level of detail the node is drawn at, 0 being the finest
+        self.detail = 0
         self.aabb = AABB([0.0, 0.0, 0.0], [0.5, 0.5, 0.5])
-        self.translation_matrix = numpy.identity(4)
-        self.scaling_matrix = numpy.identity(4)
+        self._translation_matrix = numpy.identity(4)
+        self._scaling_matrix = numpy.identity(4)
+        self.local_changed()
         self.selected = False
 
-    def render(self):
-        """renders the item to the screen"""
+    @property
+    def translation_matrix(self):
+        return self._translation_matrix
+
+    @translation_matrix.setter
+    def translation_matrix(self, matrix):
+        self._translation_matrix = matrix
+        self.local_changed()
+
+    @property
+    def scaling_matrix(self):
+        return self._scaling_matrix
+
+    @scaling_matrix.setter
+    def scaling_matrix(self, matrix):
+        self._scaling_matrix = matrix
+        self.local_changed()
+
+    @property
+    def color_index(self):
+        return self._color_index
+
+    @color_index.setter
+    def color_index(self, index):
+        self._color_index = index
+        self.looks_changed()
+
+    @property
+    def selected(self):
+        return self._selected
+
+    @selected.setter
+    def selected(self, selected):
+        self._selected = selected
+        self.looks_changed()
+
+    def looks_changed(self):
+        """Tell the scene that the color or selection of the node changed"""
+        if self.parent is not None:
+            self.parent.subtree_changed()
+            self.parent.looks_changed()
+        elif self.scene is not None:
+            self.scene.looks_changed(self)
+
+    def local_changed(self):
+        """Drop the cached matrices after the node's own transform changed"""
+        self._local_matrix = None
+        self._local_inverse = None
+        self._gl_matrix = None
+        self._pick_matrix = None
+        self._pick_view = None
+        self._pick_bounds = None
+        self.world_changed()
+        self.bounds_changed()
+
+    def world_changed(self):
+        """Drop the cached world matrices after an ancestor's transform changed"""
+        self._world_matrix = None
+        self._world_inverse = None
+        self._world_bounds = None
+        self._world_box = None
+        self._gl_world_matrix = None
+
+    def bounds_changed(self):
+        """Drop the cached world bounds of the node and its ancestors"""
+        self._world_bounds = None
+        if self.parent is not None:
+            self.parent.subtree_changed()
+            self.parent.bounds_changed()
+        elif self.scene is not None:
+            self.scene.bounds_changed(self)
+
+    @property
+    def local_matrix(self):
+        if self._local_matrix is None:
+            self._local_matrix = numpy.dot(self.translation_matrix, self.scaling_matrix)
+        return self._local_matrix
+
+    @property
+    def local_inverse(self):
+        if self._local_inverse is None:
+            self._local_inverse = numpy.linalg.inv(self.local_matrix)
+        return self._local_inverse
+
+    @property
+    def world_matrix(self):
+        if self._world_matrix is None:
+            if self.parent is None:
+                self._world_matrix = self.local_matrix
+            else:
+                self._world_matrix = numpy.dot(
+                    self.parent.world_matrix, self.local_matrix
+                )
+        return self._world_matrix
+
+    @property
+    def world_inverse(self):
+        if self._world_inverse is None:
+            self._world_inverse = numpy.linalg.inv(self.world_matrix)
+        return self._world_inverse
+
+    @property
+    def world_bounds(self):
+        """The (min, max) corners of the world space box around the node's
+        AABB, or None if the node has no bounds and must always be drawn"""
+        if self._world_bounds is None:
+            matrix = self.world_matrix
+            center = numpy.dot(matrix[:3, :3], self.aabb.center) + matrix[:3, 3]
+            extent = numpy.dot(numpy.abs(matrix[:3, :3]), self.aabb.size)
+            self._world_bounds = (center - extent, center + extent)
+        return self._world_bounds
+
+    @property
+    def world_box(self):
+        """The node's AABB in world space as an oriented box: its center, its
+        unit axes as rows and its half extents along them"""
+        if self._world_box is None:
+            matrix = self.world_matrix
+            lengths = numpy.linalg.norm(matrix[:3, :3], axis=0)
+            center = numpy.dot(matrix[:3, :3], self.aabb.center) + matrix[:3, 3]
+            axes = numpy.transpose(matrix[:3, :3] / lengths)
+            self._world_box = (center, axes, self.aabb.size * lengths)
+        return self._world_box
+
+    @property
+    def gl_matrix(self):
+        """The local matrix in column-major order for glMultMatrixf"""
+        if self._gl_matrix is None:
+            self._gl_matrix = numpy.ascontiguousarray(
+                numpy.transpose(self.local_matrix), numpy.float32
+            )
+        return self._gl_matrix
+
+    @property
+    def gl_world_matrix(self):
+        """The world matrix in column-major order for glMultMatrixf"""
+        if self._gl_world_matrix is None:
+            self._gl_world_matrix = numpy.ascontiguousarray(
+                numpy.transpose(self.world_matrix), numpy.float32
+            )
+        return self._gl_world_matrix
+
+    def render(self, frustum=None):
+        """renders the item to the screen. Child nodes outside of ``frustum``
+        are skipped; the node itself is tested by its parent or scene."""
         glPushMatrix()
-        glMultMatrixf(numpy.transpose(self.translation_matrix))
-        glMultMatrixf(self.scaling_matrix)
+        glMultMatrixf(self.gl_matrix)
         cur_color = color.COLORS[self.color_index]
         glColor3f(cur_color[0], cur_color[1], cur_color[2])
         if self.selected:  # emit light if the node is selected
             glMaterialfv(GL_FRONT, GL_EMISSION, [0.3, 0.3, 0.3])
 
-        self.render_self()
+        self.render_self(frustum)
         if self.selected:
             glMaterialfv(GL_FRONT, GL_EMISSION, [0.0, 0.0, 0.0])
 
         glPopMatrix()
 
-    def render_self(self):
+    def render_id(self, ids, frustum=None):
+        """Render the node for color picking: every node drawn is appended to
+        ``ids`` and drawn unlit in the ``id_color`` of its position there."""
+        glPushMatrix()
+        glMultMatrixf(self.gl_matrix)
+        self.render_id_self(ids, frustum)
+        glPopMatrix()
+
+    def render_id_self(self, ids, frustum=None):
+        ids.append(self)
+        glColor3ub(*id_color(len(ids)))
+        self.render_self(frustum)
+
+    def enqueue(self, queue, frustum=None, glowing=False):
+        """Add the node to a ``RenderQueue`` instead of rendering it.
+        ``glowing`` is whether an ancestor is selected."""
+        queue.add(
+            self.gl_world_matrix,
+            True,
+            glowing or self.selected,
+            self.color_index,
+            self.render_self,
+        )
+
+    def set_detail(self, detail):
+        self.detail = detail
+
+    def update_detail(self, lod):
+        """Choose the levels of detail of parts of an unbounded node, which
+        the scene cannot size, with a ``LevelOfDetail``"""
+
+    def render_self(self, frustum=None):
         raise NotImplementedError(
             "The Abstract Node Class doesn't define 'render_self'"
         )
@@ -76,14 +291,38 @@ class Node:
         Consume:  start, direction    the ray to check
                   mat                 the modelview matrix to transform the ray by"""
 
-        # transform the modelview matrix by the current translation
-        newmat = numpy.dot(
-            numpy.dot(mat, self.translation_matrix),
-            numpy.linalg.inv(self.scaling_matrix),
-        )
-        results = self.aabb.ray_hit(start, direction, newmat)
+        # transform the modelview matrix by the current translation, reusing
+        # the product while neither the node nor the view changed
+        if self._pick_view is None or not numpy.array_equal(self._pick_view, mat):
+            self._pick_view = numpy.array(mat)
+            self._pick_world = numpy.dot(mat, self.pick_matrix)
+        results = self.aabb.ray_hit(start, direction, self._pick_world)
         return results
 
+    @property
+    def pick_matrix(self):
+        """The matrix ``pick`` transforms by after the modelview matrix"""
+        if self._pick_matrix is None:
+            self._pick_matrix = numpy.dot(
+                self.translation_matrix, numpy.linalg.inv(self.scaling_matrix)
+            )
+        return self._pick_matrix
+
+    @property
+    def pick_bounds(self):
+        """The (min, max) corners of a box around everything ``pick`` can hit
+        for a top level node seen through a rigid view matrix"""
+        if self._pick_bounds is None:
+            # pick maps the ray by translation . inverse(scaling), which hits a
+            # box that is turned with the view and at most as large as the
+            # AABB scaled by the largest scale factor
+            scale = numpy.abs(self.scaling_matrix.diagonal()[:3]).max()
+            corner = numpy.abs(self.aabb.center) + self.aabb.size + EPSILON
+            radius = scale * math.sqrt(corner.dot(corner))
+            center = self.translation_matrix[:3, 3]
+            self._pick_bounds = (center - radius, center + radius)
+        return self._pick_bounds
+
     def select(self, select=None):
         """Toggles or sets selected state"""
         if select is not None:
@@ -97,8 +336,17 @@ class Primitive(Node):
         super().__init__()
         self.call_list = None
 
-    def render_self(self):
-        glCallList(self.call_list)
+    def render_self(self, frustum=None):
+        glCallList(detail_list(self.call_list, self.detail))
+
+    def enqueue(self, queue, frustum=None, glowing=False):
+        queue.add(
+            self.gl_world_matrix,
+            True,
+            glowing or self.selected,
+            self.color_index,
+            detail_list(self.call_list, self.detail),
+        )
 
 
 class Sphere(Primitive):
@@ -116,13 +364,104 @@ class Cube(Primitive):
 
 
 class HierarchicalNode(Node):
+    """A node drawn as its child nodes.
+
+    The children are baked into a display list once they were drawn
+    unchanged for BAKE_FRAMES frames, or at once if the node is ``static``.
+    The list is drawn in their place, without culling them, until a
+    descendant is transformed, recolored or selected.
+    """
+
+    BAKE_FRAMES = 30
+    # whether a node is being baked, when its descendants draw unbaked
+    baking = False
+
     def __init__(self):
+        self._child_nodes = []
+        self.static = False
+        self.gl_list = None
+        self.unchanged_frames = 0
         super().__init__()
-        self.child_nodes = []
 
-    def render_self(self):
+    @property
+    def child_nodes(self):
+        return self._child_nodes
+
+    @child_nodes.setter
+    def child_nodes(self, nodes):
+        self._child_nodes = nodes
+        for child in nodes:
+            child.parent = self
+            child.world_changed()
+        self.subtree_changed()
+        self.bounds_changed()
+
+    def subtree_changed(self):
+        """Drop the baked children after one of them changed"""
+        self.unchanged_frames = 0
+        if self.gl_list is not None:
+            glDeleteLists(self.gl_list, 1)
+            self.gl_list = None
+
+    def world_changed(self):
+        super().world_changed()
+        for child in self._child_nodes:
+            child.world_changed()
+
+    def set_detail(self, detail):
+        super().set_detail(detail)
+        for child in self.child_nodes:
+            child.set_detail(detail)
+        self.subtree_changed()
+
+    @property
+    def world_bounds(self):
+        """The box around the node's AABB and the bounds of its children"""
+        if self._world_bounds is None:
+            low, high = Node.world_bounds.fget(self)
+            for child in self.child_nodes:
+                bounds = child.world_bounds
+                if bounds is None:
+                    return None
+                low = numpy.minimum(low, bounds[0])
+                high = numpy.maximum(high, bounds[1])
+            self._world_bounds = (low, high)
+        return self._world_bounds
+
+    def render_self(self, frustum=None):
+        if self.gl_list is not None:
+            glCallList(self.gl_list)
+            return
+        self.unchanged_frames += 1
+        waiting = not self.static and self.unchanged_frames < self.BAKE_FRAMES
+        if waiting or HierarchicalNode.baking:
+            for child in self.child_nodes:
+                if frustum is None or frustum.visible(child):
+                    child.render(frustum)
+            return
+
+        self.gl_list = glGenLists(1)
+        glNewList(self.gl_list, GL_COMPILE_AND_EXECUTE)
+        HierarchicalNode.baking = True
+        try:
+            for child in self.child_nodes:
+                child.render()
+        finally:
+            HierarchicalNode.baking = False
+            glEndList()
+
+    def render_id_self(self, ids, frustum=None):
+        # the children are told apart instead of the node as a whole
         for child in self.child_nodes:
-            child.render()
+            if frustum is None or frustum.visible(child):
+                child.render_id(ids, frustum)
+
+    def enqueue(self, queue, frustum=None, glowing=False):
+        # the children glow with a selected parent, as they do in render
+        glowing = glowing or self.selected
+        for child in self.child_nodes:
+            if frustum is None or frustum.visible(child):
+                child.enqueue(queue, frustum, glowing)
 
 
 class SnowFigure(HierarchicalNode):
@@ -141,114 +480,214 @@ class SnowFigure(HierarchicalNode):
         for child_node in self.child_nodes:
             child_node.color_index = 10
         self.aabb = AABB([0.0, 0.0, 0.0], [0.5, 1.1, 0.5])
-
-
-class BoardCell(Node):
-    def __init__(
-        self,
-        board: "Board",
-        color: Literal["magenta", "cyan"],
-        x_start,
-        z_start,
-        size,
-        sphere: Literal["unmarked", "marked"] | None = None,
-    ):
-        super().__init__()
-        self.board = board
-        self.color = (1.0, 0.0, 1.0) if color == "magenta" else (0.0, 1.0, 1.0)
-        self.x_start = x = x_start
-        self.z_start = z = z_start
-        self.size = size
-        self.points_base = numpy.array(
-            [
-                (x + 0 * size, 0.0, z + 1 * size),
-                (x + 1 * size, 0.0, z + 1 * size),
-                (x + 1 * size, 0.0, z + 0 * size),
-                (x + 0 * size, 0.0, z + 0 * size),
-            ]
+        # the spheres never move apart
+        self.static = True
+
+
+class BoardMesh:
+    """A block of board cells drawn as a single mesh.
+
+    The block holds cells (i0 + i, j0 + j) of the board for i < width and
+    j < height, numbered ``i * height + j`` like the rows of the map are
+    transposed. Every cell is a quad with its own four vertices so that it
+    can have its own color. Which cells are close enough to the center to be
+    drawn is looked up in a grid index, and only their heights are
+    recomputed, only when the center has moved.
+    """
+
+    def __init__(self, origin, cell_size, first, shape, state=None):
+        self.first = first
+        self.shape = shape
+        i0, j0 = first
+        width, height = shape
+        i, j = numpy.meshgrid(numpy.arange(width), numpy.arange(height), indexing="ij")
+        i, j = i.reshape(-1), j.reshape(-1)
+        x = origin[0] + (i0 + i) * cell_size
+        z = origin[1] + (j0 + j) * cell_size
+
+        corners = numpy.array([(0, 1), (1, 1), (1, 0), (0, 0)]) * cell_size
+        self.vertices = numpy.zeros((len(i), 4, 3), numpy.float32)
+        self.vertices[:, :, 0] = x[:, None] + corners[:, 0]
+        self.vertices[:, :, 2] = z[:, None] + corners[:, 1]
+        self.vertices = self.vertices.reshape(-1, 3)
+        self.colors = numpy.where(
+            ((i0 + i + j0 + j) % 2 == 0)[:, None, None],
+            numpy.array([1.0, 0.0, 1.0], numpy.float32),  # magenta
+            numpy.array([0.0, 1.0, 1.0], numpy.float32),  # cyan
+        ).repeat(4, axis=1)
+        self.colors = numpy.ascontiguousarray(self.colors.reshape(-1, 3))
+        self.grid = GridIndex(
+            (origin[0] + i0 * cell_size, origin[1] + j0 * cell_size),
+            cell_size,
+            shape,
         )
-        # Center of mass when projected to the xz plane
-        self.center_of_mass = numpy.array([x + size / 2, 0.0, z + size / 2])
-        self.sphere = sphere
 
-    @property
-    def distance_to_center(self):
-        """
-        Returns the distance from the center of the board to the center of this cell
-        when projected to the xz plane
-        """
-        return numpy.linalg.norm(self.center_of_mass - self.board.center)
-
-    def render_sphere(self, point):
-        sphere = Sphere(custom_scale=0.5)
-        if self.sphere == "unmarked":
-            color_index = color.MIN_COLOR
-        elif self.sphere == "marked":
-            color_index = 8
-        sphere.color_index = color_index
-        sphere_pos = numpy.array(point)
-        sphere_pos[1] += 0.15
-        sphere.translate(*sphere_pos)
-        sphere.render()
-
-    def render_self(self):
-        glColor3f(*self.color)
-
-        # copy the base points
-        points = numpy.array(self.points_base)
-
-        # Adjust the y coordinate of the points to create a curved surface
-        for point in points:
-            point_dist_to_center = numpy.linalg.norm(point - self.board.center)
-            point[1] = -0.04 * (point_dist_to_center**2)
-
-        if point_dist_to_center <= 0.1 and self.sphere == "unmarked":
-            self.sphere = "marked"
-
-        from OpenGL.GL import glEnable, GL_LIGHTING, glDisable
+        self.state = None
+        self.sphere_index = numpy.full(len(i), -1, numpy.int64)
+        if state is not None:
+            self.set_state(state)
+
+        self.mesh_center = None
+        self.visible_cells = numpy.zeros(0, numpy.int64)
+        self.indices = numpy.zeros(0, numpy.uint32)
+
+    def set_state(self, state):
+        """Use the spheres of a ``BoardState`` for the cells of the block"""
+        self.state = state
+        self.sphere_index = state.cell_index(self.first, self.shape)
+
+    def update(self, center, radius):
+        """Recompute the visible cells and their curvature if the center moved.
+        Returns whether it did."""
+        if self.mesh_center is not None and numpy.array_equal(self.mesh_center, center):
+            return False
+        self.visible_cells = self.grid.query(center, radius)
+        self.indices = (
+            (self.visible_cells[:, None] * 4 + numpy.arange(4)).reshape(-1)
+        ).astype(numpy.uint32)
+        offsets = self.vertices[self.indices][:, [0, 2]] - center[[0, 2]]
+        self.vertices[self.indices, 1] = -0.04 * numpy.einsum(
+            "ij,ij->i", offsets, offsets
+        )
+        self.mesh_center = center.copy()
+        return True
 
-        glDisable(GL_LIGHTING)
-        make_quad(*points)
-        glEnable(GL_LIGHTING)
+    def draw(self):
+        if not len(self.indices):
+            return
+        glColorPointer(3, GL_FLOAT, 0, self.colors)
+        self.draw_cells()
 
-        if self.sphere is not None:
-            self.render_sphere(points[-1])
+    def draw_cells(self):
+        """Draw the visible cells without their colors"""
+        if not len(self.indices):
+            return
+        glVertexPointer(3, GL_FLOAT, 0, self.vertices)
+        glDrawElements(GL_QUADS, len(self.indices), GL_UNSIGNED_INT, self.indices)
 
 
 class Board(HierarchicalNode):
+    """A checkerboard of cells whose surface curves down away from ``center``.
+
+    The cells are kept in a single ``BoardMesh``.
+    """
+
+    VISIBLE_RADIUS = 8.0
+
     def __init__(
         self, board_size: tuple[int, int] = (50, 50), cell_size: float = 1.0, map=None
     ):
         super().__init__()
         self.dir_idx = 0
         self.board_size = board_size
+        self.cell_size = cell_size
         self.center = numpy.array([0.0, 0.0, 0.0])
+        self.origin = (
+            -(cell_size * board_size[0]) / 2,
+            -(cell_size * board_size[1]) / 2,
+        )
+        self.markers = MarkerRenderer()
+        self.marker_meshes = []
+        self.markers_stale = True
+        self.init_cells(map)
+        self.state.register_callback("marked", self.sphere_marked)
+        self.state.move(self.center)
+
+    def init_cells(self, map):
+        spheres = (
+            numpy.zeros(self.board_size, bool) if map is None else sphere_mask(map)
+        )
+        self.state = BoardState(numpy.argwhere(spheres), self.origin, self.cell_size)
+        self.mesh = BoardMesh(
+            self.origin, self.cell_size, (0, 0), self.board_size, self.state
+        )
 
-        for i in range(board_size[0]):
-            for j in range(board_size[1]):
-                color = "magenta" if (i + j) % 2 == 0 else "cyan"
-                x_start = (-(cell_size * board_size[0]) / 2) + i * cell_size
-                z_start = (-(cell_size * board_size[1]) / 2) + j * cell_size
-
-                if map and i > 1 and j > 1 and map[j - 1][i - 1] != 0:
-                    sphere = "unmarked"
-                else:
-                    sphere = None
+    def visible_meshes(self):
+        """The meshes with cells around the center"""
+        return [self.mesh]
+
+    def sphere_marked(self, state, reached):
+        self.markers_stale = True
+
+    def update_markers(self, meshes):
+        """Collect the markers of the visible spheres"""
+        self.markers.clear()
+        for mesh in meshes:
+            index = mesh.sphere_index[mesh.visible_cells]
+            has_sphere = index >= 0
+            corners = mesh.vertices[4 * mesh.visible_cells[has_sphere] + 3]
+            color_indices = numpy.where(
+                mesh.state.states[index[has_sphere]] == MARKED, 8, color.MIN_COLOR
+            )
+            self.markers.extend(corners, color_indices)
+        self.marker_meshes = meshes
+        self.markers_stale = False
 
-                cell = BoardCell(
-                    self, color, x_start, z_start, cell_size, sphere=sphere
-                )
-                self.child_nodes.append(cell)
+    @property
+    def world_bounds(self):
+        # the board is always around the center, so it is always drawn
+        return None
+
+    def update_meshes(self):
+        """Update the cells around the center and the markers on them"""
+        meshes = self.visible_meshes()
+        changed = [mesh.update(self.center, self.VISIBLE_RADIUS) for mesh in meshes]
+        if any(changed) or meshes != self.marker_meshes or self.markers_stale:
+            self.update_markers(meshes)
+
+    def draw_cells(self):
+        """Draw the cells in their colors, which needs lighting off"""
+        # the meshes update_meshes updated last
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        for mesh in self.marker_meshes:
+            mesh.draw()
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def update_detail(self, lod):
+        self.update_meshes()
+        markers = self.markers
+        centers = markers.positions[: markers.count] + [0.0, markers.lift, 0.0]
+        matrix = self.world_matrix
+        centers = numpy.dot(centers, matrix[:3, :3].T) + matrix[:3, 3]
+        scale = numpy.linalg.norm(matrix[:3, :3], axis=0).max()
+        radii = numpy.full(markers.count, 0.5 * markers.scale * scale)
+        markers.set_details(
+            lod.select(centers, radii, markers.details[: markers.count])
+        )
 
-    def render_self(self):
-        for child in self.child_nodes:
-            child: BoardCell
-            if child.distance_to_center < 8.0:
-                child.render()
+    def render_self(self, frustum=None):
+        self.update_meshes()
+        glDisable(GL_LIGHTING)
+        self.draw_cells()
+        glEnable(GL_LIGHTING)
+        self.markers.render()
+
+    def enqueue(self, queue, frustum=None, glowing=False):
+        # the cells are drawn unlit and the markers lit, in their own colors
+        self.update_meshes()
+        glowing = glowing or self.selected
+        queue.add(self.gl_world_matrix, False, glowing, -1, self.draw_cells)
+        queue.add(self.gl_world_matrix, True, glowing, -1, self.markers.render)
+
+    def render_id_self(self, ids, frustum=None):
+        # the cells hide what is below them but are not picked; the markers
+        # are drawn in their own colors so they are left out
+        glColor3ub(0, 0, 0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        for mesh in self.visible_meshes():
+            mesh.draw_cells()
+        glDisableClientState(GL_VERTEX_ARRAY)
 
     def translate_and_adjust_center(self, translation_vec):
         self.translate(*translation_vec)
         self.center -= translation_vec
+        # rotate_y turns the board around the world origin, which leaves the
+        # center in board coordinates, and so the grid index, unchanged
+        for mesh in self.visible_meshes():
+            mesh.grid.move(self.center, self.VISIBLE_RADIUS)
+        self.state.move(self.center)
 
     def turn_forward_direction(self, to: Literal["left", "right"]):
         if to == "left":
@@ -268,17 +707,19 @@ class Board(HierarchicalNode):
         return self.get_forward_direction() * (-1)
 
     @classmethod
-    def from_map(cls):
-        from board_config import map
+    def from_map(cls, path=None):
+        """Build the board for the map in board_config, or for the binary map
+        file at ``path`` written by ``BoardMap.save``."""
+        if path is None:
+            from board_config import map
 
-        map = [[int(c) for c in line] for line in map.split("\n")]
-        width, height = len(map[0]), len(map)
+            board_map = BoardMap.from_text(map)
+        else:
+            board_map = BoardMap.load(path)
+        width, height = board_map.width, board_map.height
 
         assert width % 2 == 1 and height % 2 == 1
 
-        for line in map:
-            assert len(line) == width
-
         # The map is for denoting spheres.
         # The number of cells is width + 1 by height + 1.
-        return cls((width + 1, height + 1), map=map)
+        return cls((width + 1, height + 1), map=board_map.unpack())
@@ -0,0 +1,84 @@
+import math
+
+import numpy
+
+from halfedge import HalfEdgeMesh
+
+
+def corner_weights(positions, triangles, weighting="area"):
+    """Return the (T, 3, 3) weighted face normal each triangle corner
+    contributes to its vertex normal.
+
+    "area" weights by triangle area and "angle" by the corner's angle.
+    """
+    p = positions[triangles]
+    cross = numpy.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    if weighting == "area":
+        return numpy.repeat(cross[:, None, :], 3, axis=1)
+    if weighting != "angle":
+        raise ValueError("unknown weighting %r" % weighting)
+    unit = cross / numpy.maximum(numpy.linalg.norm(cross, axis=1), 1e-30)[:, None]
+    a = numpy.roll(p, -1, axis=1) - p
+    b = numpy.roll(p, 1, axis=1) - p
+    angles = numpy.arctan2(
+        numpy.linalg.norm(numpy.cross(a, b), axis=2), numpy.einsum("ijk,ijk->ij", a, b)
+    )
+    return angles[:, :, None] * unit[:, None, :]
+
+
+def smooth_groups(positions, triangles, crease_angle, mesh=None):
+    """Label the triangle corners so corners share a label when they are
+    around the same vertex and connected through edges whose faces meet at
+    less than ``crease_angle`` degrees."""
+    if mesh is None:
+        mesh = HalfEdgeMesh(triangles, len(positions))
+    p = positions[triangles]
+    normals = numpy.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1), 1e-30)[:, None]
+
+    # corner h sits at the origin of half-edge h; across that edge the same
+    # vertex is the corner at next(twin(h))
+    h = numpy.flatnonzero(mesh.twin >= 0)
+    other = mesh.next[mesh.twin[h]]
+    cosine = numpy.einsum("ij,ij->i", normals[mesh.face[h]], normals[mesh.face[other]])
+    smooth = cosine >= math.cos(math.radians(crease_angle))
+    a, b = h[smooth], other[smooth]
+
+    # propagate the smallest corner index through the smooth joins
+    labels = numpy.arange(len(mesh))
+    while True:
+        low = numpy.minimum(labels[a], labels[b])
+        before = labels.copy()
+        numpy.minimum.at(labels, a, low)
+        numpy.minimum.at(labels, b, low)
+        labels = labels[labels]
+        if numpy.array_equal(labels, before):
+            return labels
+
+
+def vertex_normals(positions, triangles, weighting="area", crease_angle=None):
+    """Compute smooth vertex normals by scatter-adding weighted face normals.
+
+    Without a ``crease_angle`` there is one normal per vertex; with one,
+    vertices are split where adjacent faces meet at a sharper angle. Returns
+    the (N, 3) unit normals and the (T, 3) normal index of every corner.
+    """
+    positions = numpy.asarray(positions, numpy.float64)
+    triangles = numpy.asarray(triangles).reshape(-1, 3)
+    weights = corner_weights(positions, triangles, weighting).reshape(-1, 3)
+    if crease_angle is None:
+        groups = triangles.reshape(-1)
+        count = len(positions)
+    else:
+        labels = smooth_groups(positions, triangles, crease_angle)
+        _, groups = numpy.unique(labels, return_inverse=True)
+        groups = groups.reshape(-1)
+        count = int(groups.max()) + 1 if len(groups) else 0
+
+    normals = numpy.stack(
+        [numpy.bincount(groups, weights[:, i], minlength=count) for i in range(3)],
+        axis=1,
+    )
+    lengths = numpy.linalg.norm(normals, axis=1)
+    normals /= numpy.where(lengths > 0, lengths, 1.0)[:, None]
+    return normals, groups.reshape(-1, 3)
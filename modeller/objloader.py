@@ -4,58 +4,285 @@
 # Basic OBJ file viewer. needs objloader from:
 # http://www.pygame.org/wiki/OBJFileLoader
 
+import ctypes
+import hashlib
+import itertools
 import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy
 import pygame
 from OpenGL.GL import (
+    GL_ARRAY_BUFFER,
+    GL_ELEMENT_ARRAY_BUFFER,
+    GL_FLOAT,
+    GL_NORMAL_ARRAY,
+    GL_STATIC_DRAW,
+    GL_TEXTURE_COORD_ARRAY,
+    GL_TRIANGLES,
+    GL_UNSIGNED_INT,
+    GL_VERTEX_ARRAY,
     GL_CCW,
     GL_COMPILE,
-    GL_LINEAR,
     GL_POLYGON,
-    GL_RGBA,
     GL_TEXTURE_2D,
-    GL_TEXTURE_MAG_FILTER,
-    GL_TEXTURE_MIN_FILTER,
-    GL_UNSIGNED_BYTE,
     glBegin,
+    glBindBuffer,
     glBindTexture,
+    glBufferData,
     glCallList,
     glColor,
     glColor3f,
+    glDeleteBuffers,
     glDeleteLists,
+    glDeleteTextures,
     glDisable,
+    glDisableClientState,
+    glDrawElements,
     glEnable,
+    glEnableClientState,
     glEnd,
     glEndList,
     glFrontFace,
+    glGenBuffers,
     glGenLists,
     glGenTextures,
     glNewList,
     glNormal3fv,
+    glNormalPointer,
     glTexCoord2fv,
-    glTexImage2D,
-    glTexParameteri,
+    glTexCoordPointer,
     glVertex3fv,
+    glVertexPointer,
 )
 
+from halfedge import HalfEdgeMesh
+from normals import vertex_normals
+from simplify import load_cached, lod_chain, save_cached
+from texture import texture_cache, upload_image
+
+
+class ObjChunk:
+    """The records parsed from a run of lines of an OBJ file, as flat arrays.
+
+    ``corners`` holds the (v, vt, vn) indices of every face corner, 0 where a
+    texcoord or normal is missing, ``lengths`` the corner count of each face
+    and ``face_materials`` the index of each face's material in ``materials``,
+    or -1 for faces that use whatever material was active when the chunk
+    started. Negative (relative) indices are stored as chunk-local 1-based
+    indices minus ``_RELATIVE``. Both are resolved by
+    ``WavefrontObj.merge_chunk`` once the preceding chunks are known.
+    """
+
+    def __init__(self):
+        self.vertices = numpy.empty((0, 3))
+        self.normals = numpy.empty((0, 3))
+        self.texcoords = numpy.empty((0, 2))
+        self.corners = numpy.empty((0, 3), numpy.int64)
+        self.lengths = numpy.empty(0, numpy.int64)
+        self.face_materials = numpy.empty(0, numpy.int64)
+        self.materials = []
+        self.mtllibs = []
+        self.material = None
+        self.sets_material = False
+        self.relative = False
+
+
+# Relative indices are stored shifted by this amount, which keeps them negative
+# even when they point back into an earlier chunk.
+_RELATIVE = 1 << 62
+
+
+def _index(value, count, chunk):
+    index = int(value)
+    if index < 0:
+        chunk.relative = True
+        return count + index + 1 - _RELATIVE
+    return index
+
+
+def _array(rows, width, dtype=numpy.float64):
+    return numpy.array(rows, dtype).reshape(-1, width)
+
+
+def parse_lines(lines, swapyz=False):
+    """Parse an iterable of OBJ lines into an ``ObjChunk``."""
+    chunk = ObjChunk()
+    vertices, normals, texcoords = [], [], []
+    corners, lengths, face_materials = [], [], []
+    material = -1
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        values = line.split()
+        if not values:
+            continue
+        if values[0] == "v":
+            v = list(map(float, values[1:4]))
+            if swapyz:
+                v = v[0], v[2], v[1]
+            vertices.append(v)
+        elif values[0] == "vn":
+            v = list(map(float, values[1:4]))
+            if swapyz:
+                v = v[0], v[2], v[1]
+            normals.append(v)
+        elif values[0] == "vt":
+            texcoords.append(list(map(float, values[1:3])))
+        elif values[0] in ("usemtl", "usemat"):
+            chunk.sets_material = True
+            chunk.material = values[1]
+            material = len(chunk.materials)
+            chunk.materials.append(values[1])
+        elif values[0] == "mtllib":
+            chunk.mtllibs.append(values[1])
+        elif values[0] == "f":
+            for v in values[1:]:
+                w = v.split("/")
+                corners.append(
+                    (
+                        _index(w[0], len(vertices), chunk),
+                        (
+                            _index(w[1], len(texcoords), chunk)
+                            if len(w) >= 2 and len(w[1]) > 0
+                            else 0
+                        ),
+                        (
+                            _index(w[2], len(normals), chunk)
+                            if len(w) >= 3 and len(w[2]) > 0
+                            else 0
+                        ),
+                    )
+                )
+            lengths.append(len(values) - 1)
+            face_materials.append(material)
+    chunk.vertices = _array(vertices, 3)
+    chunk.normals = _array(normals, 3)
+    chunk.texcoords = _array(texcoords, 2)
+    chunk.corners = _array(corners, 3, numpy.int64)
+    chunk.lengths = numpy.array(lengths, numpy.int64)
+    chunk.face_materials = numpy.array(face_materials, numpy.int64)
+    return chunk
+
+
+def parse_range(filename, start, end, swapyz=False):
+    """Parse the lines of ``filename`` that begin within bytes [start, end)."""
+    with open(filename, "rb") as f:
+        if start > 0:
+            # skip the line that started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        begin = f.tell()
+        f.seek(max(end - 1, begin))
+        f.readline()
+        stop = f.tell() if end > begin else begin
+        f.seek(begin)
+        data = f.read(stop - begin)
+    return parse_lines(data.decode().splitlines(), swapyz)
+
+
+def usable_cpus():
+    """The number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def iter_parallel(filename, swapyz=False, workers=None, chunks_per_worker=4):
+    """Parse ``filename`` in a process pool, yielding its chunks in file order
+    as they become available. Without ``workers`` there is one per usable
+    CPU, and with only one the file is parsed here without a pool."""
+    workers = workers or usable_cpus()
+    if workers == 1:
+        yield parse_range(filename, 0, os.path.getsize(filename), swapyz)
+        return
+    size = os.path.getsize(filename)
+    count = max(1, workers * chunks_per_worker)
+    bounds = [size * i // count for i in range(count + 1)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(
+            parse_range,
+            [filename] * count,
+            bounds[:-1],
+            bounds[1:],
+            [swapyz] * count,
+        )
+
+
+def parse_parallel(filename, swapyz=False, workers=None, chunks_per_worker=4):
+    """Parse ``filename`` in a process pool, returning its chunks in file order."""
+    return list(iter_parallel(filename, swapyz, workers, chunks_per_worker))
+
+
+def iter_chunks(filename, swapyz=False, workers=None, lines_per_chunk=100000):
+    """Yield the chunks of ``filename`` in file order, parsing them in a
+    process pool if ``workers`` is greater than one."""
+    if workers is not None and workers > 1:
+        yield from iter_parallel(filename, swapyz, workers)
+        return
+    with open(filename, "r") as f:
+        while True:
+            lines = list(itertools.islice(f, lines_per_chunk))
+            if not lines:
+                return
+            yield parse_lines(lines, swapyz)
+
+
+def _weld(columns):
+    """Find the unique rows of equally long non-negative integer columns.
+
+    Returns the index of the first occurrence of each unique row and, for every
+    row, the index of its unique row. Columns are packed into one int64 key,
+    compacting the key to its rank whenever the next column would overflow.
+    """
+    key = numpy.zeros(len(columns[0]), numpy.int64)
+    bound = 1
+    for column in columns:
+        size = int(column.max()) + 1 if len(column) else 1
+        if bound * size >= 1 << 62:
+            _, key = numpy.unique(key, return_inverse=True)
+            key = key.reshape(-1)
+            bound = int(key.max()) + 1
+        key = key * size + column
+        bound *= size
+    _, first, inverse = numpy.unique(key, return_index=True, return_inverse=True)
+    return first, inverse.reshape(-1)
+
+
+def pack_rects(sizes, width, padding=0):
+    """Shelf-pack rectangles of the given (w, h) sizes into rows ``width`` wide.
+
+    Returns the top-left position of each rectangle and the power of two
+    height needed, or (None, 0) if a rectangle is wider than ``width``.
+    """
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if w > width:
+            return None, 0
+        if x + w > width:
+            x, y, shelf = 0, y + shelf + padding, 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf = max(shelf, h)
+    height = 1
+    while height < y + shelf:
+        height *= 2
+    return positions, height
+
 
 class WavefrontObj:
     @classmethod
-    def load_texture(cls, imagefile):
-        surf = pygame.image.load(imagefile)
-        image = pygame.image.tostring(surf, "RGBA", 1)
-        ix, iy = surf.get_rect().size
-        texid = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texid)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(
-            GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, image
-        )
-        return texid
+    def load_texture(cls, imagefile, mipmap=False):
+        """Return a shared texture for ``imagefile``. The image is decoded in
+        the background and shows up once ``texture_cache.upload_pending`` ran."""
+        return texture_cache.acquire(imagefile, mipmap)
 
     @classmethod
-    def load_material(cls, filename):
+    def load_material(cls, filename, mipmap=False):
         contents = {}
         mtl = None
         dirname = os.path.dirname(filename)
@@ -74,92 +301,672 @@ class WavefrontObj:
                 # load the texture referred to by this declaration
                 mtl[values[0]] = values[1]
                 imagefile = os.path.join(dirname, mtl["map_Kd"])
-                mtl["texture_Kd"] = cls.load_texture(imagefile)
+                mtl["map_Kd_path"] = imagefile
+                mtl["texture_Kd"] = cls.load_texture(imagefile, mipmap)
             else:
                 mtl[values[0]] = list(map(float, values[1:]))
         return contents
 
-    def __init__(self, filename, swapyz=False):
-        """Loads a Wavefront OBJ file."""
+    def __init__(
+        self,
+        filename=None,
+        swapyz=False,
+        workers=None,
+        mipmap=False,
+        crease_angle=None,
+    ):
+        """Loads a Wavefront OBJ file.
+
+        With ``workers`` greater than one the file is split at line boundaries
+        and the chunks are parsed in a process pool (see ``parse_parallel``).
+        ``mipmap`` generates mipmaps for the material textures. Files without
+        normals get smooth vertex normals, split at ``crease_angle`` degrees
+        if given. Without a filename the model starts empty, to be filled
+        with ``merge_chunk``.
+        """
         self.vertices = []
         self.normals = []
         self.texcoords = []
         self.faces = []
         self.mtl = None
         self.gl_list = 0
+        self.vbo = self.ibo = None
+        self.atlas = {}
+        self.atlas_texture = 0
+        self.vertex_data = None
+        self.lods = []
+        self.bounding_sphere = None
+        self.filename = filename
+        if filename is None:
+            return
         dirname = os.path.dirname(filename)
 
+        if workers is not None and workers > 1:
+            chunks = parse_parallel(filename, swapyz, workers)
+        else:
+            with open(filename, "r") as f:
+                chunks = [parse_lines(f, swapyz)]
+
         material = None
-        for line in open(filename, "r"):
-            if line.startswith("#"):
-                continue
-            values = line.split()
-            if not values:
+        for chunk in chunks:
+            material = self.merge_chunk(chunk, material)
+            for mtllib in chunk.mtllibs:
+                self.mtl = self.load_material(os.path.join(dirname, mtllib), mipmap)
+        self.group_by_material()
+        if self.faces and not self.normals:
+            self.generate_normals(crease_angle=crease_angle)
+
+    def merge_chunk(self, chunk, material):
+        """Append a parsed chunk, resolving the indices and the material that
+        depend on the chunks before it. Returns the material active at its end.
+        """
+        corners = chunk.corners
+        if chunk.relative:
+            offsets = numpy.array(
+                [len(self.vertices), len(self.texcoords), len(self.normals)]
+            )
+            corners = numpy.where(corners < 0, corners + (offsets + _RELATIVE), corners)
+        # the faces before the chunk's first usemtl take index -1
+        materials = numpy.array(chunk.materials + [material], object)
+        materials = materials[chunk.face_materials]
+        starts = numpy.cumsum(chunk.lengths) - chunk.lengths
+        faces = [None] * len(chunk.lengths)
+        # gather the faces with the same corner count as one (faces, n, 3) block
+        for length in numpy.unique(chunk.lengths).tolist():
+            which = numpy.flatnonzero(chunk.lengths == length)
+            block = corners[starts[which, None] + numpy.arange(length)]
+            for i, face in zip(
+                which.tolist(),
+                zip(
+                    block[:, :, 0].tolist(),
+                    block[:, :, 2].tolist(),
+                    block[:, :, 1].tolist(),
+                    materials[which].tolist(),
+                ),
+            ):
+                faces[i] = face
+        self.faces.extend(faces)
+        self.vertices.extend(chunk.vertices.tolist())
+        self.normals.extend(chunk.normals.tolist())
+        self.texcoords.extend(chunk.texcoords.tolist())
+        return chunk.material if chunk.sets_material else material
+
+    def group_by_material(self):
+        """Stable-sort the faces so each material's faces are contiguous,
+        in order of the material's first use."""
+        order = {}
+        for face in self.faces:
+            order.setdefault(face[3], len(order))
+        self.faces.sort(key=lambda face: order[face[3]])
+
+    def halfedge_mesh(self):
+        """Return the half-edge connectivity of the triangulated faces over
+        the position indices, so texture seams do not split it."""
+        triangles, _ = self.triangulate()
+        return HalfEdgeMesh(triangles[:, :, 0], len(self.vertices))
+
+    def pack_atlas(self, max_texture_size=256, atlas_size=2048):
+        """Merge the small ``map_Kd`` textures into one atlas texture.
+
+        Only textures at most ``max_texture_size`` pixels on a side whose
+        material never samples outside [0, 1] (which would need wrapping) are
+        packed. Their materials then share one texture binding, and
+        ``self.atlas`` maps each of them to the (u, v, width, height) of its
+        region, which the compile paths apply to the texture coordinates.
+        Call this before ``compile``. Vertex data and levels of detail built
+        before are dropped, to be built again with the atlas coordinates.
+        """
+        if not self.mtl:
+            return
+        outside = set()
+        for _, _, texture_coords, material in self.faces:
+            for t in texture_coords:
+                if t > 0 and not all(0.0 <= c <= 1.0 for c in self.texcoords[t - 1]):
+                    outside.add(material)
+                    break
+
+        images = {}
+        for name, mtl in self.mtl.items():
+            if "map_Kd_path" not in mtl or name in outside:
                 continue
-            if values[0] == "v":
-                v = list(map(float, values[1:4]))
-                if swapyz:
-                    v = v[0], v[2], v[1]
-                self.vertices.append(v)
-            elif values[0] == "vn":
-                v = list(map(float, values[1:4]))
-                if swapyz:
-                    v = v[0], v[2], v[1]
-                self.normals.append(v)
-            elif values[0] == "vt":
-                self.texcoords.append(list(map(float, values[1:3])))
-            elif values[0] in ("usemtl", "usemat"):
-                material = values[1]
-            elif values[0] == "mtllib":
-                self.mtl = self.load_material(os.path.join(dirname, values[1]))
-            elif values[0] == "f":
-                face = []
-                texcoords = []
-                norms = []
-                for v in values[1:]:
-                    w = v.split("/")
-                    face.append(int(w[0]))
-                    if len(w) >= 2 and len(w[1]) > 0:
-                        texcoords.append(int(w[1]))
-                    else:
-                        texcoords.append(0)
-                    if len(w) >= 3 and len(w[2]) > 0:
-                        norms.append(int(w[2]))
-                    else:
-                        norms.append(0)
-                self.faces.append((face, norms, texcoords, material))
+            surf = pygame.image.load(mtl["map_Kd_path"])
+            if max(surf.get_size()) <= max_texture_size:
+                images[name] = surf
+        if len(images) < 2:
+            return
+
+        names = list(images)
+        # every image gets a one pixel border copied from its edges and
+        # corners so that linear filtering does not bleed in its neighbours
+        positions, height = pack_rects(
+            [(w + 2, h + 2) for w, h in (images[name].get_size() for name in names)],
+            atlas_size,
+        )
+        if positions is None:
+            return
+        atlas = pygame.Surface((atlas_size, height), pygame.SRCALPHA)
+        for name, (x, y) in zip(names, positions):
+            # the corners first, then the edges and the image over them
+            for dx, dy in (
+                (0, 0),
+                (2, 0),
+                (0, 2),
+                (2, 2),
+                (0, 1),
+                (2, 1),
+                (1, 0),
+                (1, 2),
+                (1, 1),
+            ):
+                atlas.blit(images[name], (x + dx, y + dy))
+        self.atlas_texture = int(glGenTextures(1))
+        upload_image(
+            self.atlas_texture,
+            pygame.image.tostring(atlas, "RGBA", 1),
+            atlas_size,
+            height,
+        )
+
+        for name, (x, y) in zip(names, positions):
+            w, h = images[name].get_size()
+            x, y = x + 1, y + 1
+            # the atlas is uploaded bottom row first, as the textures are
+            self.atlas[name] = (
+                x / atlas_size,
+                (height - y - h) / height,
+                w / atlas_size,
+                h / height,
+            )
+            texture_cache.release(self.mtl[name]["texture_Kd"])
+            self.mtl[name]["texture_Kd"] = self.atlas_texture
+        # rebuilt with the atlas texture coordinates, along with the levels
+        self.vertex_data = None
+        self.lods = []
+
+    def atlas_texcoord(self, texcoord, material):
+        rect = self.atlas.get(material)
+        if rect is None:
+            return texcoord
+        return (rect[0] + texcoord[0] * rect[2], rect[1] + texcoord[1] * rect[3])
 
     def box(self):
         lx, ly, lz = zip(*self.vertices)
         return ((min(lx), min(ly), min(lz)), (max(lx), max(ly), max(lz)))
 
-    def compile(self):
+    def triangulate(self, return_corners=False):
+        """Fan-triangulate the polygons.
+
+        Returns a (T, 3, 3) array holding the zero-based (v, vt, vn) indices of
+        each triangle corner, with -1 for a missing texcoord or normal, and a
+        (T,) array of material names. With ``return_corners`` it also returns
+        the (T, 3) positions of the triangle corners among all face corners.
+        """
+        lengths = numpy.fromiter((len(face[0]) for face in self.faces), numpy.int64)
+        corners = numpy.empty((int(lengths.sum()), 3), numpy.int64)
+        start = 0
+        for (vertices, normals, texture_coords, _), n in zip(self.faces, lengths):
+            corners[start : start + n, 0] = vertices
+            corners[start : start + n, 1] = texture_coords
+            corners[start : start + n, 2] = normals
+            start += n
+        corners -= 1
+
+        # triangle k of a face with corners c0..cn-1 is (c0, ck+1, ck+2)
+        tri_counts = lengths - 2
+        face_of_tri = numpy.repeat(numpy.arange(len(lengths)), tri_counts)
+        first_tri = numpy.cumsum(tri_counts) - tri_counts
+        k = numpy.arange(len(face_of_tri)) - first_tri[face_of_tri]
+        base = (numpy.cumsum(lengths) - lengths)[face_of_tri]
+        tri_corners = numpy.stack([base, base + k + 1, base + k + 2], axis=1)
+
+        materials = numpy.array([face[3] for face in self.faces], dtype=object)
+        if return_corners:
+            return corners[tri_corners], materials[face_of_tri], tri_corners
+        return corners[tri_corners], materials[face_of_tri]
+
+    def generate_normals(self, weighting="area", crease_angle=None):
+        """Replace the normals with smooth vertex normals computed from the
+        faces (see ``normals.vertex_normals``), split where faces meet at more
+        than ``crease_angle`` degrees if given."""
+        triangles, _, tri_corners = self.triangulate(return_corners=True)
+        normals, indices = vertex_normals(
+            numpy.asarray(self.vertices), triangles[:, :, 0], weighting, crease_angle
+        )
+        corner_normals = numpy.zeros(int(tri_corners.max()) + 1, numpy.int64)
+        corner_normals[tri_corners.reshape(-1)] = indices.reshape(-1) + 1
+        corner_normals = corner_normals.tolist()
+
+        self.normals = normals.tolist()
+        start = 0
+        for i, (vertices, _, texture_coords, material) in enumerate(self.faces):
+            end = start + len(vertices)
+            self.faces[i] = (
+                vertices,
+                corner_normals[start:end],
+                texture_coords,
+                material,
+            )
+            start = end
+        self.vertex_data = None
+
+    def build_buffers(self):
+        """Weld unique (v, vt, vn) corners into an interleaved vertex buffer.
+
+        Sets ``vertex_data`` (N, 8) float32 rows of position, normal and
+        texcoord, ``index_data`` uint32 triangle indices into it and
+        ``draw_ranges``, a list of (material, first index, index count).
+        """
+        triangles, materials = self.triangulate()
+        corners = triangles.reshape(-1, 3)
+        names, material_ids = numpy.unique(materials.astype(str), return_inverse=True)
+        # corners of different materials are kept apart so that each
+        # material's texture coordinates can be remapped independently
+        first, inverse = _weld(
+            [
+                corners[:, 0],
+                corners[:, 1] + 1,
+                corners[:, 2] + 1,
+                numpy.repeat(material_ids.reshape(-1), 3),
+            ]
+        )
+        unique = corners[first]
+
+        self.vertex_data = numpy.zeros((len(unique), 8), numpy.float32)
+        self.vertex_data[:, 0:3] = numpy.asarray(self.vertices)[unique[:, 0]]
+        if self.normals:
+            normals = numpy.asarray(self.normals, numpy.float32)
+            has = unique[:, 2] >= 0
+            self.vertex_data[has, 3:6] = normals[unique[has, 2]]
+        if self.texcoords:
+            texcoords = numpy.asarray(self.texcoords, numpy.float32)
+            has = unique[:, 1] >= 0
+            self.vertex_data[has, 6:8] = texcoords[unique[has, 1]]
+        self.index_data = inverse.astype(numpy.uint32)
+
+        # faces are grouped by material, so this is one range per material
+        self.draw_ranges = []
+        for i, material in enumerate(materials):
+            if self.draw_ranges and self.draw_ranges[-1][0] == material:
+                self.draw_ranges[-1][2] += 3
+            else:
+                self.draw_ranges.append([material, 3 * i, 3])
+
+        for material, first, count in self.draw_ranges:
+            rect = self.atlas.get(material)
+            if rect is not None:
+                rows = numpy.unique(self.index_data[first : first + count])
+                self.vertex_data[rows, 6:8] *= rect[2:]
+                self.vertex_data[rows, 6:8] += rect[:2]
+
+    def material_state(self, material):
+        """The texture binding or color a material needs, for batching."""
+        if not self.mtl:
+            return None
+        mtl = self.mtl[material]
+        if "texture_Kd" in mtl:
+            return ("texture", mtl["texture_Kd"])
+        return ("color", tuple(mtl["Kd"]))
+
+    def apply_state(self, state):
+        if state is None:
+            return
+        if state[0] == "texture":
+            glEnable(GL_TEXTURE_2D)
+            glBindTexture(GL_TEXTURE_2D, state[1])
+        else:
+            # colored materials must not sample the last bound texture
+            glDisable(GL_TEXTURE_2D)
+            glColor(*state[1])
+
+    def compile(self, use_buffers=True):
+        """Upload the model for rendering.
+
+        Uses vertex/index buffers drawn with glDrawElements when the context
+        supports them and falls back to a display list otherwise.
+        """
+        if use_buffers and bool(glGenBuffers):
+            self.compile_buffers()
+        else:
+            self.compile_list()
+
+    def generate_lods(self, budgets=(0.5, 0.25, 0.1), cache_dir=None):
+        """Build simplified levels of detail with quadric error edge collapses.
+
+        ``budgets`` are the triangle counts of the levels after the full mesh
+        (fractions of the full count if below one). Given a ``cache_dir`` the
+        levels are cached there. Call this before ``compile``.
+        """
+        self.lods = self.build_lods(budgets, cache_dir)
+
+    def build_lods(self, budgets=(0.5, 0.25, 0.1), cache_dir=None):
+        """Return the levels of detail ``generate_lods`` sets, as (indices,
+        draw ranges) pairs, without setting them on the model."""
+        if self.vertex_data is None:
+            self.build_buffers()
+        full = self.index_data.reshape(-1, 3)
+        key = [len(self.vertex_data), len(full)] + list(budgets)
+        path = None
+        if cache_dir is not None and self.filename:
+            # named after the file and where it is, to tell same-named files apart
+            digest = hashlib.sha1(os.path.realpath(self.filename).encode()).hexdigest()
+            name = "%s.%s.lod.npz" % (os.path.basename(self.filename), digest[:12])
+            path = os.path.join(cache_dir, name)
+            key.append(os.path.getmtime(self.filename))
+        levels = load_cached(path, key) if path else None
+        if levels is None:
+            levels = lod_chain(self.vertex_data[:, 0:3], full, budgets)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                save_cached(path, key, levels)
+
+        # vertices are welded per material, so a vertex tells its range
+        vertex_range = numpy.zeros(len(self.vertex_data), numpy.int64)
+        for i, (_, first, count) in enumerate(self.draw_ranges):
+            vertex_range[self.index_data[first : first + count]] = i
+        lods = []
+        for triangles in levels:
+            counts = numpy.bincount(
+                vertex_range[triangles[:, 0]], minlength=len(self.draw_ranges)
+            )
+            firsts = numpy.cumsum(counts) - counts
+            ranges = [
+                [material, 3 * int(first), 3 * int(count)]
+                for (material, _, _), first, count in zip(
+                    self.draw_ranges, firsts, counts
+                )
+                if count
+            ]
+            lods.append((triangles.astype(numpy.uint32).reshape(-1), ranges))
+        return lods
+
+    def select_lod(self, pixel_size, triangles_per_pixel=0.5):
+        """Pick the finest level with at most ``triangles_per_pixel`` triangles
+        per pixel of a square ``pixel_size`` pixels wide on screen."""
+        budget = triangles_per_pixel * pixel_size * pixel_size
+        for level, (indices, _) in enumerate(self.lods):
+            if len(indices) // 3 <= budget:
+                return level
+        return len(self.lods) - 1
+
+    def projected_lod(self, camera, matrix, triangles_per_pixel=0.5):
+        """Pick the level of detail for drawing the model with the scene
+        ``matrix`` seen by ``camera``, by the size on screen of the sphere
+        around its box."""
+        if self.bounding_sphere is None:
+            low, high = numpy.array(self.box())
+            self.bounding_sphere = (low + high) / 2, numpy.linalg.norm(high - low) / 2
+        center, radius = self.bounding_sphere
+        center = numpy.dot(matrix[:3, :3], center) + matrix[:3, 3]
+        radius *= numpy.linalg.norm(matrix[:3, :3], axis=0).max()
+        size = camera.projected_sizes(center[None], numpy.array([radius]))[0]
+        return self.select_lod(size, triangles_per_pixel)
+
+    def compile_buffers(self):
+        if self.vertex_data is None:
+            self.build_buffers()
+        if not self.lods:
+            self.lods = [(self.index_data, self.draw_ranges)]
+        # all levels share one index buffer; adjacent ranges needing the same
+        # state (such as materials sharing the atlas texture) are drawn with
+        # one call
+        self.level_batches = []
+        offset = 0
+        for indices, ranges in self.lods:
+            batches = []
+            for material, first, count in ranges:
+                state = self.material_state(material)
+                if batches and batches[-1][0] == state:
+                    batches[-1][2] += count
+                else:
+                    batches.append([state, offset + first, count])
+            self.level_batches.append(batches)
+            offset += len(indices)
+        self.vbo, self.ibo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertex_data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(
+            GL_ELEMENT_ARRAY_BUFFER,
+            numpy.concatenate([indices for indices, _ in self.lods]),
+            GL_STATIC_DRAW,
+        )
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def compile_list(self):
         self.gl_list = glGenLists(1)
         glNewList(self.gl_list, GL_COMPILE)
         glEnable(GL_TEXTURE_2D)
         glFrontFace(GL_CCW)
         glColor3f(1.0, 1.0, 0.0)
+        current = None
         for face in self.faces:
             vertices, normals, texture_coords, material = face
-            if self.mtl:
-                mtl = self.mtl[material]
-                if "texture_Kd" in mtl:
-                    glBindTexture(GL_TEXTURE_2D, mtl["texture_Kd"])
-                else:
-                    glColor(*mtl["Kd"])
+            state = self.material_state(material)
+            if state != current:
+                self.apply_state(state)
+                current = state
             glBegin(GL_POLYGON)
             for i in range(len(vertices)):
                 if normals[i] > 0:
                     glNormal3fv(self.normals[normals[i] - 1])
                 if texture_coords[i] > 0:
-                    glTexCoord2fv(self.texcoords[texture_coords[i] - 1])
+                    glTexCoord2fv(
+                        self.atlas_texcoord(
+                            self.texcoords[texture_coords[i] - 1], material
+                        )
+                    )
                 glVertex3fv(self.vertices[vertices[i] - 1])
             glEnd()
         glDisable(GL_TEXTURE_2D)
         glEndList()
 
-    def render(self):
-        glCallList(self.gl_list)
+    def render(self, lod=0):
+        """Draw the model, using level of detail ``lod`` if it has them."""
+        texture_cache.upload_pending()
+        if self.vbo is None:
+            glCallList(self.gl_list)
+            return
+
+        stride = self.vertex_data.strides[0]
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        if self.normals:
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(12))
+        if self.texcoords:
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(2, GL_FLOAT, stride, ctypes.c_void_p(24))
+
+        glEnable(GL_TEXTURE_2D)
+        glFrontFace(GL_CCW)
+        glColor3f(1.0, 1.0, 0.0)
+        itemsize = self.index_data.itemsize
+        for state, first, count in self.level_batches[lod]:
+            self.apply_state(state)
+            glDrawElements(
+                GL_TRIANGLES, count, GL_UNSIGNED_INT, ctypes.c_void_p(first * itemsize)
+            )
+        glDisable(GL_TEXTURE_2D)
+
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
 
     def free(self):
-        glDeleteLists([self.gl_list])
+        for name, mtl in (self.mtl or {}).items():
+            if "texture_Kd" in mtl and name not in self.atlas:
+                texture_cache.release(mtl["texture_Kd"])
+        # the references are gone, so a second free must not release them again
+        self.mtl = None
+        self.atlas = {}
+        if self.atlas_texture:
+            glDeleteTextures([self.atlas_texture])
+            self.atlas_texture = 0
+        self.vertex_data = None
+        self.lods = []
+        self.free_buffers()
+
+    def free_buffers(self):
+        """Delete what ``compile`` uploaded, keeping the model to compile again."""
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = self.ibo = None
+        if self.gl_list:
+            glDeleteLists(self.gl_list, 1)
+            self.gl_list = 0
+
+
+class AsyncLoader:
+    """Loads a model on a worker thread while the GL thread keeps rendering.
+
+    The worker parses the file chunk by chunk, tracks the growing bounding box
+    and builds vertex/index arrays for each chunk's faces, then for the whole
+    model. Everything that needs GL (materials, buffer uploads) is handed to
+    the GL thread through a queue and done in ``poll``.
+    """
+
+    def __init__(
+        self,
+        filename,
+        swapyz=False,
+        workers=None,
+        mipmap=False,
+        crease_angle=None,
+        lines_per_chunk=100000,
+        lods=False,
+    ):
+        """With ``lods`` the finished model gets levels of detail once it is
+        done, which ``render`` picks from by the model's size on screen."""
+        self.filename = filename
+        self.lods = lods
+        self.lines_per_chunk = lines_per_chunk
+        self.crease_angle = crease_angle
+        self.swapyz = swapyz
+        self.workers = workers
+        self.mipmap = mipmap
+        self.messages = queue.Queue()
+        self.bounds = None
+        self.mtl = None
+        self.parts = []
+        self.model = None
+        self.thread = threading.Thread(target=self.load, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def load(self):
+        try:
+            self.load_chunks()
+        except Exception as e:
+            self.messages.put(("error", e))
+
+    def load_chunks(self):
+        model = WavefrontObj()
+        material = None
+        waiting = []  # faces that use vertices, texcoords or normals from later chunks
+        bounds = None
+        for chunk in iter_chunks(
+            self.filename, self.swapyz, self.workers, self.lines_per_chunk
+        ):
+            first_face = len(model.faces)
+            material = model.merge_chunk(chunk, material)
+            for mtllib in chunk.mtllibs:
+                path = os.path.join(os.path.dirname(self.filename), mtllib)
+                self.messages.put(("mtllib", path))
+
+            if len(chunk.vertices):
+                low = chunk.vertices.min(axis=0)
+                high = chunk.vertices.max(axis=0)
+                if bounds is not None:
+                    low = numpy.minimum(low, bounds[0])
+                    high = numpy.maximum(high, bounds[1])
+                bounds = (low, high)
+                self.messages.put(("bounds", bounds))
+
+            faces, waiting = waiting + model.faces[first_face:], []
+            ready = []
+            for face in faces:
+                if (
+                    max(face[0]) <= len(model.vertices)
+                    and max(face[1]) <= len(model.normals)
+                    and max(face[2]) <= len(model.texcoords)
+                ):
+                    ready.append(face)
+                else:
+                    waiting.append(face)
+            if ready:
+                part = WavefrontObj()
+                part.vertices = model.vertices
+                part.normals = model.normals
+                part.texcoords = model.texcoords
+                part.faces = ready
+                part.build_buffers()
+                self.messages.put(("part", part))
+
+        model.group_by_material()
+        if model.faces and not model.normals:
+            model.generate_normals(crease_angle=self.crease_angle)
+        model.build_buffers()
+        self.messages.put(("done", model))
+        # the GL thread only reads the buffers of the model it got, so the
+        # levels are built from them while it draws the full model
+        if self.lods and model.faces:
+            self.messages.put(("lods", model.build_lods()))
+
+    def poll(self, max_uploads=1):
+        """Apply queued results on the GL thread, uploading at most
+        ``max_uploads`` buffers so a frame is never held up for long."""
+        uploads = 0
+        while uploads < max_uploads:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "error":
+                raise value
+            elif kind == "bounds":
+                self.bounds = value
+            elif kind == "mtllib":
+                self.mtl = WavefrontObj.load_material(value, self.mipmap)
+            elif kind == "part":
+                value.mtl = self.mtl
+                value.compile()
+                self.parts.append(value)
+                uploads += 1
+            elif kind == "done":
+                value.mtl = self.mtl
+                value.compile()
+                for part in self.parts:
+                    part.mtl = None  # the textures belong to the model
+                    part.free()
+                self.parts = []
+                self.model = value
+                uploads += 1
+            elif kind == "lods":
+                self.model.lods = value
+                self.model.free_buffers()
+                self.model.compile()
+                uploads += 1
+
+    @property
+    def done(self):
+        return self.model is not None
+
+    def render(self, camera=None, matrix=None):
+        """Draw what is loaded so far. Given the ``camera`` and the scene
+        ``matrix`` the model is drawn with, the finished model is drawn at
+        the level of detail for its size on screen."""
+        if self.model is not None:
+            lod = 0
+            if camera is not None:
+                lod = self.model.projected_lod(camera, matrix)
+            self.model.render(lod)
+        else:
+            for part in self.parts:
+                part.render()
@@ -0,0 +1,207 @@
+import numpy
+from OpenGL.GL import (
+    GL_BLEND,
+    GL_COLOR_ATTACHMENT0,
+    GL_COLOR_BUFFER_BIT,
+    GL_CURRENT_BIT,
+    GL_DEPTH_ATTACHMENT,
+    GL_DEPTH_BUFFER_BIT,
+    GL_DEPTH_COMPONENT,
+    GL_DEPTH_COMPONENT24,
+    GL_DEPTH_TEST,
+    GL_DITHER,
+    GL_ENABLE_BIT,
+    GL_FLOAT,
+    GL_FOG,
+    GL_FRAMEBUFFER,
+    GL_FRAMEBUFFER_BINDING,
+    GL_FRAMEBUFFER_COMPLETE,
+    GL_LIGHTING,
+    GL_MODELVIEW,
+    GL_MULTISAMPLE,
+    GL_PROJECTION,
+    GL_RENDERBUFFER,
+    GL_RGBA,
+    GL_RGBA8,
+    GL_TEXTURE_2D,
+    GL_UNSIGNED_BYTE,
+    GL_VIEWPORT_BIT,
+    glBindFramebuffer,
+    glBindRenderbuffer,
+    glCheckFramebufferStatus,
+    glClear,
+    glClearColor,
+    glDeleteFramebuffers,
+    glDeleteRenderbuffers,
+    glDisable,
+    glEnable,
+    glFramebufferRenderbuffer,
+    glGenFramebuffers,
+    glGenRenderbuffers,
+    glGetIntegerv,
+    glLoadMatrixf,
+    glMatrixMode,
+    glPopAttrib,
+    glPopMatrix,
+    glPushAttrib,
+    glPushMatrix,
+    glReadPixels,
+    glRenderbufferStorage,
+    glViewport,
+)
+
+from camera import Frustum, column_major
+
+
+def id_color(index):
+    """The RGB bytes that encode the nonzero ``index`` of a drawn node"""
+    return index & 0xFF, (index >> 8) & 0xFF, (index >> 16) & 0xFF
+
+
+class ColorPicker:
+    """Picks nodes by what is actually drawn under the cursor.
+
+    The nodes are drawn into a small offscreen framebuffer of ``2 * radius + 1``
+    pixels square, with a projection that fills it with the pixels around the
+    cursor, so nodes elsewhere are culled and little is rasterized. Every
+    drawn node, down to the children of hierarchical nodes, is drawn unlit in
+    a flat color that encodes its number. The pixel under the cursor, or
+    else the nearest covered pixel, tells which node was hit; with ``depth``
+    the depth buffer is read as well, for the distance to the hit.
+
+    Only the framebuffer is used, so picking works without a window, as in a
+    headless Mesa context.
+    """
+
+    def __init__(self, radius=2, depth=True):
+        self.radius = radius
+        self.size = 2 * radius + 1
+        self.depth = depth
+        self.framebuffer = None
+        self.renderbuffers = None
+        # the pixels of the region, nearest to the cursor first
+        offsets = numpy.arange(self.size) - radius
+        dy, dx = numpy.meshgrid(offsets, offsets, indexing="ij")
+        self.order = numpy.argsort((dx**2 + dy**2).ravel(), kind="stable")
+        self.offsets = numpy.stack([dx.ravel(), dy.ravel()], axis=1)
+
+    def allocate(self):
+        self.framebuffer = glGenFramebuffers(1)
+        self.renderbuffers = glGenRenderbuffers(2)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        for renderbuffer, storage, attachment in zip(
+            self.renderbuffers,
+            (GL_RGBA8, GL_DEPTH_COMPONENT24),
+            (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT),
+        ):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, self.size, self.size)
+            glFramebufferRenderbuffer(
+                GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer
+            )
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("picking framebuffer incomplete: 0x%x" % status)
+
+    def region_projection(self, camera, x, y):
+        """The camera projection narrowed to the region around x, y"""
+        narrow = numpy.identity(4)
+        narrow[0, 0] = camera.width / self.size
+        narrow[1, 1] = camera.height / self.size
+        narrow[0, 3] = (camera.width - 2.0 * x) / self.size
+        narrow[1, 3] = (camera.height - 2.0 * y) / self.size
+        return numpy.dot(narrow, camera.projection)
+
+    def render(self, scene, camera, x, y):
+        """Draw the ids of the nodes around x, y into the picking framebuffer,
+        which is left bound, returning the drawn nodes"""
+        if self.framebuffer is None:
+            self.allocate()
+        projection = self.region_projection(camera, x, y)
+        frustum = Frustum(numpy.dot(projection, camera.view))
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glPushAttrib(
+            GL_ENABLE_BIT | GL_VIEWPORT_BIT | GL_COLOR_BUFFER_BIT | GL_CURRENT_BIT
+        )
+        # nothing may change the colors the ids are drawn in
+        for capability in (
+            GL_LIGHTING,
+            GL_DITHER,
+            GL_BLEND,
+            GL_FOG,
+            GL_TEXTURE_2D,
+            GL_MULTISAMPLE,
+        ):
+            glDisable(capability)
+        glEnable(GL_DEPTH_TEST)
+        glViewport(0, 0, self.size, self.size)
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadMatrixf(column_major(projection))
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadMatrixf(camera.gl_view)
+        ids = []
+        scene.render_ids(ids, frustum)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopAttrib()
+        return ids
+
+    def read(self):
+        """Read back the ids, and the depths if enabled, of the region"""
+        pixels = glReadPixels(0, 0, self.size, self.size, GL_RGBA, GL_UNSIGNED_BYTE)
+        pixels = numpy.frombuffer(pixels, numpy.uint8).reshape(-1, 4).astype(int)
+        ids = pixels[:, 0] | pixels[:, 1] << 8 | pixels[:, 2] << 16
+        depths = None
+        if self.depth:
+            depths = glReadPixels(
+                0, 0, self.size, self.size, GL_DEPTH_COMPONENT, GL_FLOAT
+            )
+            depths = numpy.frombuffer(depths, numpy.float32).ravel()
+        return ids, depths
+
+    def pick(self, scene, camera, x, y):
+        """Return the top level node and the node drawn at window coordinates
+        x, y, and the distance to it along ``camera.ray(x, y)``; or None,
+        None, None when there is nothing there."""
+        previous = glGetIntegerv(GL_FRAMEBUFFER_BINDING)
+        nodes = self.render(scene, camera, x, y)
+        ids, depths = self.read()
+        glBindFramebuffer(GL_FRAMEBUFFER, previous)
+        covered = self.order[ids[self.order] > 0]
+        if not len(covered):
+            return None, None, None
+        pixel = covered[0]
+        node = nodes[ids[pixel] - 1]
+        top = node
+        while top.parent is not None:
+            top = top.parent
+
+        start, direction = camera.ray(x, y)
+        if depths is not None:
+            dx, dy = self.offsets[pixel]
+            point = numpy.array(
+                [
+                    2.0 * (x + dx) / camera.width - 1.0,
+                    2.0 * (y + dy) / camera.height - 1.0,
+                    2.0 * depths[pixel] - 1.0,
+                    1.0,
+                ]
+            )
+            point = numpy.dot(camera.projection_inverse, point)
+            hit = point[:3] / point[3]
+        else:
+            # the center of the node, seen from the camera
+            hit = numpy.dot(camera.view, node.world_matrix[:, 3])[:3]
+        return top, node, float(numpy.dot(hit - start, direction))
+
+    def free(self):
+        if self.framebuffer is not None:
+            glDeleteFramebuffers(1, [self.framebuffer])
+            glDeleteRenderbuffers(2, self.renderbuffers)
+            self.framebuffer = self.renderbuffers = None
@@ -1,3 +1,4 @@
+import numpy
 from OpenGL.GL import (
     GL_COMPILE,
     GL_LINES,
@@ -17,6 +18,18 @@ G_OBJ_PLANE = 1
 G_OBJ_SPHERE = 2
 G_OBJ_CUBE = 3
 G_OBJ_DIRECTION = 4
+# the sphere at lower levels of detail
+G_OBJ_SPHERE_16 = 5
+G_OBJ_SPHERE_10 = 6
+G_OBJ_SPHERE_6 = 7
+
+# the display lists of the primitives by level of detail, finest first, and
+# the slices and stacks of the spheres; a cube is as coarse as it gets
+DETAIL_LISTS = {
+    G_OBJ_SPHERE: (G_OBJ_SPHERE, G_OBJ_SPHERE_16, G_OBJ_SPHERE_10, G_OBJ_SPHERE_6),
+    G_OBJ_CUBE: (G_OBJ_CUBE,) * 4,
+}
+SPHERE_DETAIL = (30, 16, 10, 6)
 
 
 def compile_plane():
@@ -81,41 +94,103 @@ def compile_plane():
 
 
 def compile_sphere():
-    glNewList(G_OBJ_SPHERE, GL_COMPILE)
-    quad = gluNewQuadric()
-    gluSphere(quad, 0.5, 30, 30)
-    gluDeleteQuadric(quad)
-    glEndList()
+    for call_list, slices in zip(DETAIL_LISTS[G_OBJ_SPHERE], SPHERE_DETAIL):
+        glNewList(call_list, GL_COMPILE)
+        quad = gluNewQuadric()
+        gluSphere(quad, 0.5, slices, slices)
+        gluDeleteQuadric(quad)
+        glEndList()
+
+
+def detail_list(call_list, detail):
+    """The display list drawing ``call_list`` at level of detail ``detail``"""
+    levels = DETAIL_LISTS.get(call_list)
+    return call_list if levels is None else levels[detail]
+
+
+def triangle_count(call_list):
+    """The triangles drawn by the display list of a primitive"""
+    if call_list == G_OBJ_CUBE:
+        return 12
+    # gluSphere draws fans at the poles and quad strips between them
+    slices = SPHERE_DETAIL[DETAIL_LISTS[G_OBJ_SPHERE].index(call_list)]
+    return 2 * slices * (slices - 1)
+
+
+CUBE_VERTICES = [
+    ((-0.5, -0.5, -0.5), (-0.5, -0.5, 0.5), (-0.5, 0.5, 0.5), (-0.5, 0.5, -0.5)),
+    ((-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (0.5, -0.5, -0.5)),
+    ((0.5, -0.5, -0.5), (0.5, 0.5, -0.5), (0.5, 0.5, 0.5), (0.5, -0.5, 0.5)),
+    ((-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5)),
+    ((-0.5, -0.5, 0.5), (-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5)),
+    ((-0.5, 0.5, -0.5), (-0.5, 0.5, 0.5), (0.5, 0.5, 0.5), (0.5, 0.5, -0.5)),
+]
+CUBE_NORMALS = [
+    (-1.0, 0.0, 0.0),
+    (0.0, 0.0, -1.0),
+    (1.0, 0.0, 0.0),
+    (0.0, 0.0, 1.0),
+    (0.0, -1.0, 0.0),
+    (0.0, 1.0, 0.0),
+]
 
 
 def compile_cube():
     glNewList(G_OBJ_CUBE, GL_COMPILE)
-    vertices = [
-        ((-0.5, -0.5, -0.5), (-0.5, -0.5, 0.5), (-0.5, 0.5, 0.5), (-0.5, 0.5, -0.5)),
-        ((-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (0.5, -0.5, -0.5)),
-        ((0.5, -0.5, -0.5), (0.5, 0.5, -0.5), (0.5, 0.5, 0.5), (0.5, -0.5, 0.5)),
-        ((-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5)),
-        ((-0.5, -0.5, 0.5), (-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5)),
-        ((-0.5, 0.5, -0.5), (-0.5, 0.5, 0.5), (0.5, 0.5, 0.5), (0.5, 0.5, -0.5)),
-    ]
-    normals = [
-        (-1.0, 0.0, 0.0),
-        (0.0, 0.0, -1.0),
-        (1.0, 0.0, 0.0),
-        (0.0, 0.0, 1.0),
-        (0.0, -1.0, 0.0),
-        (0.0, 1.0, 0.0),
-    ]
-
     glBegin(GL_QUADS)
     for i in range(6):
-        glNormal3f(normals[i][0], normals[i][1], normals[i][2])
+        glNormal3f(CUBE_NORMALS[i][0], CUBE_NORMALS[i][1], CUBE_NORMALS[i][2])
         for j in range(4):
-            glVertex3f(vertices[i][j][0], vertices[i][j][1], vertices[i][j][2])
+            glVertex3f(
+                CUBE_VERTICES[i][j][0], CUBE_VERTICES[i][j][1], CUBE_VERTICES[i][j][2]
+            )
     glEnd()
     glEndList()
 
 
+def cube_mesh():
+    """The cube as (V, 3) float32 vertices and normals and the (T, 3) indices
+    of its triangles"""
+    vertices = numpy.array(CUBE_VERTICES, numpy.float32).reshape(-1, 3)
+    normals = numpy.repeat(numpy.array(CUBE_NORMALS, numpy.float32), 4, axis=0)
+    quads = numpy.arange(24, dtype=numpy.uint32).reshape(6, 4)
+    return vertices, normals, quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+
+
+def sphere_mesh(radius=0.5, slices=30, stacks=30):
+    """A sphere tessellated like gluSphere, as (V, 3) float32 vertices and
+    normals and the (T, 3) indices of its triangles, counter-clockwise seen
+    from outside"""
+    rho = numpy.linspace(0.0, numpy.pi, stacks + 1)
+    theta = numpy.linspace(0.0, 2.0 * numpy.pi, slices + 1)
+    rho, theta = numpy.meshgrid(rho, theta, indexing="ij")
+    normals = numpy.stack(
+        [
+            -numpy.sin(theta) * numpy.sin(rho),
+            numpy.cos(theta) * numpy.sin(rho),
+            numpy.cos(rho),
+        ],
+        axis=-1,
+    ).reshape(-1, 3)
+    # every quad between two stacks and two slices as two triangles
+    grid = numpy.arange(len(normals)).reshape(stacks + 1, slices + 1)
+    a, b = grid[:-1, :-1], grid[1:, :-1]
+    c, d = grid[1:, 1:], grid[:-1, 1:]
+    triangles = numpy.stack([a, b, c, a, c, d], axis=2).reshape(-1, 3)
+    # drop the degenerate triangles at the poles and turn the rest outwards
+    corners = normals[triangles]
+    edges = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    area = numpy.linalg.norm(edges, axis=1)
+    inward = numpy.einsum("ij,ij->i", edges, corners.sum(axis=1)) < 0
+    triangles[inward] = triangles[inward][:, ::-1]
+    triangles = triangles[area > 1e-9].astype(numpy.uint32)
+    return (
+        (radius * normals).astype(numpy.float32),
+        normals.astype(numpy.float32),
+        triangles,
+    )
+
+
 def compile_direction():
     glNewList(G_OBJ_DIRECTION, GL_COMPILE)
 
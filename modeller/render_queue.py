@@ -0,0 +1,103 @@
+from collections import Counter
+
+import numpy
+from OpenGL.GL import (
+    GL_EMISSION,
+    GL_FRONT,
+    GL_LIGHTING,
+    glCallList,
+    glColor3f,
+    glDisable,
+    glEnable,
+    glMaterialfv,
+    glMultMatrixf,
+    glPopMatrix,
+    glPushMatrix,
+)
+
+import color
+
+# the emission of unselected nodes, and of selected ones
+EMISSION = ([0.0, 0.0, 0.0], [0.3, 0.3, 0.3])
+
+
+class RenderQueue:
+    """Draw items collected from the scene graph, drawn sorted by GL state.
+
+    An item is a world matrix, whether it is lit, whether it glows like a
+    selected node, a color index and what to draw: a display list, or a
+    function for items that draw more than one. Items are sorted by
+    lighting, then emission, then what they draw, then color, and drawn
+    changing only the state that differs from the previous item. A color
+    index of -1 marks items that set their own colors.
+
+    ``changes`` counts the state changes of the last frame by kind:
+    "lighting", "material" and "color", and "draw" for the changes of what
+    is drawn. Without ``sort`` the items are drawn in the order they were
+    added, skipping only the state that repeats, to compare with.
+    """
+
+    def __init__(self, sort=True):
+        self.sort = sort
+        self.changes = Counter()
+        self.clear()
+
+    def __len__(self):
+        return len(self.matrices)
+
+    def clear(self):
+        # numbered afresh every frame, so nothing drawn before is kept alive
+        self.draw_keys = {}  # display list or function -> sort key
+        self.matrices = []
+        self.keys = []
+        self.draws = []
+
+    def add(self, matrix, lit, glowing, color_index, draw):
+        """Queue an item with a column-major world ``matrix``"""
+        key = self.draw_keys.get(draw)
+        if key is None:
+            key = self.draw_keys[draw] = len(self.draw_keys)
+        self.matrices.append(matrix)
+        self.draws.append(draw)
+        self.keys.append((lit, glowing, key, color_index + 1))
+
+    def order(self):
+        """The items in the order to draw them"""
+        if not self.keys:
+            return []
+        keys = numpy.array(self.keys, numpy.int64)
+        return numpy.lexsort(keys.T[::-1]).tolist()
+
+    def submit(self):
+        """Draw the queued items, leaving lighting on and emission off like
+        ``Node.render`` does"""
+        self.changes = Counter()
+        order = self.order() if self.sort else range(len(self.keys))
+        state = [None, None, None, None]
+        for k in order:
+            lit, glowing, draw_key, color_key = self.keys[k]
+            if lit != state[0]:
+                (glEnable if lit else glDisable)(GL_LIGHTING)
+                self.changes["lighting"] += 1
+            if glowing != state[1]:
+                glMaterialfv(GL_FRONT, GL_EMISSION, EMISSION[glowing])
+                self.changes["material"] += 1
+            if draw_key != state[2]:
+                self.changes["draw"] += 1
+            if color_key and color_key != state[3]:
+                glColor3f(*color.COLORS[color_key - 1])
+                self.changes["color"] += 1
+            # items drawing their own colors leave the color unknown
+            state = [lit, glowing, draw_key, color_key or None]
+            glPushMatrix()
+            glMultMatrixf(self.matrices[k])
+            draw = self.draws[k]
+            if callable(draw):
+                draw()
+            else:
+                glCallList(draw)
+            glPopMatrix()
+        if state[0] is False:
+            glEnable(GL_LIGHTING)
+        if state[1]:
+            glMaterialfv(GL_FRONT, GL_EMISSION, EMISSION[False])
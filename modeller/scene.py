@@ -1,51 +1,303 @@
-import sys
 import numpy
+from aabb import ray_hits
+from bvh import BVH
+from collision import SpatialHash, obb_overlaps
 from node import Sphere, Cube, SnowFigure
 
 
 class Scene:
     # the default depth from the camera to place an object at
     PLACE_DEPTH = 15.0
+    # the number of ray and node pairs raycast tests at a time
+    RAYCAST_PAIRS = 1 << 16
+    # the cell size of the spatial hash for collisions, and how many times
+    # a blocked move is halved to find how far the node can go
+    COLLISION_CELL = 2.0
+    COLLISION_STEPS = 8
 
     def __init__(self):
         # The scene keeps a list of nodes that are displayed
         self.node_list = list()
+        # and the world bounds of the nodes for culling, with the indices of
+        # those that changed since they were last stored
+        self.node_index = dict()
+        self.bounds_low = numpy.zeros((0, 3))
+        self.bounds_high = numpy.zeros((0, 3))
+        self.unbounded = numpy.zeros(0, bool)
+        self.stale_bounds = set()
+        # a bounding volume hierarchy over the boxes picking can hit, refit
+        # with the nodes that changed since the last pick
+        self.pick_tree = None
+        self.stale_picks = set()
+        # and the oriented boxes of the nodes stacked for raycast
+        self.pick_matrices = numpy.zeros((0, 4, 4))
+        self.box_low = numpy.zeros((0, 3))
+        self.box_high = numpy.zeros((0, 3))
+        self.stale_boxes = set()
+        # and a spatial hash over the world bounds, to find what a moved node
+        # runs into
+        self.collision_hash = None
+        self.stale_collisions = set()
+        # an InstancedRenderer drawing the spheres and cubes, if used, and
+        # which nodes it draws
+        self.instancer = None
+        self.instanced = numpy.zeros(0, bool)
+        self.stale_instances = set()
+        # a RenderQueue drawing the other nodes sorted by GL state, if used
+        self.render_queue = None
+        # a LevelOfDetail choosing how finely nodes are drawn, if used, and
+        # the level of every node
+        self.lod = None
+        self.details = numpy.zeros(0, int)
         # Keep track of the currently selected node.
         # Actions may depend on whether or not something is selected
         self.selected_node = None
 
     def add_node(self, node):
         """Add a new node to the scene"""
+        self.node_index[node] = len(self.node_list)
         self.node_list.append(node)
+        node.scene = self
+        if len(self.node_list) > len(self.unbounded):
+            capacity = max(2 * len(self.unbounded), 16)
+            self.bounds_low = numpy.resize(self.bounds_low, (capacity, 3))
+            self.bounds_high = numpy.resize(self.bounds_high, (capacity, 3))
+            self.unbounded = numpy.resize(self.unbounded, capacity)
+            self.pick_matrices = numpy.resize(self.pick_matrices, (capacity, 4, 4))
+            self.box_low = numpy.resize(self.box_low, (capacity, 3))
+            self.box_high = numpy.resize(self.box_high, (capacity, 3))
+            self.instanced = numpy.resize(self.instanced, capacity)
+            self.details = numpy.resize(self.details, capacity)
+        self.instanced[self.node_index[node]] = False
+        self.details[self.node_index[node]] = node.detail
+        self.bounds_changed(node)
 
-    def render(self):
-        """Render the scene. This function simply calls the render function for each node."""
-        for node in self.node_list:
-            node.render()
+    def bounds_changed(self, node):
+        """Called by a top level node when its world bounds change"""
+        self.stale_bounds.add(self.node_index[node])
+        self.stale_picks.add(self.node_index[node])
+        self.stale_boxes.add(self.node_index[node])
+        self.stale_collisions.add(self.node_index[node])
+        self.stale_instances.add(self.node_index[node])
+
+    def looks_changed(self, node):
+        """Called by a top level node when its color or selection changes"""
+        self.stale_instances.add(self.node_index[node])
+
+    def update_bounds(self):
+        for i in self.stale_bounds:
+            bounds = self.node_list[i].world_bounds
+            self.unbounded[i] = bounds is None
+            if bounds is not None:
+                self.bounds_low[i], self.bounds_high[i] = bounds
+        self.stale_bounds.clear()
+
+    def update_pick_tree(self):
+        # rebuild once the scene doubled, as the boxes of inserted nodes
+        # make the tree slower to search than a new one
+        if self.pick_tree is None or len(self.node_list) > 2 * len(self.pick_tree):
+            bounds = [node.pick_bounds for node in self.node_list]
+            self.pick_tree = BVH([b[0] for b in bounds], [b[1] for b in bounds])
+        else:
+            for i in sorted(self.stale_picks):
+                low, high = self.node_list[i].pick_bounds
+                if i < len(self.pick_tree):
+                    self.pick_tree.update(i, low, high)
+                else:
+                    self.pick_tree.insert(low, high)
+        self.stale_picks.clear()
+
+    def update_boxes(self):
+        for i in self.stale_boxes:
+            node = self.node_list[i]
+            self.pick_matrices[i] = node.pick_matrix
+            self.box_low[i] = node.aabb.center - node.aabb.size
+            self.box_high[i] = node.aabb.center + node.aabb.size
+        self.stale_boxes.clear()
+
+    def update_collision_hash(self):
+        if self.collision_hash is None:
+            self.collision_hash = SpatialHash(self.COLLISION_CELL)
+            self.update_bounds()
+            bounded = numpy.flatnonzero(~self.unbounded[: len(self.node_list)])
+            self.collision_hash.insert_many(
+                bounded, self.bounds_low[bounded], self.bounds_high[bounded]
+            )
+            self.stale_collisions.clear()
+        for i in self.stale_collisions:
+            bounds = self.node_list[i].world_bounds
+            if bounds is None:
+                self.collision_hash.remove(i)
+            else:
+                self.collision_hash.update(i, *bounds)
+        self.stale_collisions.clear()
+
+    def overlapping(self, node):
+        """The set of other nodes whose boxes overlap the box of ``node``"""
+        bounds = node.world_bounds
+        if bounds is None:
+            return set()
+        self.update_collision_hash()
+        self.update_bounds()
+        i = self.node_index[node]
+        others = numpy.array(sorted(self.collision_hash.query(*bounds) - {i}), int)
+        # the hash only gives the nodes in the same cells; keep those whose
+        # world bounds overlap before testing their oriented boxes
+        low, high = bounds
+        near = numpy.all(
+            (self.bounds_low[others] <= high) & (self.bounds_high[others] >= low),
+            axis=1,
+        )
+        others = others[near & ~self.unbounded[others]]
+        if not len(others):
+            return set()
+        boxes = [self.node_list[j].world_box for j in others]
+        hit = obb_overlaps(
+            *node.world_box,
+            numpy.array([box[0] for box in boxes]),
+            numpy.array([box[1] for box in boxes]),
+            numpy.array([box[2] for box in boxes])
+        )
+        return {self.node_list[j] for j in others[hit]}
+
+    def render(self, frustum=None):
+        """Render the scene. This function simply calls the render function for each node.
+        Given a ``frustum``, nodes outside of it are skipped and counted in it."""
+        drawn = self.visible_indices(frustum)
+        if self.lod is not None:
+            self.update_details(drawn)
+        if self.instancer is not None:
+            # the instanced nodes are all drawn at once, culled or not
+            self.update_instances()
+            drawn = drawn[~self.instanced[drawn]]
+        if self.render_queue is None:
+            for i in drawn.tolist():
+                self.node_list[i].render(frustum)
+        else:
+            self.render_queue.clear()
+            for i in drawn.tolist():
+                self.node_list[i].enqueue(self.render_queue, frustum)
+            self.render_queue.submit()
+        if self.instancer is not None:
+            self.instancer.render()
+
+    def update_details(self, indices):
+        """Choose the levels of detail of the nodes by their size on screen,
+        from the spheres around their world bounds"""
+        self.update_bounds()
+        unbounded = self.unbounded[indices]
+        bounded = indices[~unbounded]
+        low, high = self.bounds_low[bounded], self.bounds_high[bounded]
+        radii = numpy.linalg.norm(high - low, axis=1) / 2
+        details = self.lod.select((low + high) / 2, radii, self.details[bounded])
+        changed = details != self.details[bounded]
+        for i, detail in zip(bounded[changed].tolist(), details[changed].tolist()):
+            self.node_list[i].set_detail(detail)
+        self.details[bounded] = details
+        for i in indices[unbounded].tolist():
+            self.node_list[i].update_detail(self.lod)
+
+    def update_instances(self):
+        held = [
+            i
+            for i in sorted(self.stale_instances)
+            if self.instancer.holds(self.node_list[i])
+        ]
+        self.instanced[held] = True
+        self.instancer.update([self.node_list[i] for i in held])
+        self.stale_instances.clear()
+
+    def render_ids(self, ids, frustum=None):
+        """Render the scene for color picking, see ``Node.render_id``"""
+        for node in self.visible_nodes(frustum):
+            node.render_id(ids, frustum)
+
+    def visible_nodes(self, frustum=None):
+        """The nodes at least partly inside ``frustum``, counted in it"""
+        if frustum is None:
+            return self.node_list
+        return [self.node_list[i] for i in self.visible_indices(frustum).tolist()]
+
+    def visible_indices(self, frustum=None):
+        count = len(self.node_list)
+        if frustum is None:
+            return numpy.arange(count)
+
+        self.update_bounds()
+        visible = self.unbounded[:count] | frustum.intersects(
+            self.bounds_low[:count], self.bounds_high[:count]
+        )
+        drawn = numpy.flatnonzero(visible)
+        frustum.drawn += len(drawn)
+        frustum.culled += count - len(drawn)
+        return drawn
 
     def pick(self, start, direction, mat):
         """Execute selection.
         Consume: start, direction describing a Ray
                  mat              is the inverse of the current modelview matrix for the scene
         """
+
+        # Keep track of the closest hit, only testing the nodes whose boxes
+        # in the pick tree are hit by the ray taken to scene space.
+        def hit(i):
+            hit, distance = self.node_list[i].pick(start, direction, mat)
+            return distance if hit else None
+
+        self.update_pick_tree()
+        inverse = numpy.linalg.inv(mat)
+        origin = inverse[:3, :3].dot(start) + inverse[:3, 3]
+        closest, mindist = self.pick_tree.intersect(
+            origin, inverse[:3, :3].dot(direction), hit
+        )
+        closest_node = self.node_list[closest] if closest is not None else None
+        self.select(closest_node, start, direction, mindist)
+
+    def select(self, node, start, direction, distance):
+        """Select a node hit by a ray, or nothing for None.
+        Consume: start, direction  the ray that hit the node
+                 distance          how far along the ray it was hit"""
         if self.selected_node is not None:
             self.selected_node.select(False)
             self.selected_node = None
 
-        # Keep track of the closest hit.
-        mindist = sys.maxsize
-        closest_node = None
-        for node in self.node_list:
-            hit, distance = node.pick(start, direction, mat)
-            if hit and distance < mindist:
-                mindist, closest_node = distance, node
-
         # If we hit something, keep track of it.
-        if closest_node is not None:
-            closest_node.select()
-            closest_node.depth = mindist
-            closest_node.selected_loc = start + direction * mindist
-            self.selected_node = closest_node
+        if node is not None:
+            node.select()
+            node.depth = distance
+            node.selected_loc = start + direction * distance
+            self.selected_node = node
+
+    def raycast(self, starts, directions, mat, chunk_size=None):
+        """Cast many rays at once.
+        Consume: starts, directions  (R, 3) arrays describing the rays
+                 mat                 the modelview matrix, as for pick
+                 chunk_size          the number of rays tested at a time
+        Return the closest node hit by every ray, or None, and the (R,)
+        distances to them, inf where nothing is hit."""
+        starts = numpy.asarray(starts, numpy.float64).reshape(-1, 3)
+        directions = numpy.asarray(directions, numpy.float64).reshape(-1, 3)
+        distances = numpy.full(len(starts), numpy.inf)
+        count = len(self.node_list)
+        if not count:
+            return [None] * len(starts), distances
+        self.update_boxes()
+        matrices = numpy.matmul(mat, self.pick_matrices[:count])
+        low, high = self.box_low[:count], self.box_high[:count]
+        if chunk_size is None:
+            chunk_size = max(self.RAYCAST_PAIRS // count, 1)
+        closest = numpy.full(len(starts), -1)
+        for first in range(0, len(starts), chunk_size):
+            rays = slice(first, first + chunk_size)
+            hit, distance = ray_hits(
+                starts[rays], directions[rays], matrices, low, high
+            )
+            distance[~hit] = numpy.inf
+            nearest = numpy.argmin(distance, axis=1)
+            distances[rays] = distance[numpy.arange(len(nearest)), nearest]
+            closest[rays] = numpy.where(distances[rays] < numpy.inf, nearest, -1)
+        nodes = [self.node_list[i] if i >= 0 else None for i in closest.tolist()]
+        return nodes, distances
 
     def move_selected(self, start, direction, inv_modelview):
         """Move the selected node, if there is one.
@@ -67,9 +319,26 @@ class Scene:
         pre_tran = numpy.array([translation[0], translation[1], translation[2], 0])
         translation = inv_modelview.dot(pre_tran)
 
-        # translate the node and track its location
+        # translate the node as far as it goes without running into nodes it
+        # did not overlap already, and track its location
+        overlapped = self.overlapping(node)
+        original = node.translation_matrix
+        reach = 1.0
         node.translate(translation[0], translation[1], translation[2])
-        node.selected_loc = newloc
+        if not self.overlapping(node) <= overlapped:
+            low, high = 0.0, 1.0
+            for _ in range(self.COLLISION_STEPS):
+                reach = (low + high) / 2
+                node.translation_matrix = original
+                node.translate(*(translation[:3] * reach))
+                if self.overlapping(node) <= overlapped:
+                    low = reach
+                else:
+                    high = reach
+            reach = low
+            node.translation_matrix = original
+            node.translate(*(translation[:3] * reach))
+        node.selected_loc = oldloc + (newloc - oldloc) * reach
 
     def place(self, shape, start, direction, inv_modelview):
         """Place a new node.
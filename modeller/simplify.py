@@ -0,0 +1,146 @@
+"""Quadric error mesh simplification into levels of detail.
+
+Edges are collapsed onto one of their end points (never onto a new position),
+so every simplified level only needs a new index buffer and keeps sharing the
+vertex buffer, with its normals and texture coordinates, of the full mesh.
+"""
+
+import heapq
+import os
+
+import numpy
+
+from halfedge import HalfEdgeMesh
+
+
+def face_quadrics(positions, triangles):
+    """Return the (V, 4, 4) area weighted plane quadrics of the vertices."""
+    p0, p1, p2 = (positions[triangles[:, i]] for i in range(3))
+    normals = numpy.cross(p1 - p0, p2 - p0)
+    areas = numpy.linalg.norm(normals, axis=1)
+    unit = normals / numpy.maximum(areas, 1e-12)[:, None]
+    planes = numpy.concatenate(
+        [unit, -numpy.einsum("ij,ij->i", unit, p0)[:, None]], axis=1
+    )
+    quadrics = numpy.einsum("i,ij,ik->ijk", areas / 2, planes, planes)
+    result = numpy.zeros((len(positions), 4, 4))
+    for i in range(3):
+        numpy.add.at(result, triangles[:, i], quadrics)
+    return result
+
+
+def simplify(positions, triangles, target, locked=None):
+    """Collapse edges of the lowest quadric error until at most ``target``
+    triangles are left.
+
+    positions is a (V, 3) array and triangles a (T, 3) array of indices into
+    it. Vertices flagged in the ``locked`` mask (by default the mesh boundary,
+    which includes texture seams and material borders of a welded mesh) never
+    move. Returns the remaining triangles, in their original order.
+    """
+    positions = numpy.asarray(positions, numpy.float64)
+    triangles = numpy.array(triangles, numpy.int64)
+    if len(triangles) <= target:
+        return triangles
+    mesh = HalfEdgeMesh(triangles, len(positions))
+    if locked is None:
+        locked = mesh.boundary_vertices()
+    quadrics = face_quadrics(positions, triangles)
+    homogeneous = numpy.concatenate([positions, numpy.ones((len(positions), 1))], 1)
+
+    vertex_faces = [set() for _ in range(len(positions))]
+    for t, triangle in enumerate(triangles.tolist()):
+        for v in triangle:
+            vertex_faces[v].add(t)
+    alive = numpy.ones(len(triangles), bool)
+    live_count = len(triangles)
+    version = [0] * len(positions)
+
+    def cost(u, v):
+        """The error of moving u onto v"""
+        p = homogeneous[v]
+        return float(p @ (quadrics[u] + quadrics[v]) @ p)
+
+    heap = []
+
+    def push(u, v):
+        if not locked[u]:
+            heapq.heappush(heap, (cost(u, v), u, v, version[u], version[v]))
+
+    for a, b in mesh.edges().tolist():
+        push(a, b)
+        push(b, a)
+
+    def flips(u, v):
+        """Whether moving u onto v would turn any triangle around"""
+        for t in vertex_faces[u]:
+            triangle = triangles[t]
+            if v in triangle:
+                continue
+            old = positions[triangle]
+            new = old.copy()
+            new[triangle == u] = positions[v]
+            before = numpy.cross(old[1] - old[0], old[2] - old[0])
+            after = numpy.cross(new[1] - new[0], new[2] - new[0])
+            if numpy.dot(before, after) <= 0.0:
+                return True
+        return False
+
+    while heap and live_count > target:
+        _, u, v, version_u, version_v = heapq.heappop(heap)
+        # skip entries made stale by a collapse that involved u or v
+        if version_u != version[u] or version_v != version[v]:
+            continue
+        if not vertex_faces[u] or flips(u, v):
+            continue
+
+        for t in list(vertex_faces[u]):
+            triangle = triangles[t]
+            if v in triangle:
+                alive[t] = False
+                live_count -= 1
+                for w in triangle.tolist():
+                    vertex_faces[w].discard(t)
+            else:
+                triangle[triangle == u] = v
+                vertex_faces[v].add(t)
+        vertex_faces[u] = set()
+        quadrics[v] += quadrics[u]
+        version[u] += 1
+        version[v] += 1
+
+        # only the costs of the edges at v changed
+        neighbours = {w for t in vertex_faces[v] for w in triangles[t].tolist()}
+        neighbours.discard(v)
+        for w in neighbours:
+            push(v, w)
+            push(w, v)
+
+    return triangles[alive]
+
+
+def lod_chain(positions, triangles, budgets):
+    """Simplify successively to each triangle budget (a fraction of the full
+    count if below one), returning the list of triangle arrays, full first."""
+    levels = [numpy.asarray(triangles)]
+    locked = HalfEdgeMesh(levels[0], len(positions)).boundary_vertices()
+    for budget in budgets:
+        target = int(budget * len(levels[0])) if budget < 1 else int(budget)
+        levels.append(simplify(positions, levels[-1], target, locked))
+    return levels
+
+
+def load_cached(filename, key):
+    """Load the levels saved by ``save_cached`` if they were made for ``key``."""
+    if not os.path.exists(filename):
+        return None
+    with numpy.load(filename) as data:
+        if data["key"].tolist() != list(key):
+            return None
+        return [data["level%d" % i] for i in range(len(data.files) - 1)]
+
+
+def save_cached(filename, key, levels):
+    arrays = {"level%d" % i: level for i, level in enumerate(levels)}
+    with open(filename, "wb") as f:
+        numpy.savez(f, key=numpy.array(key, numpy.float64), **arrays)
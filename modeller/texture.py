@@ -0,0 +1,126 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+from OpenGL.GL import (
+    GL_GENERATE_MIPMAP,
+    GL_LINEAR,
+    GL_LINEAR_MIPMAP_LINEAR,
+    GL_RGBA,
+    GL_TEXTURE_2D,
+    GL_TEXTURE_MAG_FILTER,
+    GL_TEXTURE_MIN_FILTER,
+    GL_TRUE,
+    GL_UNSIGNED_BYTE,
+    glBindTexture,
+    glDeleteTextures,
+    glGenerateMipmap,
+    glGenTextures,
+    glTexImage2D,
+    glTexParameteri,
+)
+
+
+def decode_image(filename):
+    """Decode an image file into bottom-row-first RGBA bytes and its size.
+    Safe to call from worker threads."""
+    surf = pygame.image.load(filename)
+    ix, iy = surf.get_rect().size
+    return pygame.image.tostring(surf, "RGBA", 1), ix, iy
+
+
+def upload_image(texid, image, ix, iy, mipmap=False):
+    """Upload decoded RGBA bytes into texture ``texid``. Must run on the GL thread."""
+    glBindTexture(GL_TEXTURE_2D, texid)
+    min_filter = GL_LINEAR_MIPMAP_LINEAR if mipmap else GL_LINEAR
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, min_filter)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    if mipmap and not bool(glGenerateMipmap):
+        glTexParameteri(GL_TEXTURE_2D, GL_GENERATE_MIPMAP, GL_TRUE)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, image)
+    if mipmap and bool(glGenerateMipmap):
+        glGenerateMipmap(GL_TEXTURE_2D)
+
+
+class CachedTexture:
+    def __init__(self, key, texid, mipmap, future):
+        self.key = key
+        self.texid = texid
+        self.mipmap = mipmap
+        self.future = future
+        self.refcount = 1
+
+
+class TextureCache:
+    """Shares GL textures between materials and models.
+
+    Textures are keyed by resolved path and modification time (and whether
+    they are mipmapped) and reference counted. ``acquire`` hands out the
+    texture name right away and decodes the image on a thread pool;
+    ``upload_pending`` later uploads the finished images and has to be called
+    on the GL thread. Textures nobody references are kept for reuse until
+    more than ``capacity`` of them pile up, then the least recently used are
+    deleted.
+    """
+
+    def __init__(self, capacity=32, workers=4):
+        self.capacity = capacity
+        self.workers = workers
+        self.pool = None
+        self.entries = OrderedDict()  # key -> CachedTexture, least recent first
+        self.by_texid = {}
+        self.pending = []
+
+    def acquire(self, filename, mipmap=False):
+        """Return the texture name for ``filename``, adding a reference."""
+        key = (os.path.realpath(filename), os.path.getmtime(filename), mipmap)
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.refcount += 1
+            self.entries.move_to_end(key)
+            return entry.texid
+
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        texid = int(glGenTextures(1))
+        entry = CachedTexture(
+            key, texid, mipmap, self.pool.submit(decode_image, key[0])
+        )
+        self.entries[key] = entry
+        self.by_texid[texid] = entry
+        self.pending.append(entry)
+        return texid
+
+    def release(self, texid):
+        """Drop a reference taken by ``acquire``. Texture names the cache does
+        not know, or that nobody references, are ignored."""
+        entry = self.by_texid.get(texid)
+        if entry is None or entry.refcount == 0:
+            return
+        entry.refcount -= 1
+        if entry.refcount == 0:
+            self.evict()
+
+    def upload_pending(self, wait=False):
+        """Upload the decoded images, waiting for unfinished ones if ``wait``."""
+        if not self.pending:
+            return
+        remaining = []
+        for entry in self.pending:
+            if wait or entry.future.done():
+                if entry.key in self.entries:
+                    upload_image(entry.texid, *entry.future.result(), entry.mipmap)
+            else:
+                remaining.append(entry)
+        self.pending = remaining
+
+    def evict(self):
+        unused = [key for key, entry in self.entries.items() if entry.refcount == 0]
+        for key in unused[: max(0, len(unused) - self.capacity)]:
+            entry = self.entries.pop(key)
+            del self.by_texid[entry.texid]
+            glDeleteTextures([entry.texid])
+
+
+texture_cache = TextureCache()
@@ -25,3 +25,15 @@ def rotation_y(angle):
     r[2, 0] = -numpy.sin(angle)
     r[2, 2] = numpy.cos(angle)
     return r
+
+
+def perspective(fov_y, aspect, near, far):
+    """The projection matrix of gluPerspective"""
+    f = 1.0 / numpy.tan(numpy.radians(fov_y) / 2)
+    p = numpy.zeros((4, 4))
+    p[0, 0] = f / aspect
+    p[1, 1] = f
+    p[2, 2] = (far + near) / (near - far)
+    p[2, 3] = 2 * far * near / (near - far)
+    p[3, 2] = -1
+    return p
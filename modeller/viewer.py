@@ -1,10 +1,13 @@
 import math
+import sys
 from typing import Literal
 
 import numpy
+from camera import Camera
+from instancing import InstancedRenderer
 from interaction import Interaction
+from lod import LevelOfDetail
 from node import Board, SnowFigure
-from numpy.linalg import inv, norm
 from OpenGL.constants import GLfloat_3, GLfloat_4
 from OpenGL.GL import (
     GL_AMBIENT_AND_DIFFUSE,
@@ -19,7 +22,6 @@ from OpenGL.GL import (
     GL_LIGHT0,
     GL_LIGHTING,
     GL_MODELVIEW,
-    GL_MODELVIEW_MATRIX,
     GL_POSITION,
     GL_PROJECTION,
     GL_SPOT_DIRECTION,
@@ -32,33 +34,29 @@ from OpenGL.GL import (
     glDisable,
     glEnable,
     glFlush,
-    glGetFloatv,
     glLightfv,
-    glLoadIdentity,
+    glLoadMatrixf,
     glMatrixMode,
-    glMultMatrixf,
     glPopMatrix,
     glPushMatrix,
-    glTranslated,
     glViewport,
 )
-from OpenGL.GLU import gluPerspective, gluUnProject
 from OpenGL.GLUT import (
     GLUT_RGB,
     GLUT_SINGLE,
-    GLUT_WINDOW_HEIGHT,
-    GLUT_WINDOW_WIDTH,
     glutCreateWindow,
     glutDisplayFunc,
-    glutGet,
     glutInit,
     glutInitDisplayMode,
     glutInitWindowSize,
     glutMainLoop,
     glutPostRedisplay,
+    glutReshapeFunc,
     glutTimerFunc,
 )
+from picking import ColorPicker
 from primitive import G_OBJ_DIRECTION, compile_primitives
+from render_queue import RenderQueue
 from scene import Scene
 
 
@@ -66,8 +64,18 @@ ANIMATION_DELAY = 10
 
 
 class Viewer:
-    def __init__(self):
-        """Initialize the viewer."""
+    def __init__(
+        self, color_picking=False, instanced=False, state_sorted=False, lod=False
+    ):
+        """Initialize the viewer. With ``color_picking`` nodes are picked by
+        what is drawn under the cursor rather than by their bounding boxes.
+        With ``instanced`` spheres and cubes are drawn by instanced draw calls.
+        With ``state_sorted`` nodes are drawn sorted by GL state. With ``lod``
+        spheres are drawn more coarsely the smaller they are on screen."""
+        self.picker = ColorPicker() if color_picking else None
+        self.instanced = instanced
+        self.state_sorted = state_sorted
+        self.lod = lod
         self.init_interface()
         self.init_opengl()
         self.init_scene()
@@ -85,11 +93,12 @@ class Viewer:
         glutCreateWindow("3D Modeller")
         glutInitDisplayMode(GLUT_SINGLE | GLUT_RGB)
         glutDisplayFunc(self.render)
+        glutReshapeFunc(self.reshape)
 
     def init_opengl(self):
         """initialize the opengl settings to render the scene"""
-        self.inverse_model_view = numpy.identity(4)
-        self.model_view = numpy.identity(4)
+        # the projection and view matrices, kept on the CPU
+        self.camera = Camera()
 
         glEnable(GL_CULL_FACE)
         glCullFace(GL_BACK)
@@ -107,6 +116,12 @@ class Viewer:
     def init_scene(self):
         """initialize the scene object and initial scene"""
         self.scene = Scene()
+        if self.instanced:
+            self.scene.instancer = InstancedRenderer()
+        if self.state_sorted:
+            self.scene.render_queue = RenderQueue()
+        if self.lod:
+            self.scene.lod = LevelOfDetail(self.camera)
         self.create_sample_scene()
 
     def create_sample_scene(self):
@@ -130,26 +145,21 @@ class Viewer:
 
     def render(self):
         """The render pass for the scene"""
-        self.init_view()
-
         glEnable(GL_LIGHTING)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         # Load the modelview matrix from the current state of the trackball
+        self.camera.look(
+            self.interaction.translation, self.interaction.trackball.matrix
+        )
         glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
-        glLoadIdentity()
-        loc = self.interaction.translation
-        glTranslated(loc[0], loc[1], loc[2])
-        glMultMatrixf(self.interaction.trackball.matrix)
-
-        # store the inverse of the current modelview.
-        current_model_view = numpy.array(glGetFloatv(GL_MODELVIEW_MATRIX))
-        self.model_view = numpy.transpose(current_model_view)
-        self.inverse_model_view = inv(numpy.transpose(current_model_view))
+        glLoadMatrixf(self.camera.gl_view)
 
         # render the scene. This will call the render function for each object in the scene
-        self.scene.render()
+        # that is in view
+        self.frustum = self.camera.frustum()
+        self.scene.render(self.frustum)
 
         # draw the grid
         glDisable(GL_LIGHTING)
@@ -160,52 +170,38 @@ class Viewer:
         # flush the buffers so that the scene can be drawn
         glFlush()
 
-    def init_view(self):
-        """initialize the projection matrix"""
-        x_size, y_size = glutGet(GLUT_WINDOW_WIDTH), glutGet(GLUT_WINDOW_HEIGHT)
-        aspect_ratio = float(x_size) / float(y_size)
-
-        # load the projection matrix. Always the same
+    def reshape(self, width, height):
+        """load the projection matrix for the new window size"""
+        self.camera.resize(width, height)
+        glViewport(0, 0, width, height)
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-
-        glViewport(0, 0, x_size, y_size)
-        gluPerspective(70, aspect_ratio, 0.1, 1000.0)
-        glTranslated(0, 0, -15)
+        glLoadMatrixf(self.camera.gl_projection)
+        glMatrixMode(GL_MODELVIEW)
 
     def get_ray(self, x, y):
         """Generate a ray beginning at the near plane, in the direction that the x, y coordinates are facing
         Consumes: x, y coordinates of mouse on screen
         Return: start, direction of the ray"""
-        self.init_view()
-
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-
-        # get two points on the line.
-        start = numpy.array(gluUnProject(x, y, 0.001))
-        end = numpy.array(gluUnProject(x, y, 0.999))
-
-        # convert those points into a ray
-        direction = end - start
-        direction = direction / norm(direction)
-
-        return (start, direction)
+        return self.camera.ray(x, y)
 
     def pick(self, x, y):
         """Execute pick of an object. Selects an object in the scene."""
         start, direction = self.get_ray(x, y)
-        self.scene.pick(start, direction, self.model_view)
+        if self.picker is None:
+            self.scene.pick(start, direction, self.camera.view)
+            return
+        node, _, distance = self.picker.pick(self.scene, self.camera, x, y)
+        self.scene.select(node, start, direction, distance)
 
     def place(self, shape, x, y):
         """Execute a placement of a new primitive into the scene."""
         start, direction = self.get_ray(x, y)
-        self.scene.place(shape, start, direction, self.inverse_model_view)
+        self.scene.place(shape, start, direction, self.camera.view_inverse)
 
     def move(self, x, y):
         """Execute a move command on the scene."""
         start, direction = self.get_ray(x, y)
-        self.scene.move_selected(start, direction, self.inverse_model_view)
+        self.scene.move_selected(start, direction, self.camera.view_inverse)
 
     def move_board_step(self):
         """Incrementally move the board to the target position."""
@@ -285,5 +281,10 @@ class Viewer:
 
 
 if __name__ == "__main__":
-    viewer = Viewer()
+    viewer = Viewer(
+        color_picking="--color-picking" in sys.argv,
+        instanced="--instanced" in sys.argv,
+        state_sorted="--state-sorted" in sys.argv,
+        lod="--lod" in sys.argv,
+    )
     viewer.main_loop()